@@ -0,0 +1,85 @@
+"""
+Host-side schedulability check of the flight software states.
+
+Runs the response-time analysis of apps/tasko/schedulability.py on every SM_CONFIGURATION state, with
+the worst-case execution times of TASK_WCET in sm_configuration.py, or the "WCET" a task has in a state.
+Measured times, for instance the "cpu" maximums of StateManager.query_state() on the flight board, can
+override the TASK_WCET ones from the command line.
+
+Reports, for every task, its worst-case blocking and response time against its period, and the CPU
+utilization of every state. Exits with status 1 when a task can miss its rate or has no worst-case
+execution time.
+
+python analyze_schedule.py -c OBDH=0.35 -c IMU=0.08
+"""
+
+import argparse
+import sys
+
+from benchmark_scheduler import FLIGHT_SOFTWARE, load_configuration, parse_costs
+
+
+def print_report(state, results, load):
+    print(f"State {state}, {load * 100:.1f}% CPU utilization")
+    print(
+        "{:<10} {:>10} {:>10} {:>12} {:>14} {:>6}".format(
+            "task", "period ms", "wcet ms", "blocking ms", "response ms", "ok"
+        )
+    )
+    for name, result in results.items():
+        response = result["response"]
+        print(
+            "{:<10} {:>10.1f} {:>10.1f} {:>12.1f} {:>14} {:>6}".format(
+                name,
+                result["period"] * 1e3,
+                result["wcet"] * 1e3,
+                result["blocking"] * 1e3,
+                "-" if response is None else "{:.1f}".format(response * 1e3),
+                "yes" if result["schedulable"] else "NO",
+            )
+        )
+
+
+if __name__ == "__main__":
+
+    # Parses command line arguments.
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-s",
+        "--state",
+        action="append",
+        default=[],
+        help="State to analyze (repeatable), all states by default",
+    )
+    parser.add_argument(
+        "-c",
+        "--wcet",
+        action="append",
+        default=[],
+        help="Worst-case execution time of a task in seconds, as NAME=SECONDS (repeatable)",
+    )
+    args = parser.parse_args()
+
+    sys.path.insert(0, FLIGHT_SOFTWARE)
+    from apps.tasko.schedulability import analyze_state, utilization
+
+    config = load_configuration()
+    wcets = load_configuration(name="TASK_WCET")
+    wcets.update(parse_costs(args.wcet))
+
+    schedulable = True
+    for state in args.state or config.keys():
+        tasks = config[state]["Tasks"]
+        try:
+            results = analyze_state(tasks, wcets)
+        except ValueError as e:
+            print(f"State {state}: {e}\n")
+            schedulable = False
+            continue
+        print_report(state, results, utilization(tasks, wcets))
+        print()
+        schedulable = schedulable and all(
+            result["schedulable"] for result in results.values()
+        )
+
+    sys.exit(0 if schedulable else 1)
@@ -0,0 +1,275 @@
+"""
+Host-side benchmark of the flight software scheduler.
+
+Runs the task set of one SM_CONFIGURATION state through the real StateManager and tasko loop on a
+simulated clock, so hours or days of mission time take seconds. Each task body only advances the
+virtual clock by its estimated execution time, so the reported numbers show how the configured
+frequencies, priorities and execution times interact before anything is flashed to a board.
+
+Reports:
+  * scheduler overhead per task switch (host wall-clock time / coroutine resumptions)
+  * invocations, missed periods, worst-case lateness and CPU budget overruns of every task
+  * with --allocations, the memory the loop keeps allocating in steady state, traced with tracemalloc
+
+python benchmark_scheduler.py -s NOMINAL -t 86400 -c IMU=0.05 -c OBDH=0.2
+"""
+
+import argparse
+import ast
+import os
+import sys
+import time
+import tracemalloc
+
+FLIGHT_SOFTWARE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "flight-software"
+)
+
+
+def load_configuration(
+    path=os.path.join(FLIGHT_SOFTWARE, "sm_configuration.py"), name="SM_CONFIGURATION"
+):
+    """
+    Reads SM_CONFIGURATION, or another literal named `name`, from sm_configuration.py without importing it.
+    Importing the module would import every task, and with them the board hardware.
+    """
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+            isinstance(target, ast.Name) and target.id == name
+            for target in node.targets
+        ):
+            return ast.literal_eval(node.value)
+    raise ValueError(f"No {name} in {path}")
+
+
+class SimulatedTask:
+    """Stands in for a flight task: each invocation takes `cost` seconds of virtual time."""
+
+    def __init__(self, name, cost, clock):
+        self.name = name
+        self.cost = cost
+        self.clock = clock
+
+    async def _run(self):
+        self.clock.advance(self.cost)
+
+
+def measure_allocations(loop, clock, settle_nanos, end_nanos):
+    """
+    Steps the loop until end_nanos with tracemalloc tracing.
+
+    The steps until settle_nanos are traced but not measured: values the loop replaces, like the counters of
+    its statistics, are then allocated under tracing on both sides of the comparison.
+    :returns {"steps", "blocks", "bytes", "step_bytes"}: the blocks and bytes allocated by the measured
+             steps that are still alive at the end, and the most memory a single step had allocated at once.
+             The host allocates every integer above 256 and the StopIteration ending each resumed await, and
+             each activation of a scheduled task creates the coroutine of its body, so step_bytes is never 0.
+    """
+    tracemalloc.start()
+    try:
+        loop.run_until(settle_nanos)
+        before = tracemalloc.take_snapshot()
+        step_bytes = 0
+        steps = 0
+        while clock.now_nanos < end_nanos:
+            start_bytes = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            steps += loop.step()
+            step_bytes = max(
+                step_bytes, tracemalloc.get_traced_memory()[1] - start_bytes
+            )
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    # Only count allocations made by the loop and the flight software, not by the tracing itself
+    filters = [tracemalloc.Filter(True, os.path.join(FLIGHT_SOFTWARE, "*"))]
+    growth = after.filter_traces(filters).compare_to(
+        before.filter_traces(filters), "lineno"
+    )
+    return {
+        "steps": steps,
+        "blocks": sum(stat.count_diff for stat in growth),
+        "bytes": sum(stat.size_diff for stat in growth),
+        "step_bytes": step_bytes,
+    }
+
+
+def run_benchmark(
+    config,
+    state,
+    duration,
+    costs,
+    default_cost,
+    timing_wheel=False,
+    edf=False,
+    allocations=False,
+):
+    """
+    Runs `state` of `config` for `duration` simulated seconds.
+
+    :param costs: {task name: execution time in seconds}, tasks not listed take default_cost.
+    :param timing_wheel: Keep sleepers in a TimingWheel instead of the default SleeperHeap.
+    :param edf: Run ready tasks earliest deadline first instead of by priority.
+    :param allocations: Trace the allocations of the last quarter of the run, once the loop is in steady state.
+    :returns (results per task name, task switches, host seconds, allocations or None)
+    """
+    sys.path.insert(0, FLIGHT_SOFTWARE)
+    import apps.tasko as tasko
+    from state_manager import StateManager
+
+    clock = tasko.use_simulated_clock()
+    loop = tasko.new_loop(
+        timing_wheel=timing_wheel,
+        policy=tasko.SCHEDULE_EDF if edf else tasko.SCHEDULE_PRIORITY,
+    )
+    try:
+        sm = StateManager()
+        sm.load(
+            config,
+            load_configuration(name="TASK_MAPPING_ID"),
+            load_configuration(name="TRANSITION_HOOKS"),
+        )
+        sm.wcets = {
+            name: costs.get(name, default_cost) for name in config[state]["Tasks"]
+        }
+        sm.tasks = {
+            name: SimulatedTask(name, costs.get(name, default_cost), clock)
+            for name in config[state]["Tasks"]
+        }
+        sm.switch_to(state)
+
+        end_nanos = clock.now_nanos + round(duration * 1000000000)
+        switches = loop.task_switches
+        start = time.perf_counter()
+        if allocations:
+            # Untraced warm-up for the first half, then settle and measure over a quarter each
+            quarter_nanos = (end_nanos - clock.now_nanos) // 4
+            loop.run_until(end_nanos - 2 * quarter_nanos)
+            allocations = measure_allocations(
+                loop, clock, end_nanos - quarter_nanos, end_nanos
+            )
+        else:
+            allocations = None
+            loop.run_until(end_nanos)
+        host_seconds = time.perf_counter() - start
+        switches = loop.task_switches - switches
+
+        return sm.query_state(), switches, host_seconds, allocations
+    finally:
+        tasko.use_real_clock()
+
+
+def print_report(state, duration, results, switches, host_seconds):
+    print(
+        f"State {state}, {duration:.0f}s simulated in {host_seconds:.2f}s on the host"
+    )
+    if switches:
+        print(
+            f"{switches} task switches, {host_seconds / switches * 1e6:.2f}us scheduler overhead per switch"
+        )
+    print(
+        "{:<10} {:>8} {:>12} {:>10} {:>14} {:>14} {:>12}".format(
+            "task",
+            "rate hz",
+            "invocations",
+            "missed",
+            "max late ms",
+            "max run ms",
+            "over budget",
+        )
+    )
+    for name, stats in results.items():
+        print(
+            "{:<10} {:>8.2f} {:>12} {:>10} {:>14.3f} {:>14.3f} {:>12}".format(
+                name,
+                stats["rate"],
+                stats["invocations"],
+                stats["missed_periods"],
+                stats["lateness"]["max"] / 1e6,
+                stats["runtime"]["max"] / 1e6,
+                stats["budget_overruns"],
+            )
+        )
+
+
+def print_allocations(allocations):
+    steps = allocations["steps"]
+    print(
+        f"{allocations['blocks']} blocks, {allocations['bytes']} bytes still allocated after {steps} traced steps"
+        f" ({allocations['blocks'] / steps:.3f} blocks per step), at most {allocations['step_bytes']} bytes at once in a step"
+    )
+
+
+def parse_costs(values):
+    costs = {}
+    for value in values:
+        name, _, seconds = value.partition("=")
+        costs[name] = float(seconds)
+    return costs
+
+
+if __name__ == "__main__":
+
+    # Parses command line arguments.
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-s",
+        "--state",
+        type=str,
+        default="NOMINAL",
+        help="State of SM_CONFIGURATION to run",
+    )
+    parser.add_argument(
+        "-t",
+        "--duration",
+        type=float,
+        default=3600,
+        help="Simulated mission time in seconds",
+    )
+    parser.add_argument(
+        "-c",
+        "--cost",
+        action="append",
+        default=[],
+        help="Execution time of a task in seconds, as NAME=SECONDS (repeatable)",
+    )
+    parser.add_argument(
+        "--default_cost",
+        type=float,
+        default=0.001,
+        help="Execution time in seconds of tasks without a --cost",
+    )
+    parser.add_argument(
+        "--timing_wheel",
+        action="store_true",
+        help="Keep sleepers in a timing wheel instead of a binary heap",
+    )
+    parser.add_argument(
+        "--edf",
+        action="store_true",
+        help="Run ready tasks earliest deadline first instead of by priority",
+    )
+    parser.add_argument(
+        "--allocations",
+        action="store_true",
+        help="Trace the allocations of the loop in steady state with tracemalloc (slow)",
+    )
+    args = parser.parse_args()
+
+    config = load_configuration()
+    results, switches, host_seconds, allocations = run_benchmark(
+        config,
+        args.state,
+        args.duration,
+        parse_costs(args.cost),
+        args.default_cost,
+        args.timing_wheel,
+        args.edf,
+        args.allocations,
+    )
+    print_report(args.state, args.duration, results, switches, host_seconds)
+    if allocations:
+        print_allocations(allocations)
@@ -350,6 +350,16 @@ class DataHandler:
         for tag_name in cls.data_process_registry:
             cls.data_process_registry[tag_name].clean_up()
 
+    @classmethod
+    def close_files(cls):
+        """
+        Close the open files of the persistent data processes. They open a new file on their next log.
+        """
+        for tag_name in cls.data_process_registry:
+            data_process = cls.data_process_registry[tag_name]
+            if data_process.persistent and data_process.status == _OPEN:
+                data_process.close()
+
     @classmethod
     def delete_all_files(cls, path="/sd"):
         try:
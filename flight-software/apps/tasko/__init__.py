@@ -1,10 +1,26 @@
-from .loop import Loop
+from .loop import Loop, SimulatedClock, use_simulated_clock, use_real_clock
+from .loop import monotonic_ns
+from .loop import OVERRUN_COALESCE, OVERRUN_SKIP, OVERRUN_CATCH_UP
+from .loop import BUDGET_REPORT, BUDGET_DEMOTE, BUDGET_CANCEL, TaskCanceledException
+from .loop import SCHEDULE_PRIORITY, SCHEDULE_EDF
+from .event import Event
+from .channel import Channel
+from .cyclic import CyclicExecutive
+from .edf import utilization
+from .trace import TraceBuffer
 
 # Enable logging by setting builtins.tasko_logging = True before importing the first time.
 #
 # import builtins
 # builtins.tasko_logging = True
 # import tasko
+#
+# Likewise, builtins.tasko_timing_wheel = True keeps sleepers in a TimingWheel instead of a SleeperHeap,
+# and builtins.tasko_policy = "EDF" runs ready tasks earliest deadline first.
+#
+# Logging prints every step and slows the loop down enough to hide timing problems. builtins.tasko_trace = 2048
+# records the last 2048 task switches, sleeps, wake-ups and resource acquisitions in a binary ring buffer
+# instead, get_loop().trace.save("/sd/tasko_trace.bin") writes them out. See tasko.trace.
 
 __global_event_loop = None
 
@@ -16,20 +32,106 @@ except NameError:
     # Set False by default to skip debug logging
     tasko_logging = False
 
+try:
+    global tasko_timing_wheel
+    if tasko_timing_wheel:
+        print("Using the tasko timing wheel")
+except NameError:
+    tasko_timing_wheel = False
 
-def get_loop(debug=tasko_logging):
-    """Returns the singleton event loop"""
-    global __global_event_loop
+try:
+    global tasko_policy
+    print("Using the tasko {} scheduling policy".format(tasko_policy))
+except NameError:
+    tasko_policy = SCHEDULE_PRIORITY
+
+try:
+    global tasko_trace
+    if tasko_trace:
+        print("Tracing the last {} tasko events".format(tasko_trace))
+except NameError:
+    tasko_trace = 0
+
+
+def get_loop(debug=None, timing_wheel=None, policy=None, trace=None):
+    """
+    Returns the singleton event loop
+
+    The loop is created when tasko is first imported, from the builtins above. An argument that doesn't match
+    the loop raises ValueError rather than being ignored, new_loop() replaces the loop with another setup.
+    :param timing_wheel: Keep sleepers in a hierarchical TimingWheel instead of a binary heap.
+    :param policy: SCHEDULE_PRIORITY or SCHEDULE_EDF, see Loop.
+    :param trace: Number of events the loop's TraceBuffer keeps, 0 to not trace.
+    """
     if __global_event_loop is None:
-        __global_event_loop = Loop(debug=debug)
-    return __global_event_loop
+        return new_loop(debug, timing_wheel, policy, trace)
+    loop = __global_event_loop
+    if debug is not None and debug != loop.debug:
+        raise ValueError("The tasko loop has debug={}".format(loop.debug))
+    if timing_wheel is not None:
+        from .timing_wheel import TimingWheel
+
+        if timing_wheel != isinstance(loop._sleeping, TimingWheel):
+            raise ValueError(
+                "The tasko loop has timing_wheel={}".format(not timing_wheel)
+            )
+    if policy is not None and policy != loop.policy:
+        raise ValueError("The tasko loop has the {} policy".format(loop.policy))
+    if trace is not None:
+        capacity = 0 if loop.trace is None else loop.trace.capacity
+        if trace != capacity:
+            raise ValueError("The tasko loop has trace={}".format(capacity))
+    return loop
+
+
+def new_loop(debug=None, timing_wheel=None, policy=None, trace=None):
+    """
+    Replaces the singleton event loop and returns the new one, with the arguments of get_loop. Those left
+    to None take the builtins above.
+
+    The module functions (tasko.schedule, tasko.sleep, ...) use the new loop from then on. Whatever was
+    added to the previous loop stays there: call this before scheduling anything, or creating a
+    ManagedResource, ManagedSpi or Event without a loop.
+    """
+    global __global_event_loop
+    global add_task, run_later, schedule, schedule_later, sleep, suspend, stats
+    global set_budget_handler, run, run_until, run_for, step
+
+    if debug is None:
+        debug = tasko_logging
+    if timing_wheel is None:
+        timing_wheel = tasko_timing_wheel
+    if policy is None:
+        policy = tasko_policy
+    if trace is None:
+        trace = tasko_trace
+    sleepers = None
+    if timing_wheel:
+        from .timing_wheel import TimingWheel
+
+        sleepers = TimingWheel()
+    trace_buffer = None
+    if trace:
+        from .trace import TraceBuffer
+
+        trace_buffer = TraceBuffer(trace)
+    loop = Loop(debug=debug, sleepers=sleepers, policy=policy, trace=trace_buffer)
+    __global_event_loop = loop
+
+    add_task = loop.add_task
+    run_later = loop.run_later
+    schedule = loop.schedule
+    schedule_later = loop.schedule_later
+    sleep = loop.sleep
+    suspend = loop.suspend
+    stats = loop.stats
+    set_budget_handler = loop.set_budget_handler
 
+    run = loop.run
+    run_until = loop.run_until
+    run_for = loop.run_for
+    step = loop.step
+    return loop
 
-add_task = get_loop().add_task
-run_later = get_loop().run_later
-schedule = get_loop().schedule
-schedule_later = get_loop().schedule_later
-sleep = get_loop().sleep
-suspend = get_loop().suspend
 
-run = get_loop().run
+new_loop()
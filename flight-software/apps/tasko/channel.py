@@ -0,0 +1,111 @@
+from .event import Event
+
+
+class Channel:
+    """
+    Bounded FIFO for handing data from producer tasks to consumer tasks.
+
+    The ring buffer is allocated once. A producer awaiting put() on a full channel is suspended until
+    a consumer makes room (backpressure); put_nowait() drops the item instead, for producers that must
+    never block, like sensor sampling. high_water and drops help sizing the capacity.
+
+    usage:
+      samples = Channel(32)
+
+      async def sample():
+          samples.put_nowait(read_sensor())
+
+      async def store():
+          while len(samples):
+              log(await samples.get())
+    """
+
+    def __init__(self, capacity, loop=None):
+        """
+        :param capacity: Most items held at once.
+        """
+        assert capacity > 0, "capacity must be positive"
+        self._buffer = [None] * capacity
+        self._head = 0
+        self._count = 0
+        self._not_empty = Event(loop=loop)
+        self._not_full = Event(loop=loop)
+        # Most items ever held at once
+        self.high_water = 0
+        # Items rejected because the channel was full
+        self.drops = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def capacity(self):
+        return len(self._buffer)
+
+    def full(self):
+        return self._count == len(self._buffer)
+
+    def put_nowait(self, item):
+        """
+        Adds an item if there is room.
+
+        :returns False, counting a drop, if the channel was full.
+        """
+        capacity = len(self._buffer)
+        if self._count == capacity:
+            self.drops += 1
+            return False
+        self._buffer[(self._head + self._count) % capacity] = item
+        self._count += 1
+        if self._count > self.high_water:
+            self.high_water = self._count
+        self._not_empty.set()
+        return True
+
+    async def put(self, item, timeout=None):
+        """
+        Adds an item, waiting for room if the channel is full.
+
+        :param timeout: Seconds to wait for room at most, None to wait forever.
+        :returns False, counting a drop, if there was still no room after timeout.
+        """
+        while self.full():
+            self._not_full.clear()
+            if not await self._not_full.wait(timeout):
+                self.drops += 1
+                return False
+        return self.put_nowait(item)
+
+    def get_nowait(self):
+        """Removes and returns the oldest item, raises IndexError if the channel is empty"""
+        if self._count == 0:
+            raise IndexError("Channel is empty")
+        item = self._buffer[self._head]
+        # Don't keep a reference to items that were handed out
+        self._buffer[self._head] = None
+        self._head = (self._head + 1) % len(self._buffer)
+        self._count -= 1
+        self._not_full.set()
+        return item
+
+    async def get(self):
+        """Removes and returns the oldest item, waiting for one if the channel is empty"""
+        while self._count == 0:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        return self.get_nowait()
+
+    def stats(self):
+        return {
+            "capacity": len(self._buffer),
+            "length": self._count,
+            "high_water": self.high_water,
+            "drops": self.drops,
+        }
+
+    def __repr__(self):
+        return "{{Channel {}/{}, high water: {}, drops: {}}}".format(
+            self._count, len(self._buffer), self.high_water, self.drops
+        )
+
+    __str__ = __repr__
@@ -0,0 +1,205 @@
+from . import loop as _loop
+from .stats import TimingStats
+
+# Frequencies are rounded to this many steps per hertz before computing the frames
+FREQUENCY_STEPS_PER_HZ = 1000
+# Refuse task sets whose frequencies only line up after this many minor frames
+MAX_MINOR_FRAMES = 256
+
+
+def _gcd(a, b):
+    while b:
+        a, b = b, a % b
+    return a
+
+
+class CyclicTask:
+    """One task of a CyclicExecutive, it runs on every stride-th minor frame"""
+
+    def __init__(self, hz, coroutine_function, priority, later, args, kwargs):
+        steps = round(hz * FREQUENCY_STEPS_PER_HZ)
+        if steps <= 0:
+            raise ValueError(
+                "Cyclic tasks need a frequency of at least {}hz".format(
+                    1 / FREQUENCY_STEPS_PER_HZ
+                )
+            )
+        self._steps = steps
+        self._forward_async_fn = coroutine_function
+        self._forward_args = args
+        self._forward_kwargs = kwargs
+        self._priority = priority
+        self._later = later
+        self._skip = later
+        self._stop = False
+        self.stride = 1
+        # Timing statistics, see query_state()
+        self.runtime = TimingStats()
+        self.lateness = TimingStats()
+
+    def stop(self):
+        ### Leave this task out of the following frames ###
+        self._stop = True
+
+    cancel = stop
+
+    def query_state(self):
+        """Returns the rate and timing statistics of this task"""
+        return {
+            "rate": self._steps / FREQUENCY_STEPS_PER_HZ,
+            "stride": self.stride,
+            "invocations": self.runtime.count,
+            "runtime": self.runtime.as_dict(),
+            "lateness": self.lateness.as_dict(),
+        }
+
+    def __repr__(self):
+        return "{{CyclicTask rate: {}hz, stride: {}, fn: {}}}".format(
+            self._steps / FREQUENCY_STEPS_PER_HZ, self.stride, self._forward_async_fn
+        )
+
+    __str__ = __repr__
+
+
+class CyclicExecutive:
+    """
+    Static scheduler dispatching a precomputed table of minor frames.
+
+    start() compiles the frequencies of the added tasks into frames. The minor frame rate is the least common
+    multiple of the task frequencies and the major frame rate their greatest common divisor, so every task runs
+    on a fixed subset of the minor frames and the table repeats every major frame. Each frame lists its tasks
+    in priority order ahead of time.
+
+    The executive is one tasko task. It runs the tasks of a frame one after the other, then sleeps until the
+    next minor frame boundary, so dispatching costs the same whatever the number of tasks and nothing is sorted
+    at runtime. A frame running into the following ones skips them to keep the frame phase.
+    """
+
+    def __init__(self, loop, priority=0):
+        self._loop = loop
+        self._priority = priority
+        self._entries = []
+        self._frames = ()
+        self._nanoseconds_per_frame = 0
+        self._stop = False
+        self._task = None
+        self.major_frames = 0
+        self.frame_overruns = 0
+        self.skipped_frames = 0
+
+    def add(self, hz, coroutine_function, priority, *args, later=False, **kwargs):
+        """
+        Add a task to the table, before start().
+
+        :param later: Skip the first activation, like Loop.schedule_later.
+        :returns: The CyclicTask, to stop it or query its statistics.
+        """
+        if self._task is not None:
+            raise RuntimeError("Cannot add tasks to a running CyclicExecutive")
+        entry = CyclicTask(hz, coroutine_function, priority, later, args, kwargs)
+        self._entries.append(entry)
+        return entry
+
+    def compile(self):
+        """Build the frame table, returns the number of minor frames per major frame"""
+        if not self._entries:
+            raise ValueError("A CyclicExecutive needs at least one task")
+        minor_steps = self._entries[0]._steps
+        major_steps = minor_steps
+        for entry in self._entries:
+            minor_steps = minor_steps * entry._steps // _gcd(minor_steps, entry._steps)
+            major_steps = _gcd(major_steps, entry._steps)
+        frame_count = minor_steps // major_steps
+        if frame_count > MAX_MINOR_FRAMES:
+            raise ValueError(
+                "Task frequencies need {} minor frames, more than {}".format(
+                    frame_count, MAX_MINOR_FRAMES
+                )
+            )
+
+        ordered = sorted(self._entries, key=lambda entry: entry._priority)
+        for entry in ordered:
+            entry.stride = minor_steps // entry._steps
+            entry._skip = entry._later
+        self._frames = tuple(
+            tuple(entry for entry in ordered if frame % entry.stride == 0)
+            for frame in range(frame_count)
+        )
+        self._nanoseconds_per_frame = round(
+            FREQUENCY_STEPS_PER_HZ * 1000000000 / minor_steps
+        )
+        return frame_count
+
+    def start(self):
+        ### Compile the frames and add the executive to the loop ###
+        if self._task is None:
+            self.compile()
+            self._stop = False
+            self._task = self._loop.add_task(self._run(), self._priority)
+            self._task.owner = self
+
+    def stop(self):
+        ### Stop after the current frame ###
+        self._stop = True
+
+    def cancel(self):
+        ### Stop now, throwing TaskCanceledException into the running task, see Loop.cancel ###
+        self._stop = True
+        if self._task is not None:
+            self._loop.cancel(self._task)
+
+    def query_state(self):
+        """Returns the frame layout and the overrun counters"""
+        return {
+            "minor_frame": self._nanoseconds_per_frame / 1000000000,
+            "minor_frames": len(self._frames),
+            "major_frames": self.major_frames,
+            "frame_overruns": self.frame_overruns,
+            "skipped_frames": self.skipped_frames,
+        }
+
+    async def _run(self):
+        frames = self._frames
+        frame_count = len(frames)
+        frame = 0
+        target_run_nanos = _loop._monotonic_ns()
+        try:
+            while not self._stop:
+                for entry in frames[frame]:
+                    if entry._stop:
+                        continue
+                    if entry._skip:
+                        entry._skip = False
+                        continue
+                    start_nanos = _loop._monotonic_ns()
+                    entry.lateness.record(start_nanos - target_run_nanos)
+                    await entry._forward_async_fn(
+                        *entry._forward_args, **entry._forward_kwargs
+                    )
+                    entry.runtime.record(_loop._monotonic_ns() - start_nanos)
+
+                frame += 1
+                target_run_nanos += self._nanoseconds_per_frame
+                now_nanos = _loop._monotonic_ns()
+                if now_nanos > target_run_nanos:
+                    # The frame ran into the next ones, drop them to keep the phase
+                    behind = 1 + (
+                        (now_nanos - target_run_nanos) // self._nanoseconds_per_frame
+                    )
+                    self.frame_overruns += 1
+                    self.skipped_frames += behind
+                    frame += behind
+                    target_run_nanos += behind * self._nanoseconds_per_frame
+                if frame >= frame_count:
+                    self.major_frames += frame // frame_count
+                    frame %= frame_count
+                await self._loop._sleep_until_nanos(target_run_nanos)
+        finally:
+            self._task = None
+
+    def __repr__(self):
+        return "{{CyclicExecutive {} tasks, {} minor frames of {}s}}".format(
+            len(self._entries), len(self._frames), self._nanoseconds_per_frame / 1e9
+        )
+
+    __str__ = __repr__
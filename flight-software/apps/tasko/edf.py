@@ -0,0 +1,100 @@
+def _runs_before(a, b):
+    if a.deadline_nanos != b.deadline_nanos:
+        return a.deadline_nanos < b.deadline_nanos
+    if a.priority != b.priority:
+        return a.priority < b.priority
+    return a._sequence < b._sequence
+
+
+class DeadlineQueue:
+    """
+    Run queue ordered by earliest deadline first, a drop-in replacement for ReadyQueue.
+
+    A ScheduledTask sets the deadline of its Task to the end of the period of its pending activation.
+    Tasks without a deadline run after every task with one. Ties are broken by priority, then by the
+    order the tasks were pushed. It is a binary min-heap of Tasks, so push, pop and remove are O(log n).
+
+    Select it with tasko.new_loop(policy=SCHEDULE_EDF), or builtins.tasko_policy = "EDF" before importing tasko.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._pushes = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __iter__(self):
+        # Heap order, which is not run order
+        return iter(self._heap)
+
+    def __repr__(self):
+        return repr(self._heap)
+
+    def push(self, task):
+        task._queue = self
+        task._sequence = self._pushes
+        self._pushes += 1
+        self._heap.append(task)
+        self._sift_up(task, len(self._heap) - 1)
+
+    def pop(self):
+        """Removes and returns the task with the earliest deadline"""
+        task = self._heap[0]
+        self.remove(task)
+        return task
+
+    def remove(self, task):
+        heap = self._heap
+        i = task._level
+        task._queue = None
+        last = heap.pop()
+        if i == len(heap):
+            return
+        # Move the last task into the hole and restore the heap order around it
+        if i > 0 and _runs_before(last, heap[(i - 1) >> 1]):
+            self._sift_up(last, i)
+        else:
+            self._sift_down(last, i)
+
+    def _sift_up(self, task, i):
+        heap = self._heap
+        while i > 0:
+            parent = (i - 1) >> 1
+            if not _runs_before(task, heap[parent]):
+                break
+            heap[i] = heap[parent]
+            heap[i]._level = i
+            i = parent
+        heap[i] = task
+        task._level = i
+
+    def _sift_down(self, task, i):
+        heap = self._heap
+        n = len(heap)
+        while True:
+            child = 2 * i + 1
+            if child >= n:
+                break
+            if child + 1 < n and _runs_before(heap[child + 1], heap[child]):
+                child += 1
+            if not _runs_before(heap[child], task):
+                break
+            heap[i] = heap[child]
+            heap[i]._level = i
+            i = child
+        heap[i] = task
+        task._level = i
+
+
+def utilization(rates_and_costs):
+    """
+    Returns the fraction of the CPU a task set needs.
+
+    EDF meets every deadline of independent periodic tasks as long as this is at most 1.
+    :param rates_and_costs: (frequency in hz, CPU time per invocation in nanoseconds) pairs
+    """
+    total = 0
+    for hz, cost_nanos in rates_and_costs:
+        total += hz * cost_nanos / 1000000000
+    return total
@@ -0,0 +1,91 @@
+class Event:
+    """
+    A flag that tasks can await until another task, a polled condition or a timeout wakes them.
+
+    Waiting tasks consume no cpu: they are suspended (or sleeping, with a timeout) until set() makes them
+    ready again. Use poll() to have the loop check a condition, like a pin or an interrupt flag, for you.
+    An exception raised by the condition sets the event too, and is raised again in the waiting tasks.
+
+    usage:
+      rx_done = Event()
+      rx_done.poll(lambda: radio_irq.value)
+      if await rx_done.wait(timeout=5):
+          read_the_packet()
+    """
+
+    def __init__(self, loop=None):
+        if loop is None:
+            from . import get_loop
+
+            loop = get_loop()
+        self._loop = loop
+        self._set = False
+        self._waiters = []
+        self._predicate = None
+        # The exception the polled predicate raised, None if it didn't
+        self.error = None
+
+    def is_set(self):
+        return self._set
+
+    def set(self):
+        """Sets the flag and wakes every waiting task"""
+        self._set = True
+        self.stop_polling()
+        waiters = self._waiters
+        while waiters:
+            self._loop._wake(waiters.pop(0))
+
+    def clear(self):
+        self._set = False
+        self.error = None
+
+    def poll(self, predicate):
+        """
+        Arms the event: the loop calls predicate() every step, and at least every
+        loop.POLL_INTERVAL_NANOS while it sleeps, until it returns True and sets the event.
+
+        :param predicate: function() => bool
+        """
+        if self._predicate is None:
+            self._loop._pollers.append(self)
+        self._predicate = predicate
+
+    def stop_polling(self):
+        if self._predicate is not None:
+            self._loop._pollers.remove(self)
+            self._predicate = None
+
+    async def wait(self, timeout=None):
+        """
+        Waits until the event is set.
+
+        NOTE:  Always `await` this!
+
+        :param timeout: Seconds to wait at most, None to wait forever.
+        :returns True if the event was set, False if the timeout ran out first.
+        :raises the error of the polled predicate, if it raised one.
+        """
+        if self._set:
+            return self._result()
+        task = self._loop._current
+        self._waiters.append(task)
+        try:
+            if timeout is None:
+                await_handle, _ = self._loop.suspend()
+                await await_handle
+            else:
+                await self._loop.sleep(timeout)
+        finally:
+            # Still waiting when timed out or cancelled
+            timed_out = task in self._waiters
+            if timed_out:
+                self._waiters.remove(task)
+        if timed_out:
+            return False
+        return self._result()
+
+    def _result(self):
+        if self.error is not None:
+            raise self.error
+        return True
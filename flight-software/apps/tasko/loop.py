@@ -1,26 +1,137 @@
 import time
 
+from .stats import TimingStats
+from .trace import TRACE_RUN, TRACE_YIELD, TRACE_DONE, TRACE_SLEEP, TRACE_WAKE
+from .trace import UNKNOWN_TASK
+
 _monotonic_ns = time.monotonic_ns
 
+# Number of distinct priority levels in a ReadyQueue. Priorities outside [0, PRIORITY_LEVELS)
+# share the nearest level. SM_CONFIGURATION uses small integers, 1 being the highest priority.
+PRIORITY_LEVELS = 32
+
+# What a ScheduledTask does when it falls behind its schedule, see ScheduledTask.set_overrun_policy
+#   COALESCE: run once right away and restart the schedule from now
+#   SKIP: drop the missed activations and keep the original phase
+#   CATCH_UP: run the missed activations back to back, up to a bounded burst
+OVERRUN_COALESCE = "COALESCE"
+OVERRUN_SKIP = "SKIP"
+OVERRUN_CATCH_UP = "CATCH_UP"
+
+# What the loop does when a task repeatedly exceeds its CPU budget, see Task.set_budget
+#   REPORT: only call the loop's budget handler
+#   DEMOTE: lower the task's priority by one level
+#   CANCEL: throw TaskCanceledException into the task
+BUDGET_REPORT = "REPORT"
+BUDGET_DEMOTE = "DEMOTE"
+BUDGET_CANCEL = "CANCEL"
+
+# How the loop orders ready tasks
+#   PRIORITY: by the static priority of each task, see ReadyQueue
+#   EDF: by the next deadline of each task, earliest first, see tasko.edf.DeadlineQueue
+SCHEDULE_PRIORITY = "PRIORITY"
+SCHEDULE_EDF = "EDF"
+
+# Task.deadline_nanos of tasks that are not bound to a period
+NO_DEADLINE = float("inf")
+
+# Longest the loop really sleeps while an Event is polling for its condition
+POLL_INTERVAL_NANOS = 1000000
+
+
+_sleep = time.sleep
+
 
 def set_time_provider(monotonic_ns):
     global _monotonic_ns
     _monotonic_ns = monotonic_ns
 
 
-def _yield_once():
-    """await the return value of this function to yield the processor"""
+def monotonic_ns():
+    """Returns the time of the clock the loop runs on, see set_time_provider"""
+    return _monotonic_ns()
+
+
+def set_sleep_provider(sleep):
+    """Replaces the function the loop calls to really sleep when it has nothing to do"""
+    global _sleep
+    _sleep = sleep
+
+
+class SimulatedClock:
+    """
+    Virtual time source for running the loop on a host.
+
+    Sleeping advances the clock instantly instead of waiting, so the loop can cover
+    days of mission time in seconds. Tasks simulate their execution time with advance().
+    """
+
+    def __init__(self, start_nanos=0):
+        self.now_nanos = start_nanos
+
+    def monotonic_ns(self):
+        return self.now_nanos
+
+    def sleep(self, seconds):
+        # Always move forward, so a sleep shorter than a nanosecond cannot stall the loop
+        self.now_nanos += max(1, round(seconds * 1000000000))
+
+    def advance(self, seconds):
+        self.now_nanos += round(seconds * 1000000000)
+
+
+def use_simulated_clock(clock=None):
+    """
+    Drives every loop from a SimulatedClock instead of the real time and sleep functions.
+
+    :param clock: The SimulatedClock to use, a new one starting at 0 if None.
+    :returns the SimulatedClock in use.
+    """
+    if clock is None:
+        clock = SimulatedClock()
+    set_time_provider(clock.monotonic_ns)
+    set_sleep_provider(clock.sleep)
+    return clock
+
+
+def use_real_clock():
+    set_time_provider(time.monotonic_ns)
+    set_sleep_provider(time.sleep)
+
+
+class _YieldOnce:
+    """
+    Awaitable that suspends the awaiting coroutine once.
+
+    It is its own iterator, so awaiting it allocates nothing. Every Task owns one and reuses it for
+    each suspension, since a coroutine can only be suspended at one place at a time.
+    """
+
+    def __init__(self):
+        self._yielded = False
+
+    def __await__(self):
+        return self
+
+    def __iter__(self):
+        return self
 
-    class _CallMeNextTime:
-        def __await__(self):
-            # This is inside the scheduler where we know generator yield is the
-            #   implementation of task switching in CircuitPython.  This throws
-            #   control back out through user code and up to the scheduler's
-            #   __iter__ stack which will see that we've suspended _current.
-            # Don't yield in async methods; only await unless you're making a library.
-            yield
+    def __next__(self):
+        # This is inside the scheduler where we know generator yield is the
+        #   implementation of task switching in CircuitPython.  Returning throws
+        #   control back out through user code and up to the scheduler's
+        #   __iter__ stack which will see that we've suspended _current.
+        #   The next send() into the task ends the await.
+        # Don't yield in async methods; only await unless you're making a library.
+        if self._yielded:
+            self._yielded = False
+            raise StopIteration
+        self._yielded = True
 
-    return _CallMeNextTime()
+
+def _yield_once():
+    """await the return value of this function to yield the processor"""
+    return _YieldOnce()
 
 
 def _get_future_nanos(seconds_in_future):
@@ -31,6 +142,10 @@ class Sleeper:
     def __init__(self, resume_nanos, task):
         self.task = task
         self._resume_nanos = resume_nanos
+        # Position in the SleeperHeap or TimingWheel, -1 when not in either
+        self._index = -1
+        # The TimingWheel slot holding this sleeper
+        self._slot = None
 
     def resume_nanos(self):
         return self._resume_nanos
@@ -38,6 +153,12 @@ class Sleeper:
     def priority_sort(self):
         return self.task.priority
 
+    def wakes_before(self, other):
+        """Heap ordering: earliest resume time first, then highest priority (lowest number)."""
+        if self._resume_nanos == other._resume_nanos:
+            return self.task.priority < other.task.priority
+        return self._resume_nanos < other._resume_nanos
+
     def __repr__(self):
         return "{{Sleeper remaining: {:.2f}, task: {} }}".format(
             (self.resume_nanos() - _monotonic_ns()), self.task
@@ -46,15 +167,241 @@ class Sleeper:
     __str__ = __repr__
 
 
+class SleeperHeap:
+    """
+    Binary min-heap of Sleepers ordered by (resume_nanos, priority).
+
+    Implemented by hand rather than with heapq, which is not available on every CircuitPython build.
+    Pushing and popping a sleeper is O(log n) and peeking at the next wakeup is O(1).
+    """
+
+    def __init__(self):
+        self._heap = []
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __iter__(self):
+        return iter(self._heap)
+
+    def __repr__(self):
+        return repr(self._heap)
+
+    def push(self, sleeper):
+        self._heap.append(sleeper)
+        self._sift_up(sleeper, len(self._heap) - 1)
+
+    def peek(self):
+        """Returns the next sleeper to wake up without removing it, or None if there are no sleepers"""
+        return self._heap[0] if self._heap else None
+
+    def next_resume_nanos(self):
+        """Returns when the next sleeper wakes up, or None if there are no sleepers"""
+        return self._heap[0]._resume_nanos if self._heap else None
+
+    def pop(self):
+        top = self._heap[0]
+        self._remove_at(0)
+        return top
+
+    def remove(self, sleeper):
+        """Removes a sleeper from anywhere in the heap"""
+        self._remove_at(sleeper._index)
+
+    def _remove_at(self, i):
+        heap = self._heap
+        heap[i]._index = -1
+        last = heap.pop()
+        if i == len(heap):
+            return
+        # Move the last sleeper into the hole and restore the heap order around it
+        if i > 0 and last.wakes_before(heap[(i - 1) >> 1]):
+            self._sift_up(last, i)
+        else:
+            self._sift_down(last, i)
+
+    def _sift_up(self, sleeper, i):
+        heap = self._heap
+        while i > 0:
+            parent = (i - 1) >> 1
+            if not sleeper.wakes_before(heap[parent]):
+                break
+            heap[i] = heap[parent]
+            heap[i]._index = i
+            i = parent
+        heap[i] = sleeper
+        sleeper._index = i
+
+    def _sift_down(self, sleeper, i):
+        heap = self._heap
+        n = len(heap)
+        while True:
+            child = 2 * i + 1
+            if child >= n:
+                break
+            if child + 1 < n and heap[child + 1].wakes_before(heap[child]):
+                child += 1
+            if not heap[child].wakes_before(sleeper):
+                break
+            heap[i] = heap[child]
+            heap[i]._index = i
+            i = child
+        heap[i] = sleeper
+        sleeper._index = i
+
+    def pop_ready(self, now_nanos, ready):
+        """Moves the task of every sleeper due at or before now_nanos into the ready queue"""
+        heap = self._heap
+        while heap and heap[0]._resume_nanos <= now_nanos:
+            task = self.pop().task
+            task._sleeper = None
+            ready.push(task)
+        return ready
+
+
+def _priority_level(priority):
+    if priority < 0:
+        return 0
+    if priority >= PRIORITY_LEVELS:
+        return PRIORITY_LEVELS - 1
+    return priority
+
+
+class ReadyQueue:
+    """
+    Run queue with one FIFO per priority level plus a bitmap of the non-empty levels.
+
+    Each level is an intrusive doubly linked list threaded through the Task records, so
+    push, pop and remove are O(1) and never allocate. Tasks of equal priority run in the
+    order they were pushed.
+    """
+
+    def __init__(self):
+        self._heads = [None] * PRIORITY_LEVELS
+        self._tails = [None] * PRIORITY_LEVELS
+        self._bitmap = 0
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for level in range(PRIORITY_LEVELS):
+            task = self._heads[level]
+            while task is not None:
+                yield task
+                task = task._next
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def push(self, task):
+        level = _priority_level(task.priority)
+        tail = self._tails[level]
+        task._level = level
+        task._prev = tail
+        task._next = None
+        task._queue = self
+        if tail is None:
+            self._heads[level] = task
+            self._bitmap |= 1 << level
+        else:
+            tail._next = task
+        self._tails[level] = task
+        self._len += 1
+
+    def pop(self):
+        """Removes and returns the oldest task of the highest priority (lowest number) level"""
+        bitmap = self._bitmap
+        level = 0
+        while not (bitmap >> level) & 1:
+            level += 1
+        task = self._heads[level]
+        self.remove(task)
+        return task
+
+    def remove(self, task):
+        level = task._level
+        if task._prev is None:
+            self._heads[level] = task._next
+        else:
+            task._prev._next = task._next
+        if task._next is None:
+            self._tails[level] = task._prev
+        else:
+            task._next._prev = task._prev
+        if self._heads[level] is None:
+            self._bitmap &= ~(1 << level)
+        task._prev = task._next = task._queue = None
+        self._len -= 1
+
+
 class Task:
     def __init__(self, coroutine, priority):
         # Added a priority level
         self.coroutine = coroutine
+        # Priority the task runs at, the more urgent of base_priority and the one it inherits
         self.priority = priority
+        # Priority set by add_task and set_priority, before any ManagedResource inheritance
+        self.base_priority = priority
+        # ManagedResources this task holds, see Loop.update_priority
+        self.held_resources = []
+        # Run queue bookkeeping, _level is the heap index in a DeadlineQueue
+        self._queue = None
+        self._level = 0
+        self._prev = None
+        self._next = None
+        # Absolute time the current activation should complete by, used by the EDF policy
+        self.deadline_nanos = NO_DEADLINE
+        self._sequence = 0
+        # The Sleeper of this task while it is in the sleeper heap
+        self._sleeper = None
+        # Reused for every sleep and suspension of this task, so the scheduler doesn't allocate
+        self._sleeper_record = Sleeper(0, self)
+        self._yielder = _YieldOnce()
+        # The ScheduledTask driving this coroutine, if any
+        self.owner = None
+        # Identifies the task in the loop's TraceBuffer
+        self.trace_id = UNKNOWN_TASK
+        self.done = False
+        self.cancelled = False
+        # True while the loop is inside coroutine.send() or throw() of this task
+        self.running = False
+        # CPU time spent in coroutine.send() since the budget window started
+        self.cpu_nanos = 0
+        self.budget_nanos = 0
+        self.budget_action = BUDGET_REPORT
+        self.budget_strikes = 0
+        self.max_budget_strikes = 1
+        self.budget_overruns = 0
+        self._over_budget = False
 
     def priority_sort(self):
         return self.priority
 
+    def set_budget(self, seconds, action=BUDGET_REPORT, strikes=3):
+        """
+        Limit the CPU time this task may spend per budget window (one invocation for a ScheduledTask).
+
+        :param seconds: CPU budget per window, 0 to disable.
+        :param action: BUDGET_REPORT, BUDGET_DEMOTE or BUDGET_CANCEL, applied when the budget has been
+                       exceeded in `strikes` consecutive windows.
+        """
+        if action not in (BUDGET_REPORT, BUDGET_DEMOTE, BUDGET_CANCEL):
+            raise ValueError("Unknown budget action {}".format(action))
+        self.budget_nanos = int(seconds * 1000000000)
+        self.budget_action = action
+        self.max_budget_strikes = strikes
+
+    def new_budget_window(self):
+        """Starts a new budget window and returns the CPU time spent in the previous one"""
+        cpu_nanos = self.cpu_nanos
+        if not self._over_budget:
+            self.budget_strikes = 0
+        self._over_budget = False
+        self.cpu_nanos = 0
+        return cpu_nanos
+
     def __repr__(self):
         return "{{Task {}, Priority {}}}".format(self.coroutine, self.priority)
 
@@ -64,19 +411,101 @@ class Task:
 class ScheduledTask:
     def change_rate(self, hz):
         ### Update the task rate to a new frequency ###
-        self._nanoseconds_per_invocation = (1 / hz) * 1000000000
+        self._nanoseconds_per_invocation = round(1000000000 / hz)
+
+    def set_overrun_policy(self, policy, max_burst=3):
+        """
+        Choose what happens when an invocation runs past the start of the next period.
+
+        :param policy: OVERRUN_COALESCE (default) runs once right away and restarts the schedule from now, which
+                       drifts the phase. OVERRUN_SKIP drops the missed activations and waits for the next period
+                       boundary, preserving the phase. OVERRUN_CATCH_UP runs the missed activations back to back
+                       on their original schedule, dropping the oldest ones beyond max_burst pending activations.
+        :param max_burst: Most activations OVERRUN_CATCH_UP keeps pending.
+        """
+        if policy not in (OVERRUN_COALESCE, OVERRUN_SKIP, OVERRUN_CATCH_UP):
+            raise ValueError("Unknown overrun policy {}".format(policy))
+        if max_burst < 1:
+            raise ValueError("max_burst must be at least 1")
+        self._overrun_policy = policy
+        self._max_burst = max_burst
+
+    def set_priority(self, priority):
+        ### Update the task priority, requeuing it right away if it is waiting, see Loop.set_priority ###
+        self._priority = priority
+        if self._task is not None and not self._task.done:
+            self._loop.set_priority(self._task, priority)
+
+    def set_trace_id(self, task_id):
+        """Identifies the records of this task in the loop's TraceBuffer, a TASK_MAPPING_ID for flight tasks"""
+        self._trace_id = task_id
+        if self._task is not None:
+            self._task.trace_id = task_id
+
+    def set_phase(self, seconds, origin_nanos=None):
+        """
+        Delay every activation by an offset from the time the task starts, so tasks of the same rate
+        started together don't all run in the same step. Takes effect when the loop first runs the task,
+        call it right after scheduling.
+
+        A task that already runs moves its next activation to the first one at or after now of the
+        schedule origin_nanos + seconds + whole periods, so tasks rephased with the same origin are
+        staggered as if they had started together.
+
+        :param origin_nanos: Start of the new schedule on the loop's clock, now by default.
+        """
+        self._phase_nanos = round(seconds * 1000000000)
+        if not self._scheduled_to_run:
+            return
+        if origin_nanos is None:
+            origin_nanos = _monotonic_ns()
+        period = self._nanoseconds_per_invocation
+        target_nanos = origin_nanos + self._phase_nanos
+        now_nanos = _monotonic_ns()
+        if target_nanos < now_nanos:
+            target_nanos += -((target_nanos - now_nanos) // period) * period
+        task = self._task
+        if self._running or task._sleeper is None:
+            # Running or about to: the activation after this one moves
+            self._rephased_nanos = target_nanos
+        else:
+            self._target_nanos = target_nanos
+            task.deadline_nanos = target_nanos + period
+            self._loop._resleep(task, target_nanos)
 
     def stop(self):
         ### Stop the task (does not interrupt a currently running task) ###
         self._stop = True
 
+    def cancel(self):
+        ### Stop the task now, throwing TaskCanceledException into it, see Loop.cancel ###
+        self._stop = True
+        if self._task is not None:
+            self._loop.cancel(self._task)
+
     def start(self):
         ### Schedule the task (if it's not already scheduled) ###
         self._stop = False
         if not self._scheduled_to_run:
             # Don't double-up the task if it's still in the run list!
             # print("Added task to loop._task")
-            self._loop.add_task(self._run_at_fixed_rate(), self._priority)
+            self._task = self._loop.add_task(
+                self._run_at_fixed_rate(),
+                self._priority,
+                _get_future_nanos(0) + self._nanoseconds_per_invocation,
+            )
+            self._task.owner = self
+            self._task.trace_id = self._trace_id
+            if self._budget is not None:
+                self._task.set_budget(*self._budget)
+
+    def set_budget(self, seconds, action=BUDGET_REPORT, strikes=3):
+        """
+        Limit the CPU time of each invocation, see Task.set_budget.
+        """
+        self._budget = (seconds, action, strikes)
+        if self._task is not None:
+            self._task.set_budget(seconds, action, strikes)
 
     def __init__(
         self, loop, hz, forward_async_fn, priority, forward_args, forward_kwargs
@@ -85,49 +514,153 @@ class ScheduledTask:
         self._forward_async_fn = forward_async_fn
         self._forward_args = forward_args
         self._forward_kwargs = forward_kwargs
-        self._nanoseconds_per_invocation = (1 / hz) * 1000000000
+        # Whole nanoseconds, so the targets and deadlines computed from it stay integers
+        self._nanoseconds_per_invocation = round(1000000000 / hz)
         self._stop = False
         self._running = False
         self._scheduled_to_run = False
         self._priority = priority
+        self._overrun_policy = OVERRUN_COALESCE
+        self._max_burst = 1
+        self._phase_nanos = 0
+        # Start of the pending activation, and the one set_phase moved the next one to if any
+        self._target_nanos = 0
+        self._rephased_nanos = None
+        self._task = None
+        self._budget = None
+        self._trace_id = UNKNOWN_TASK
+        # Timing statistics, see query_state()
+        self.runtime = TimingStats()
+        self.cpu = TimingStats()
+        self.lateness = TimingStats()
+        self.late_activations = 0
+        self.skipped_activations = 0
+
+    def query_state(self):
+        """Returns the rate and timing statistics of this task"""
+        return {
+            "rate": 1000000000 / self._nanoseconds_per_invocation,
+            "overrun_policy": self._overrun_policy,
+            "invocations": self.runtime.count,
+            "missed_periods": self.late_activations + self.skipped_activations,
+            "late_activations": self.late_activations,
+            "skipped_activations": self.skipped_activations,
+            "runtime": self.runtime.as_dict(),
+            "cpu": self.cpu.as_dict(),
+            "lateness": self.lateness.as_dict(),
+            "budget_overruns": 0 if self._task is None else self._task.budget_overruns,
+        }
+
+    def reset_stats(self):
+        self.runtime.reset()
+        self.cpu.reset()
+        self.lateness.reset()
+        self.late_activations = 0
+        self.skipped_activations = 0
 
     async def _run_at_fixed_rate(self):
         self._scheduled_to_run = True
+        self._loop._scheduled.append(self)
         try:
-            target_run_nanos = _monotonic_ns()
+            self._target_nanos = _monotonic_ns()
+            self._rephased_nanos = None
+            if self._phase_nanos:
+                self._target_nanos += self._phase_nanos
+                self._task.deadline_nanos = (
+                    self._target_nanos + self._nanoseconds_per_invocation
+                )
+                await self._loop._sleep_until_nanos(self._target_nanos)
+            first = True
             while True:
                 if self._stop:
                     return  # Check before running
 
+                # The loop only adds up CPU time once a send() returns, so the previous
+                # invocation's total is complete by now.
+                cpu_nanos = self._task.new_budget_window()
+                if first:
+                    first = False
+                else:
+                    self.cpu.record(cpu_nanos)
+
                 iteration = self._forward_async_fn(
                     *self._forward_args, **self._forward_kwargs
                 )
-                self._loop._debug("  iteration ", iteration)
+                if self._loop.debug:
+                    self._loop._debug("  iteration ", iteration)
 
+                start_nanos = _monotonic_ns()
+                self.lateness.record(start_nanos - self._target_nanos)
                 self._running = True
                 try:
                     await iteration
                 finally:
                     self._running = False
+                    self.runtime.record(_monotonic_ns() - start_nanos)
 
                 if self._stop:
                     return  # Check before waiting
 
                 # Try to reschedule for the next window without skew. If we're falling behind,
-                # just go as fast as possible & schedule to run "now." If we catch back up again
-                # we'll return to seconds_per_invocation without doing a bunch of catchup runs.
-                target_run_nanos = target_run_nanos + self._nanoseconds_per_invocation
+                # the overrun policy decides which of the missed activations still run.
+                if self._rephased_nanos is None:
+                    target_run_nanos = (
+                        self._target_nanos + self._nanoseconds_per_invocation
+                    )
+                else:
+                    target_run_nanos = self._rephased_nanos
+                    self._rephased_nanos = None
                 # print('target_run_nanos is ', target_run_nanos)
                 now_nanos = _monotonic_ns()
+                # Deadline of the next activation, the end of its period
+                self._task.deadline_nanos = (
+                    target_run_nanos + self._nanoseconds_per_invocation
+                )
                 if now_nanos <= target_run_nanos:
                     # print("Going to put to sleep")
+                    self._target_nanos = target_run_nanos
                     await self._loop._sleep_until_nanos(target_run_nanos)
+                    continue
+
+                # Activations whose start time has already passed
+                behind = 1 + (
+                    (now_nanos - target_run_nanos) // self._nanoseconds_per_invocation
+                )
+                if self._overrun_policy == OVERRUN_SKIP:
+                    # Sleep until the next period boundary to keep the phase.
+                    self.skipped_activations += behind
+                    target_run_nanos += behind * self._nanoseconds_per_invocation
+                    self._task.deadline_nanos += (
+                        behind * self._nanoseconds_per_invocation
+                    )
+                    self._target_nanos = target_run_nanos
+                    await self._loop._sleep_until_nanos(target_run_nanos)
+                    continue
+
+                if self._overrun_policy == OVERRUN_CATCH_UP:
+                    # Run the oldest pending activation now, on its original schedule.
+                    if behind > self._max_burst:
+                        dropped = behind - self._max_burst
+                        self.skipped_activations += dropped
+                        target_run_nanos += dropped * self._nanoseconds_per_invocation
+                        self._task.deadline_nanos += (
+                            dropped * self._nanoseconds_per_invocation
+                        )
                 else:
+                    # Coalesce: just go as fast as possible & schedule to run "now." If we catch back
+                    # up again we'll return to seconds_per_invocation without doing a bunch of catchup runs.
+                    self.skipped_activations += behind - 1
                     target_run_nanos = now_nanos
-                    # Allow other tasks a chance to run if this task is too slow.
-                    await _yield_once()
+                    self._task.deadline_nanos = (
+                        now_nanos + self._nanoseconds_per_invocation
+                    )
+                self._target_nanos = target_run_nanos
+                self.late_activations += 1
+                # Allow other tasks a chance to run if this task is too slow.
+                await self._task._yielder
         finally:
             self._scheduled_to_run = False
+            self._loop._scheduled.remove(self)
 
     def __repr__(self):
         hz = 1 / (self._nanoseconds_per_invocation / 1000000000)
@@ -148,37 +681,77 @@ class Loop:
     It's your task host.  You run() it and it manages your main application loop.
     """
 
-    def __init__(self, debug=False):
-        self._tasks = []
-        self._sleeping = []
-        self._ready = []
+    def __init__(
+        self, debug=False, sleepers=None, policy=SCHEDULE_PRIORITY, trace=None
+    ):
+        """
+        :param debug: Print what the loop does. This slows every step down a lot, prefer a trace for timing.
+        :param trace: A tasko.trace.TraceBuffer recording the task switches, sleeps and wake-ups, see trace.
+        :param sleepers: Where sleeping tasks wait, a SleeperHeap by default. See tasko.timing_wheel for an
+                         alternative suited to many low-rate tasks.
+        :param policy: SCHEDULE_PRIORITY (default) or SCHEDULE_EDF, how ready tasks are ordered.
+        """
+        if policy == SCHEDULE_PRIORITY:
+            queue_type = ReadyQueue
+        elif policy == SCHEDULE_EDF:
+            from .edf import DeadlineQueue
+
+            queue_type = DeadlineQueue
+        else:
+            raise ValueError("Unknown scheduling policy {}".format(policy))
+        self.policy = policy
+        self._tasks = queue_type()
+        self._sleeping = SleeperHeap() if sleepers is None else sleepers
+        # Spare queue, swapped with _tasks every step
+        self._ready = queue_type()
         self._current = None
+        # Number of coroutine resumptions, used to measure scheduler overhead
+        self.task_switches = 0
+        # ScheduledTasks whose fixed-rate coroutine is alive, see stats()
+        self._scheduled = []
+        self._budget_handler = None
+        # Events polling a condition, see Event.poll
+        self._pollers = []
+        # Event recorder, None when tracing is off
+        self.trace = trace
         self.debug = debug
         if debug:
             self._debug = print
         else:
             self._debug = lambda *arg, **kwargs: None
 
-    def add_task(self, awaitable_task, priority):
+    def add_task(self, awaitable_task, priority, deadline_nanos=NO_DEADLINE):
         """
         Add a concurrent task (known as a coroutine, implemented as a generator in CircuitPython)
         Use:
           scheduler.add_task( my_async_method() )
         :param awaitable_task:  The coroutine to be concurrently driven to completion.
+        :param deadline_nanos:  When the task should complete by, only used by the EDF policy.
+        :returns the Task record of the coroutine
         """
         self._debug("adding task ", awaitable_task)
         # Added a priority parameter
-        self._tasks.append(Task(awaitable_task, priority))
+        task = Task(awaitable_task, priority)
+        task.deadline_nanos = deadline_nanos
+        self._tasks.push(task)
+        return task
 
-    async def sleep(self, seconds):
+    def set_budget_handler(self, handler):
+        """
+        :param handler: function(task) => void  called whenever a task has exceeded its CPU budget
+                        for max_budget_strikes consecutive windows, after the budget action was applied.
+        """
+        self._budget_handler = handler
+
+    def sleep(self, seconds):
         """
         From within a coroutine, this suspends your call stack for some amount of time.
 
-        NOTE:  Always `await` this!  You will have a bad time if you do not.
+        NOTE:  Always `await` this, right away!  You will have a bad time if you do not.
 
         :param seconds: Floating point; will wait at least this long to call your task again.
         """
-        await self._sleep_until_nanos(_get_future_nanos(seconds))
+        return self._sleep_until_nanos(_get_future_nanos(seconds))
 
     def run_later(self, seconds_to_delay, awaitable_task, priority):
         """
@@ -214,10 +787,16 @@ class Loop:
         suspended = self._current
 
         def resume():
-            self._tasks.append(suspended)
+            """:returns False if the suspended task was cancelled in the meantime"""
+            if suspended.done:
+                return False
+            self._tasks.push(suspended)
+            if self.trace is not None:
+                self.trace.record(TRACE_WAKE, suspended.trace_id, 0, _monotonic_ns())
+            return True
 
         self._current = None
-        return _yield_once(), resume
+        return suspended._yielder, resume
 
     def schedule(self, hz: float, coroutine_function, priority, *args, **kwargs):
         """
@@ -263,6 +842,15 @@ class Loop:
 
         return self.schedule(hz, call_later, priority)
 
+    def stats(self):
+        """
+        Returns the timing statistics of every live scheduled task, keyed by ScheduledTask.
+
+        See ScheduledTask.query_state for the fields.
+        Durations are in nanoseconds; histograms are log-scale, see tasko.stats.
+        """
+        return {task: task.query_state() for task in self._scheduled}
+
     def run(self):
         """
         Use:
@@ -284,104 +872,340 @@ class Loop:
             self._current is None
         ), "Loop can only be advanced by 1 stack frame at a time."
         self._loopnum = 0
-        while self._tasks or self._sleeping:
-            self._debug(
-                "[{}] ---- sleeping: {}, active: {}".format(
-                    self._loopnum, len(self._sleeping), len(self._tasks)
+        while self._tasks or self._sleeping or self._pollers:
+            if self.debug:
+                self._debug(
+                    "[{}] ---- sleeping: {}, active: {}".format(
+                        self._loopnum, len(self._sleeping), len(self._tasks)
+                    )
                 )
-            )
             self._step()
-            self._debug("\n")
-            self._loopnum += 1
+            if self.debug:
+                self._debug("\n")
+                self._loopnum += 1
         # while self._tasks or self._sleeping:
         # self._step()
         self._debug("Loop completed", self._tasks, self._sleeping)
 
-    def _step(self):
-        self._debug("  stepping over ", len(self._tasks), " tasks")
+    def step(self, n=1):
+        """
+        Advances the loop by n steps and returns. Each step runs the ready tasks once, then the sleepers that
+        are due, and really sleeps until the next sleeper is due when no task is left ready.
 
-        # Sort tasks by priority
-        self._tasks.sort(key=Task.priority_sort)
+        :returns the number of steps taken, fewer than n if the loop ran out of tasks
+        """
+        assert (
+            self._current is None
+        ), "Loop can only be advanced by 1 stack frame at a time."
+        for i in range(n):
+            if not (self._tasks or self._sleeping or self._pollers):
+                return i
+            self._step()
+        return n
 
-        for _ in range(len(self._tasks)):
-            task = self._tasks.pop(0)
-            self._run_task(task)
+    def run_until(self, condition):
+        """
+        Runs the loop until a condition holds, so tests and host tools can run a slice of mission time and
+        look at the statistics afterwards.
 
+        :param condition: function() => bool checked before every step, or a deadline in nanoseconds of the
+                          loop's clock (time.monotonic_ns(), or SimulatedClock.now_nanos). The loop doesn't
+                          sleep past a deadline.
+        :returns True once the condition holds, False if the loop ran out of tasks before
+        """
+        assert (
+            self._current is None
+        ), "Loop can only be advanced by 1 stack frame at a time."
+        if callable(condition):
+            while not condition():
+                if not (self._tasks or self._sleeping or self._pollers):
+                    return False
+                self._step()
+            return True
+        while _monotonic_ns() < condition:
+            if not (self._tasks or self._sleeping or self._pollers):
+                return False
+            self._step(condition)
+        return True
+
+    def run_for(self, seconds):
+        """Runs the loop for some seconds of its clock, see run_until"""
+        return self.run_until(_get_future_nanos(seconds))
+
+    def _step(self, until_nanos=None):
+        """:param until_nanos: Don't really sleep past this time of the loop's clock"""
         if self.debug:
-            self._debug("  sleeping list (unsorted):")
+            self._debug("  stepping over ", len(self._tasks), " tasks")
+
+        if self._pollers:
+            self._poll()
+
+        # Tasks queued while this step runs (yielded, resumed or added) go to the spare
+        # queue and are considered next step.
+        ready, self._tasks = self._tasks, self._ready
+
+        while ready:
+            self._run_task(ready.pop())
+
+        if self.debug:
+            self._debug("  sleeping heap:")
             for i in self._sleeping:
                 self._debug("    {}".format(i))
 
-        # Create the ready list based on whichever tasks are ready to be executed
-        self._ready = [x for x in self._sleeping if x.resume_nanos() <= _monotonic_ns()]
-        # Sort the ready tasks based on priority
-        self._ready.sort(key=lambda x: x.task.priority)
+        # Move whichever sleepers are due out of the heap and into the ready queue
+        self._sleeping.pop_ready(_monotonic_ns(), ready)
+
+        if self.trace is not None and ready:
+            now_nanos = _monotonic_ns()
+            for task in ready:
+                self.trace.record(TRACE_WAKE, task.trace_id, 0, now_nanos)
 
         if self.debug:
-            self._debug("  ready list (sorted)")
-            for i in self._ready:
+            self._debug("  ready queue (by priority)")
+            for i in ready:
                 self._debug("    {}".format(i))
 
-        # Run the ready tasks, and simultaneously remove them from the _sleeping and _ready lists
-        for i in range(len(self._ready)):
-            ready_task = self._ready.pop(0)
-            self._sleeping.remove(ready_task)
-            self._run_task(ready_task.task)
+        while ready:
+            self._run_task(ready.pop())
+        self._ready = ready
 
-        if len(self._tasks) == 0 and len(self._sleeping) > 0:
+        if len(self._tasks) == 0 and (len(self._sleeping) > 0 or self._pollers):
 
-            # Sort the sleeper list only when we need to, i.e, only
-            # when there are no active tasks, and the system needs to
-            # ACTUALLY sleep.
+            # The sleeper structure knows the next sleeper to wake up, so the system
+            # can ACTUALLY sleep without sorting the sleeper list.
 
-            self._sleeping.sort(key=Sleeper.resume_nanos)
-            next_sleeper = self._sleeping[0]
-            sleep_nanos = next_sleeper.resume_nanos() - _monotonic_ns()
+            now_nanos = _monotonic_ns()
+            next_resume_nanos = self._sleeping.next_resume_nanos()
+            if next_resume_nanos is None:
+                sleep_nanos = POLL_INTERVAL_NANOS
+            else:
+                sleep_nanos = next_resume_nanos - now_nanos
+            if self._pollers and sleep_nanos > POLL_INTERVAL_NANOS:
+                # Wake up in time to poll the armed event sources again
+                sleep_nanos = POLL_INTERVAL_NANOS
+            if until_nanos is not None and sleep_nanos > until_nanos - now_nanos:
+                # Hand control back to run_until on time
+                sleep_nanos = until_nanos - now_nanos
 
             if sleep_nanos > 0:
                 # Give control to the system, there's nothing to be done right now,
                 # and nothing else is scheduled to run for this long.
                 # This is the real sleep. If/when interrupts are implemented this will likely need to change.
                 sleep_seconds = sleep_nanos / 1000000000.0
-                self._debug(
-                    "  No active tasks.  Sleeping for ",
-                    sleep_seconds,
-                    "s. \n",
-                    self._sleeping,
-                )
-
-                time.sleep(sleep_seconds)
+                if self.debug:
+                    self._debug(
+                        "  No active tasks.  Sleeping for ",
+                        sleep_seconds,
+                        "s. \n",
+                        self._sleeping,
+                    )
+
+                _sleep(sleep_seconds)
+
+    def _poll(self):
+        pollers = self._pollers
+        i = 0
+        while i < len(pollers):
+            event = pollers[i]
+            try:
+                ready = event._predicate()
+            except Exception as e:
+                # A failing read of a device must not stop the loop, the waiting tasks get the error
+                event.error = e
+                ready = True
+            if ready:
+                # set() disarms the event, removing it from the pollers
+                event.set()
+            else:
+                i += 1
+
+    def _wake(self, task):
+        """Makes a sleeping or suspended task ready to run on the next step"""
+        if task.done or task._queue is not None:
+            return
+        if task._sleeper is not None:
+            self._sleeping.remove(task._sleeper)
+            task._sleeper = None
+        self._tasks.push(task)
+        if self.trace is not None:
+            self.trace.record(TRACE_WAKE, task.trace_id, 0, _monotonic_ns())
 
     def _run_task(self, task: Task):
         """
         Runs a task and re-queues for the next loop if it is both (1) not complete and (2) not sleeping.
         """
+        if task.done:
+            # Leftover queue entry of a task that was cancelled while queued
+            return
 
         self._current = task
+        self.task_switches += 1
+        start_nanos = _monotonic_ns()
+        if self.trace is not None:
+            self.trace.record(TRACE_RUN, task.trace_id, 0, start_nanos)
+        task.running = True
         try:
 
             task.coroutine.send(None)
-            self._debug("  current", self._current)
+            if self.debug:
+                self._debug("  current", self._current)
             # Sleep gate here, in case the current task suspended.
             # If a sleeping task re-suspends it will have already put itself in the sleeping queue.
             if self._current is not None:
-                self._tasks.append(task)
+                self._tasks.push(task)
         except StopIteration:
             # This task is all done.
-            self._debug("  task complete")
-            pass
+            if self.debug:
+                self._debug("  task complete")
+            task.done = True
         finally:
+            task.running = False
             self._current = None
+            end_nanos = _monotonic_ns()
+            task.cpu_nanos += end_nanos - start_nanos
+            if self.trace is not None:
+                self.trace.record(
+                    TRACE_DONE if task.done else TRACE_YIELD,
+                    task.trace_id,
+                    0,
+                    end_nanos,
+                )
+
+        if task.done:
+            return
+        if task.cancelled:
+            # The task cancelled itself while running
+            self._throw_cancel(task)
+        elif (
+            task.budget_nanos
+            and task.cpu_nanos > task.budget_nanos
+            and not task._over_budget
+        ):
+            self._over_budget(task)
+
+    def _over_budget(self, task):
+        # Only count one overrun per budget window
+        task._over_budget = True
+        task.budget_overruns += 1
+        task.budget_strikes += 1
+        if task.budget_strikes < task.max_budget_strikes:
+            return
+
+        self._debug("  over budget ", task)
+        task.budget_strikes = 0
+        if task.budget_action == BUDGET_DEMOTE:
+            if task.base_priority < PRIORITY_LEVELS - 1:
+                self.set_priority(task, task.base_priority + 1)
+        elif task.budget_action == BUDGET_CANCEL:
+            self._throw_cancel(task)
+        if self._budget_handler is not None:
+            self._budget_handler(task)
+
+    def set_priority(self, task, priority):
+        """
+        Changes the base priority of a task, moving it within the ready queue or the sleepers if it waits there.
+        A task holding a ManagedResource keeps the priority of its most urgent waiter while that one is higher.
+
+        :param task: The Task record returned by add_task
+        """
+        task.base_priority = priority
+        self.update_priority(task)
+
+    def update_priority(self, task):
+        """Runs a task at the more urgent of its base priority and those of the waiters of the resources it holds"""
+        priority = task.base_priority
+        for resource in task.held_resources:
+            waiting = resource.waiting_priority()
+            if waiting is not None and waiting < priority:
+                priority = waiting
+        if task.priority == priority:
+            return
+        queue = task._queue
+        if queue is not None:
+            queue.remove(task)
+        sleeper = task._sleeper
+        if sleeper is not None:
+            self._sleeping.remove(sleeper)
+        task.priority = priority
+        if queue is not None:
+            queue.push(task)
+        if sleeper is not None:
+            self._sleeping.push(sleeper)
+
+    def cancel(self, task):
+        """
+        Cancels a task right away: its pending sleeper or ready queue entry is removed and
+        TaskCanceledException is thrown into it so its finally blocks run.
+
+        A running task, the one cancelling or one that resumed it, is cancelled as soon as it suspends.
 
-    async def _sleep_until_nanos(self, target_run_nanos):
+        :param task: The Task record returned by add_task
+        """
+        if task.done:
+            return
+        task.cancelled = True
+        if task.owner is not None:
+            task.owner._stop = True
+        if not task.running:
+            self._throw_cancel(task)
+
+    def _throw_cancel(self, task):
+        """Throws TaskCanceledException into a suspended task so its finally blocks run"""
+        task.cancelled = True
+        if task.owner is not None:
+            task.owner._stop = True
+        self._purge(task)
+        # Cancel may be called from within another task, which must find itself current again
+        previous = self._current
+        self._current = task
+        task.running = True
+        # The exception ends the await on the yielder wherever the task is suspended
+        task._yielder._yielded = False
+        try:
+            task.coroutine.throw(TaskCanceledException())
+            # The task swallowed the exception and suspended again
+            task.coroutine.close()
+        except (StopIteration, TaskCanceledException):
+            pass
+        finally:
+            self._current = previous
+            task.running = False
+            task.done = True
+            # In case the task slept or yielded again from its finally blocks
+            self._purge(task)
+            if self.trace is not None:
+                self.trace.record(TRACE_DONE, task.trace_id, 0, _monotonic_ns())
+
+    def _purge(self, task):
+        if task._queue is not None:
+            task._queue.remove(task)
+        if task._sleeper is not None:
+            self._sleeping.remove(task._sleeper)
+            task._sleeper = None
+
+    def _resleep(self, task, resume_nanos):
+        """Moves the wake-up time of a sleeping task"""
+        sleeper = task._sleeper
+        self._sleeping.remove(sleeper)
+        sleeper._resume_nanos = resume_nanos
+        self._sleeping.push(sleeper)
+
+    def _sleep_until_nanos(self, target_run_nanos):
         """
         From within a coroutine, sleeps until the target time.monotonic_ns
-        Returns the thing to await
+        Returns the thing to await, right away
         """
-        assert self._current is not None, "You can only sleep from within a task"
-        self._sleeping.append(Sleeper(target_run_nanos, self._current))
-        self._debug("  sleeping ", self._current)
+        task = self._current
+        assert task is not None, "You can only sleep from within a task"
+        sleeper = task._sleeper_record
+        sleeper._resume_nanos = target_run_nanos
+        task._sleeper = sleeper
+        self._sleeping.push(sleeper)
+        if self.trace is not None:
+            self.trace.record(TRACE_SLEEP, task.trace_id, 0, _monotonic_ns())
+        if self.debug:
+            self._debug("  sleeping ", task)
         self._current = None
-        # Pretty subtle here.  This yields once, then it continues next time the task scheduler executes it.
-        # The async function is parked at this point.
-        await _yield_once()
+        # Pretty subtle here.  Awaiting this yields once, then the coroutine continues next time the task
+        # scheduler executes it. The async function is parked at this point.
+        return task._yielder
@@ -1,12 +1,36 @@
-import tasko
+from . import get_loop
+from . import loop as _loop
+from .stats import TimingStats
+from .trace import TRACE_ACQUIRE, TRACE_RELEASE, UNKNOWN_TASK
+
+# Resources created with a name, see resource_stats()
+_named_resources = {}
+# Number of resources created, each one identifies itself in the loop's trace by its creation order
+_resource_count = 0
+
+
+def resource_stats():
+    """Returns the contention statistics of every named ManagedResource, keyed by name, see ManagedResource.stats"""
+    return {name: resource.stats() for name, resource in _named_resources.items()}
 
 
 class ManagedResource:
     """
     Manages a singleton resource with your functions that initialize a resource and clean it up between uses.
 
-    This class vends access to `resource` via a fair queue.  Intended use is with something like a busio.SPI
-    with on_acquire setting a chip select pin and on_release resetting that pin.
+    This class vends access to `resource` via a priority queue, first come first served among tasks of the same
+    priority.  Intended use is with something like a busio.SPI with on_acquire setting a chip select pin and
+    on_release resetting that pin.
+
+    The task holding the resource inherits the priority of the highest priority waiter until it releases the
+    resource, so a low priority holder can't be held off by medium priority tasks while a high priority task
+    waits for it. A holder of several resources runs at the priority of the most urgent waiter of any of them,
+    and goes back to its base priority, see Loop.set_priority, once it released them all. Inheritance is not
+    transitive through a holder waiting on another resource. It changes nothing under SCHEDULE_EDF, whose ready
+    queue orders tasks by deadline and only breaks ties by priority.
+
+    Every handle counts its acquisitions and how long it waited for and held the resource, see stats().
+    When the loop traces, acquisitions and releases are recorded with the resource's trace_id.
 
     A ManagedResource instance should be shared among all users of `resource`.
     """
@@ -16,51 +40,143 @@ class ManagedResource:
         resource,
         on_acquire=lambda *args, **kwargs: None,
         on_release=lambda *args, **kwargs: None,
-        loop=tasko.get_loop(),
+        loop=None,
+        name=None,
     ):
         """
         :param resource: The resource you want to manage access to (e.g., a busio.SPI)
         :param on_acquire: function(*args, **kwargs) => void  acquires your singleton resource (CS pin low or something)
         :param on_release: function(*args, **kwargs) => void  releases your singleton resource (CS pin high or something)
+        :param loop: The loop of the tasks using the resource, tasko's loop by default
+        :param name: Reports the statistics of this resource under this name in resource_stats()
         """
+        if loop is None:
+            loop = get_loop()
         self._resource = resource
         self._on_acquire = on_acquire
         self._on_release = on_release
         self._loop = loop
+        # (task, resume_fn) of the waiters, highest priority first
         self._ownership_queue = []
         self._owned = False
+        # The Task holding the resource
+        self._owner = None
+        self._handles = []
+        self.peak_queue_depth = 0
+        global _resource_count
+        self.trace_id = _resource_count
+        _resource_count += 1
+        if name is not None:
+            _named_resources[name] = self
 
-    def handle(self, *args, **kwargs):
+    def handle(self, *args, name=None, **kwargs):
         """
         returns a reusable, reentrant handle to the managed resource.
         args and kwargs are passed to on_acquire and on_release functions you provided with the resource.
+        :param name: Key of the handle's statistics in stats(), "handle<n>" by default.
         """
-        return Handle(self, args, kwargs)
+        if name is None:
+            name = "handle{}".format(len(self._handles))
+        handle = Handle(self, name, args, kwargs)
+        self._handles.append(handle)
+        return handle
+
+    def stats(self):
+        """
+        Returns the contention statistics of every handle, keyed by handle name.
+
+        For each handle: the number of acquisitions, the time spent holding and waiting for the resource as
+        TimingStats dicts (nanoseconds, with total and max) and the deepest waiter queue it joined.
+        """
+        return {handle.name: handle.stats() for handle in self._handles}
+
+    def reset_stats(self):
+        self.peak_queue_depth = 0
+        for handle in self._handles:
+            handle.reset_stats()
 
-    async def _aenter(self, args, kwargs):
+    async def _aenter(self, handle):
+        args = handle._args
+        kwargs = handle._kwargs
+        task = self._loop._current
+        wait_start_nanos = _loop._monotonic_ns()
         if self._owned:
-            # queue up for access to the resource later
+            # queue up for access to the resource later, behind the waiters of higher or equal priority
+            queue = self._ownership_queue
+            i = 0
+            while i < len(queue) and queue[i][0].priority <= task.priority:
+                i += 1
             await_handle, resume_fn = self._loop.suspend()
-            self._ownership_queue.append(resume_fn)
+            queue.insert(i, (task, resume_fn))
+            owner = self._owner
+            if owner is not None and task.priority < owner.priority:
+                # The holder runs at the priority of its most urgent waiter until it releases
+                self._loop.update_priority(owner)
+            depth = len(queue)
+            if depth > handle.peak_queue_depth:
+                handle.peak_queue_depth = depth
+                if depth > self.peak_queue_depth:
+                    self.peak_queue_depth = depth
             # This leverages the suspend() feature in tasko; this current coroutine is not considered again until
             # the owning job is complete and __aexit__s below.  This keeps waiting handles as cheap as possible.
             await await_handle
-        self._owned = True
+            # _aexit made this task the owner when handing the resource over
+        else:
+            self._owned = True
+            self._hold(task)
         self._on_acquire(*args, **kwargs)
+        handle._acquired_nanos = _loop._monotonic_ns()
+        handle.wait.record(handle._acquired_nanos - wait_start_nanos)
+        self._trace(TRACE_ACQUIRE, task, handle._acquired_nanos)
         return self._resource
 
-    async def _aexit(self, args, kwargs):
+    async def _aexit(self, handle):
         assert (
             self._owned
         ), "Exited from a context where a managed resource was not owned"
-        self._on_release(*args, **kwargs)
-        if len(self._ownership_queue) > 0:
-            resume_fn = self._ownership_queue.pop(0)
+        self._on_release(*handle._args, **handle._kwargs)
+        released_nanos = _loop._monotonic_ns()
+        handle.hold.record(released_nanos - handle._acquired_nanos)
+        owner = self._owner
+        self._trace(TRACE_RELEASE, owner, released_nanos)
+        self._owner = None
+        if owner is not None:
+            owner.held_resources.remove(self)
+        self._hand_over()
+        if owner is not None:
+            # Back to its base priority, or what the waiters of the resources it still holds need
+            self._loop.update_priority(owner)
+
+    def _hand_over(self):
+        while len(self._ownership_queue) > 0:
+            task, resume_fn = self._ownership_queue.pop(0)
             # Note that the awaiter has already passed the ownership check.
             # By not resetting to unowned here we avoid unfair resource starvation in certain code constructs.
-            resume_fn()
-        else:
-            self._owned = False
+            if resume_fn():
+                # Owner right away, so waiters arriving before it runs raise its priority
+                self._hold(task)
+                self._loop.update_priority(task)
+                return
+            # The waiter was cancelled, hand the resource to the next one
+        self._owned = False
+
+    def _hold(self, task):
+        self._owner = task
+        if task is not None:
+            task.held_resources.append(self)
+
+    def waiting_priority(self):
+        """Returns the priority of the most urgent task waiting for the resource, None if none waits"""
+        for task, resume_fn in self._ownership_queue:
+            if not task.done:
+                return task.priority
+        return None
+
+    def _trace(self, event, task, now_nanos):
+        trace = self._loop.trace
+        if trace is not None:
+            task_id = UNKNOWN_TASK if task is None else task.trace_id
+            trace.record(event, task_id, self.trace_id, now_nanos)
 
 
 class Handle:
@@ -68,18 +184,37 @@ class Handle:
     For binding resource initialization/teardown args to a resource.
     """
 
-    def __init__(self, managed_resource, args, kwargs):
+    def __init__(self, managed_resource, name, args, kwargs):
         self._managed_resource = managed_resource
+        self.name = name
         self._args = args
         self._kwargs = kwargs
         self.active = False
+        # Contention statistics, see stats()
+        self.hold = TimingStats()
+        self.wait = TimingStats()
+        self.peak_queue_depth = 0
+        self._acquired_nanos = 0
+
+    def stats(self):
+        return {
+            "acquisitions": self.wait.count,
+            "hold": self.hold.as_dict(),
+            "wait": self.wait.as_dict(),
+            "peak_queue_depth": self.peak_queue_depth,
+        }
+
+    def reset_stats(self):
+        self.hold.reset()
+        self.wait.reset()
+        self.peak_queue_depth = 0
 
     async def __aenter__(self):
-        resource = await self._managed_resource._aenter(self._args, self._kwargs)
+        resource = await self._managed_resource._aenter(self)
         self.active = True
         return resource
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        resource = await self._managed_resource._aexit(self._args, self._kwargs)
+        resource = await self._managed_resource._aexit(self)
         self.active = False
         return resource
@@ -1,27 +1,56 @@
 from .managed_resource import ManagedResource
-import tasko
+
+
+def _lock(spi_bus):
+    while not spi_bus.try_lock():
+        pass
 
 
 class ManagedSpi:
-    def __init__(self, spi_bus, loop=tasko.get_loop()):
+    def __init__(self, spi_bus, loop=None, name=None):
         """
         Vends access to an SPI bus via chip select leases.
+
+        :param name: Reports the bus statistics under this name in tasko.managed_resource.resource_stats()
         """
+        self._spi_bus = spi_bus
         self._resource = ManagedResource(
             spi_bus,
             on_acquire=self._acquire_spi,
             on_release=self._release_spi,
             loop=loop,
+            name=name,
         )
         self._handles = {}
+        # (baudrate, polarity, phase) the bus was last configured with by this manager
+        self._configuration = None
+        self.reconfigurations = 0
 
-    def _acquire_spi(self, chip_select):
-        chip_select.value = False
+    def _acquire_spi(self, chip_select, configuration=None):
+        if configuration is not None and configuration != self._configuration:
+            # Only reconfigure when the previous owner ran the bus differently
+            baudrate, polarity, phase = configuration
+            _lock(self._spi_bus)
+            try:
+                self._spi_bus.configure(
+                    baudrate=baudrate, polarity=polarity, phase=phase
+                )
+            finally:
+                self._spi_bus.unlock()
+            self._configuration = configuration
+            self.reconfigurations += 1
+        if chip_select is not None:
+            chip_select.value = False
 
-    def _release_spi(self, chip_select):
-        chip_select.value = True
+    def _release_spi(self, chip_select, configuration=None):
+        if chip_select is not None:
+            chip_select.value = True
 
-    def cs_handle(self, chip_select):
+    def forget_configuration(self):
+        """Call after something else reconfigured the bus, so the next handle applies its settings again"""
+        self._configuration = None
+
+    def cs_handle(self, chip_select, name=None, baudrate=None, polarity=0, phase=0):
         """
         pass in a digitalio.DigitalInOut chip select.
         This will be pulled low when a SpiHandle acquires the bus.
@@ -33,12 +62,76 @@ class ManagedSpi:
         spi bus - without coordinating between them. Only await the hande for each task's turn with the bus.
 
         You need to:
-          * configure the bus to work with your devices
-          * configure the chip select pins as outputs
+          * configure the chip select pins as outputs, or pass None if the device driver drives its own
 
         You get:
           * non-blocking, awaitable access to an SPI
+          * the bus configured with baudrate, polarity and phase when the handle acquires it, if a baudrate
+            is given and the previous owner used other settings
+          * how often and how long the device waited for and held the bus, under `name` in stats()
         """
-        chip_select.value = True
-        spi_handle = self._resource.handle(chip_select=chip_select)
+        configuration = None
+        if baudrate is not None:
+            configuration = (baudrate, polarity, phase)
+        if chip_select is not None:
+            chip_select.value = True
+        spi_handle = self._resource.handle(
+            chip_select=chip_select, configuration=configuration, name=name
+        )
+        self._handles[spi_handle.name] = spi_handle
         return spi_handle
+
+    def batch(self, handle):
+        """Returns an SpiBatch queuing transactions for the device of `handle`"""
+        return SpiBatch(handle)
+
+    def stats(self):
+        """Returns the bus contention statistics of every chip select handle, see ManagedResource.stats"""
+        return self._resource.stats()
+
+
+class SpiBatch:
+    """
+    Short transactions for one device, run back to back under a single acquisition of the bus.
+
+    The bus is configured, locked and the chip select asserted once for the whole batch instead of once per
+    transaction, and the other devices only queue for the bus once.
+
+      batch = managed_spi.batch(radio_spi)
+      batch.write(header)
+      batch.readinto(status)
+      await batch.run()
+    """
+
+    def __init__(self, handle):
+        self._handle = handle
+        self._transactions = []
+
+    def __len__(self):
+        return len(self._transactions)
+
+    def add(self, method, *args, **kwargs):
+        """Queues a call of the busio.SPI method named `method`"""
+        self._transactions.append((method, args, kwargs))
+
+    def write(self, buffer, **kwargs):
+        self.add("write", buffer, **kwargs)
+
+    def readinto(self, buffer, **kwargs):
+        self.add("readinto", buffer, **kwargs)
+
+    def write_readinto(self, buffer_out, buffer_in, **kwargs):
+        self.add("write_readinto", buffer_out, buffer_in, **kwargs)
+
+    async def run(self):
+        """Acquires the bus, runs the queued transactions in order and returns how many ran"""
+        transactions = self._transactions
+        self._transactions = []
+        async with self._handle as spi_bus:
+            _lock(spi_bus)
+            try:
+                for method, args, kwargs in transactions:
+                    getattr(spi_bus, method)(*args, **kwargs)
+            finally:
+                spi_bus.unlock()
+        return len(transactions)
@@ -0,0 +1,106 @@
+"""
+Response-time analysis of a set of periodic tasks on the tasko loop.
+
+The loop is cooperative, so a task that starts running keeps the CPU until it awaits. A task released
+while another runs can therefore be blocked by a lower priority task, then delayed by every task of
+higher or equal priority released before it starts. This is the non-preemptive fixed priority model:
+
+    w = B + sum over higher or equal priority tasks j of (floor(w / T_j) + 1) * C_j
+    R = w + C
+
+C is the worst-case execution time of a task, T its period and B the blocking term. B is the longest
+execution time among the lower priority tasks, or the task's own one if that is longer, to cover an
+activation pushed back by its previous one. The test is sufficient: every task whose worst-case
+response time R fits in its period meets its rate. It ignores the scheduler's own overhead.
+"""
+
+
+def analyze_state(tasks, wcets):
+    """
+    Computes the worst-case response time of every task of a state.
+
+    :param tasks: The "Tasks" of a SM_CONFIGURATION state, a task's "WCET" key overrides its wcets entry.
+    :param wcets: {task name: worst-case execution time in seconds}, ValueError if a task has none.
+    :returns {task name: {"period", "wcet", "blocking", "response", "schedulable"}}, times in seconds.
+             The response time is None when it grows past the period.
+    """
+    return analyze_tasks(
+        (name, props["Frequency"], props["Priority"], _wcet(name, props, wcets))
+        for name, props in tasks.items()
+    )
+
+
+def analyze_tasks(tasks):
+    """
+    Computes the worst-case response time of every task of a task set, see analyze_state.
+
+    :param tasks: (name, frequency, priority, worst-case execution time in seconds) of every task.
+    """
+    entries = [
+        (name, 1 / frequency, priority, wcet)
+        for name, frequency, priority, wcet in tasks
+    ]
+
+    results = {}
+    for name, period, priority, wcet in entries:
+        blocking = wcet
+        interfering = []
+        for other, other_period, other_priority, other_wcet in entries:
+            if other == name:
+                continue
+            if other_priority > priority:
+                blocking = max(blocking, other_wcet)
+            else:
+                interfering.append((other_period, other_wcet))
+
+        response = _response_time(period, wcet, blocking, interfering)
+        results[name] = {
+            "period": period,
+            "wcet": wcet,
+            "blocking": blocking,
+            "response": response,
+            "schedulable": response is not None,
+        }
+    return results
+
+
+def _wcet(name, props, wcets):
+    wcet = props.get("WCET", wcets.get(name))
+    if wcet is None:
+        # Leaving the task out would let an overloaded state pass
+        raise ValueError("Task {} has no worst-case execution time".format(name))
+    return wcet
+
+
+def _response_time(period, wcet, blocking, interfering):
+    # Start from one activation of every interfering task and iterate to the fixed point
+    start = blocking
+    for other_period, other_wcet in interfering:
+        start += other_wcet
+    while start + wcet <= period:
+        waited = blocking
+        for other_period, other_wcet in interfering:
+            waited += (int(start // other_period) + 1) * other_wcet
+        if waited == start:
+            return start + wcet
+        start = waited
+    return None
+
+
+def utilization(tasks, wcets):
+    """Returns the fraction of the CPU the tasks of a state need, going by their worst-case execution times"""
+    total = 0
+    for name, props in tasks.items():
+        total += props["Frequency"] * _wcet(name, props, wcets)
+    return total
+
+
+def unschedulable(config, wcets):
+    """Returns the (state, task name) pairs of SM_CONFIGURATION whose response time can exceed their period"""
+    failures = []
+    for state, state_config in config.items():
+        results = analyze_state(state_config["Tasks"], wcets)
+        for name, result in results.items():
+            if not result["schedulable"]:
+                failures.append((state, name))
+    return failures
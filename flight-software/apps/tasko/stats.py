@@ -0,0 +1,70 @@
+# Number of histogram buckets. Bucket 0 counts durations below HISTOGRAM_FIRST_NANOS and every
+# following bucket is 4x wider than the previous one; the last bucket also counts everything above.
+HISTOGRAM_BUCKETS = 10
+HISTOGRAM_FIRST_NANOS = 16000  # 16us .. 4.2s over 10 buckets
+
+# Lower bound of every bucket after the first. The upper ones don't fit a small int on the board,
+# computing them on each record() would allocate.
+_BUCKET_LIMITS = tuple(
+    HISTOGRAM_FIRST_NANOS << (2 * i) for i in range(HISTOGRAM_BUCKETS - 1)
+)
+
+
+class TimingStats:
+    """
+    Fixed-size accumulator for nanosecond durations.
+
+    Keeps the count, min, max, total (for the mean) and a small log-scale histogram.
+    Recording a sample never grows any container, so it is safe to call from the scheduler on every invocation.
+    """
+
+    def __init__(self):
+        self.histogram = [0] * HISTOGRAM_BUCKETS
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+        for i in range(HISTOGRAM_BUCKETS):
+            self.histogram[i] = 0
+
+    def record(self, nanos):
+        if nanos < 0:
+            nanos = 0
+        if self.count == 0 or nanos < self.min:
+            self.min = nanos
+        if nanos > self.max:
+            self.max = nanos
+        self.count += 1
+        self.total += nanos
+
+        bucket = 0
+        for limit in _BUCKET_LIMITS:
+            if nanos < limit:
+                break
+            bucket += 1
+        self.histogram[bucket] += 1
+
+    def mean(self):
+        if self.count == 0:
+            return 0
+        return self.total / self.count
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.mean(),
+            "histogram": list(self.histogram),
+        }
+
+    def __repr__(self):
+        return "{{TimingStats n: {}, min: {}, mean: {:.0f}, max: {} }}".format(
+            self.count, self.min, self.mean(), self.max
+        )
+
+    __str__ = __repr__
@@ -1,7 +1,8 @@
 from unittest import TestCase
 
+from tasko.managed_resource import resource_stats
 from tasko.managed_spi import ManagedSpi
-from tasko import Loop
+from tasko import Loop, use_real_clock, use_simulated_clock
 
 
 # This is a terrible pattern, used only for tests
@@ -16,6 +17,38 @@ class FakeDigitalIO:
         self.value = False
 
 
+class FakeSpi:
+    def __init__(self):
+        self.locked = False
+        self.configurations = []
+        self.transactions = []
+        self.chip_select = None
+
+    def try_lock(self):
+        if self.locked:
+            return False
+        self.locked = True
+        return True
+
+    def unlock(self):
+        self.locked = False
+
+    def configure(self, baudrate=100000, polarity=0, phase=0):
+        assert self.locked
+        self.configurations.append((baudrate, polarity, phase))
+
+    def _transfer(self, name):
+        assert self.locked
+        # The chip select value seen during the transfer, False when asserted
+        self.transactions.append((name, self.chip_select.value))
+
+    def write(self, buffer, start=0, end=None):
+        self._transfer("write")
+
+    def readinto(self, buffer, start=0, end=None, write_value=0):
+        self._transfer("readinto")
+
+
 class TestManagedSpi(TestCase):
     def test_acquire(self):
         loop = Loop()
@@ -72,9 +105,9 @@ class TestManagedSpi(TestCase):
                 await YieldOne()
 
         # Add the top level application coroutines
-        loop.add_task(read_sdcard())
-        loop.add_task(read_sensor())
-        loop.add_task(update_screen())
+        loop.add_task(read_sdcard(), 1)
+        loop.add_task(read_sensor(), 1)
+        loop.add_task(update_screen(), 1)
 
         # would just use tasko.add_task() and tasko.run() but for test let's manually step it through
         # loop.run()
@@ -102,3 +135,91 @@ class TestManagedSpi(TestCase):
         self.assertTrue(did_sensor)
         self.assertTrue(did_screen)
         self.assertTrue(did_read)
+
+    def test_stats(self):
+        clock = use_simulated_clock()
+        try:
+            loop = Loop()
+            managed_spi = ManagedSpi("board.SPI", loop=loop, name="test bus")
+            sdcard_spi = managed_spi.cs_handle(FakeDigitalIO("D1"), name="SD")
+            radio_spi = managed_spi.cs_handle(FakeDigitalIO("D2"), name="RADIO")
+            sensor_spi = managed_spi.cs_handle(FakeDigitalIO("D3"))
+
+            async def use(handle, hold_seconds):
+                async with handle:
+                    await YieldOne()
+                    clock.advance(hold_seconds)
+
+            loop.add_task(use(sdcard_spi, 0.01), 1)
+            loop.add_task(use(radio_spi, 0.002), 1)
+            loop.add_task(use(sensor_spi, 0.001), 1)
+            for _ in range(6):
+                loop._step()
+
+            stats = managed_spi.stats()
+            self.assertEqual(["SD", "RADIO", "handle2"], list(stats))
+            self.assertEqual(1, stats["SD"]["acquisitions"])
+            self.assertEqual(10000000, stats["SD"]["hold"]["max"])
+            self.assertEqual(0, stats["SD"]["wait"]["total"])
+            # The radio waited for the SD card, the sensor for both
+            self.assertEqual(10000000, stats["RADIO"]["wait"]["max"])
+            self.assertEqual(12000000, stats["handle2"]["wait"]["total"])
+            self.assertEqual(2, stats["handle2"]["peak_queue_depth"])
+            self.assertEqual(stats, resource_stats()["test bus"])
+        finally:
+            use_real_clock()
+
+    def test_configuration(self):
+        loop = Loop()
+        spi_bus = FakeSpi()
+        managed_spi = ManagedSpi(spi_bus, loop=loop)
+        sdcard_spi = managed_spi.cs_handle(FakeDigitalIO("D1"), baudrate=4000000)
+        radio_spi = managed_spi.cs_handle(FakeDigitalIO("D2"), baudrate=1320000)
+        other_sdcard_spi = managed_spi.cs_handle(FakeDigitalIO("D3"), baudrate=4000000)
+
+        async def use(*handles):
+            for handle in handles:
+                async with handle:
+                    pass
+
+        loop.add_task(use(sdcard_spi, sdcard_spi, other_sdcard_spi), 1)
+        loop._step()
+        self.assertEqual([(4000000, 0, 0)], spi_bus.configurations)
+
+        loop.add_task(use(radio_spi, sdcard_spi), 1)
+        loop._step()
+        self.assertEqual(
+            [(4000000, 0, 0), (1320000, 0, 0), (4000000, 0, 0)],
+            spi_bus.configurations,
+        )
+        self.assertEqual(3, managed_spi.reconfigurations)
+        self.assertFalse(spi_bus.locked)
+
+    def test_batch(self):
+        loop = Loop()
+        spi_bus = FakeSpi()
+        managed_spi = ManagedSpi(spi_bus, loop=loop)
+        chip_select = FakeDigitalIO("D1")
+        radio_spi = managed_spi.cs_handle(chip_select, name="RADIO", baudrate=1320000)
+        spi_bus.chip_select = chip_select
+
+        batch = managed_spi.batch(radio_spi)
+        batch.write(b"\x01")
+        batch.readinto(bytearray(2))
+        batch.write(b"\x02", start=0, end=1)
+        self.assertEqual(3, len(batch))
+
+        async def send():
+            self.assertEqual(3, await batch.run())
+
+        loop.add_task(send(), 1)
+        loop._step()
+
+        self.assertEqual(
+            [("write", False), ("readinto", False), ("write", False)],
+            spi_bus.transactions,
+        )
+        self.assertTrue(chip_select.value)
+        self.assertFalse(spi_bus.locked)
+        self.assertEqual(0, len(batch))
+        self.assertEqual(1, managed_spi.stats()["RADIO"]["acquisitions"])
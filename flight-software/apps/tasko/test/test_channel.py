@@ -0,0 +1,61 @@
+from unittest import TestCase
+
+from tasko.channel import Channel
+from tasko import Loop, use_real_clock, use_simulated_clock
+
+
+class TestChannel(TestCase):
+    def test_nowait(self):
+        channel = Channel(2, loop=Loop())
+        self.assertTrue(channel.put_nowait(1))
+        self.assertTrue(channel.put_nowait(2))
+        self.assertFalse(channel.put_nowait(3))
+        self.assertEqual(1, channel.get_nowait())
+        self.assertTrue(channel.put_nowait(4))
+        self.assertEqual([2, 4], [channel.get_nowait(), channel.get_nowait()])
+        self.assertRaises(IndexError, channel.get_nowait)
+        self.assertEqual(
+            {"capacity": 2, "length": 0, "high_water": 2, "drops": 1}, channel.stats()
+        )
+
+    def test_backpressure(self):
+        loop = Loop()
+        channel = Channel(2, loop=loop)
+        received = []
+
+        async def producer():
+            for i in range(5):
+                await channel.put(i)
+
+        async def consumer():
+            while len(received) < 5:
+                received.append(await channel.get())
+                await loop.sleep(0)
+
+        loop.add_task(producer(), 1)
+        loop._step()
+        self.assertEqual(2, len(channel), "producer blocks once the channel is full")
+
+        loop.add_task(consumer(), 2)
+        loop.run()
+        self.assertEqual([0, 1, 2, 3, 4], received)
+        self.assertEqual(0, channel.drops)
+        self.assertEqual(2, channel.high_water)
+
+    def test_put_timeout(self):
+        use_simulated_clock()
+        try:
+            loop = Loop()
+            channel = Channel(1, loop=loop)
+            results = []
+
+            async def producer():
+                results.append(await channel.put(1, timeout=1))
+                results.append(await channel.put(2, timeout=1))
+
+            loop.add_task(producer(), 1)
+            loop.run()
+            self.assertEqual([True, False], results)
+            self.assertEqual(1, channel.drops)
+        finally:
+            use_real_clock()
@@ -0,0 +1,91 @@
+from unittest import TestCase
+
+from tasko import CyclicExecutive, Loop, use_real_clock, use_simulated_clock
+
+
+class TestCyclicExecutive(TestCase):
+    def test_compile(self):
+        # NOMINAL frequencies: 6hz minor frames, 2s major frame
+        executive = CyclicExecutive(Loop())
+        noop = lambda: None
+        monitor = executive.add(2, noop, 2)
+        timing = executive.add(1.5, noop, 2)
+        obdh = executive.add(1, noop, 3)
+        imu = executive.add(1, noop, 1)
+
+        self.assertEqual(12, executive.compile())
+        self.assertEqual([3, 4, 6, 6], [t.stride for t in (monitor, timing, obdh, imu)])
+        self.assertEqual((imu, monitor, timing, obdh), executive._frames[0])
+        self.assertEqual((monitor,), executive._frames[3])
+        self.assertEqual((timing,), executive._frames[4])
+        self.assertEqual((), executive._frames[1])
+
+        executive = CyclicExecutive(Loop())
+        executive.add(1, noop, 1)
+        executive.add(0.999, noop, 1)
+        self.assertRaises(ValueError, executive.compile)
+
+    def test_dispatch(self):
+        clock = use_simulated_clock()
+        try:
+            loop = Loop()
+            executive = CyclicExecutive(loop)
+            runs = []
+
+            def record(name):
+                async def run():
+                    runs.append((clock.now_nanos, name))
+
+                return run
+
+            executive.add(4, record("fast"), 1)
+            executive.add(1, record("slow"), 2)
+            executive.add(2, record("later"), 3, later=True)
+            executive.start()
+            while clock.now_nanos <= 1000000000:
+                loop._step()
+
+            self.assertEqual(
+                [
+                    (0, "fast"),
+                    (0, "slow"),
+                    (250000000, "fast"),
+                    (500000000, "fast"),
+                    (500000000, "later"),
+                    (750000000, "fast"),
+                    (1000000000, "fast"),
+                    (1000000000, "slow"),
+                    (1000000000, "later"),
+                ],
+                runs,
+            )
+            self.assertEqual(1, executive.major_frames)
+        finally:
+            use_real_clock()
+
+    def test_frame_overrun(self):
+        clock = use_simulated_clock()
+        try:
+            loop = Loop()
+            executive = CyclicExecutive(loop)
+            runs = []
+
+            async def slow():
+                runs.append(clock.now_nanos)
+                if len(runs) == 1:
+                    clock.advance(0.3)  # Runs until the start of the 300ms frame
+
+            executive.add(10, slow, 1)
+            executive.start()
+            while clock.now_nanos <= 500000000:
+                loop._step()
+
+            self.assertEqual([0, 400000000, 500000000], runs[:3])
+            self.assertEqual(1, executive.frame_overruns)
+            self.assertEqual(3, executive.skipped_frames)
+
+            executive.cancel()
+            loop._step()
+            self.assertEqual(0, len(loop._sleeping))
+        finally:
+            use_real_clock()
@@ -0,0 +1,67 @@
+from unittest import TestCase
+
+from tasko.edf import DeadlineQueue
+from tasko.loop import NO_DEADLINE, Task
+from tasko import (
+    SCHEDULE_EDF,
+    Loop,
+    use_real_clock,
+    use_simulated_clock,
+    utilization,
+)
+
+
+class TestEdf(TestCase):
+    def test_deadline_queue(self):
+        queue = DeadlineQueue()
+        tasks = []
+        for name, priority, deadline in [
+            ("a", 1, NO_DEADLINE),
+            ("b", 5, 300),
+            ("c", 5, 100),
+            ("d", 2, 300),
+            ("e", 1, 200),
+            ("f", 1, NO_DEADLINE),
+        ]:
+            task = Task(name, priority)
+            task.deadline_nanos = deadline
+            tasks.append(task)
+            queue.push(task)
+        self.assertEqual(6, len(queue))
+
+        queue.remove(tasks[4])
+        self.assertEqual(
+            ["c", "d", "b", "a", "f"], [queue.pop().coroutine for _ in range(5)]
+        )
+        self.assertEqual(0, len(queue))
+
+    def test_earliest_deadline_runs_first(self):
+        clock = use_simulated_clock()
+        try:
+            loop = Loop(policy=SCHEDULE_EDF)
+            runs = []
+
+            def record(name):
+                async def run():
+                    runs.append((clock.now_nanos, name))
+
+                return run
+
+            # The 20hz task has the lowest priority but always has the earlier deadline
+            loop.schedule(1, record("slow"), 1)
+            loop.schedule(20, record("fast"), 5)
+            while clock.now_nanos <= 1000000000:
+                loop._step()
+
+            self.assertEqual([(0, "fast"), (0, "slow")], runs[:2])
+            self.assertEqual((1000000000, "fast"), runs[-2])
+            self.assertEqual((1000000000, "slow"), runs[-1])
+        finally:
+            use_real_clock()
+
+    def test_unknown_policy(self):
+        self.assertRaises(ValueError, Loop, policy="FIFO")
+
+    def test_utilization(self):
+        self.assertEqual(0, utilization([]))
+        self.assertAlmostEqual(0.45, utilization([(20, 10000000), (1, 250000000)]))
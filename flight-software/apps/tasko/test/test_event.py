@@ -0,0 +1,106 @@
+from unittest import TestCase
+
+from tasko.event import Event
+from tasko import Loop, use_real_clock, use_simulated_clock
+
+
+class TestEvent(TestCase):
+    def test_set_wakes_waiters(self):
+        loop = Loop()
+        event = Event(loop=loop)
+        results = []
+
+        async def waiter(name):
+            results.append((name, await event.wait()))
+
+        async def setter():
+            await loop.sleep(0)
+            event.set()
+
+        loop.add_task(waiter("a"), 1)
+        loop.add_task(waiter("b"), 2)
+        loop._step()
+        self.assertEqual(0, len(loop._tasks), "waiters are suspended")
+
+        loop.add_task(setter(), 1)
+        loop._step()  # setter sleeps
+        loop._step()  # setter sets the event
+        loop._step()  # waiters run
+        self.assertEqual([("a", True), ("b", True)], results)
+
+    def test_timeout(self):
+        clock = use_simulated_clock()
+        try:
+            loop = Loop()
+            event = Event(loop=loop)
+            results = []
+
+            async def waiter():
+                results.append(await event.wait(timeout=2))
+                results.append(clock.monotonic_ns())
+
+            loop.add_task(waiter(), 1)
+            loop.run()
+            self.assertEqual([False, 2000000000], results)
+            self.assertEqual([], event._waiters)
+        finally:
+            use_real_clock()
+
+    def test_poll(self):
+        clock = use_simulated_clock()
+        try:
+            loop = Loop()
+            event = Event(loop=loop)
+            pin = False
+            results = []
+
+            async def waiter():
+                event.poll(lambda: pin)
+                results.append(await event.wait(timeout=10))
+                results.append(clock.monotonic_ns())
+
+            async def toggle():
+                nonlocal pin
+                await loop.sleep(0.5)
+                pin = True
+
+            loop.add_task(waiter(), 1)
+            loop.add_task(toggle(), 1)
+            loop.run()
+            self.assertTrue(results[0], "set by the poller before the timeout")
+            self.assertLess(results[1], 600000000)
+            self.assertEqual([], loop._pollers, "setting disarms the poller")
+            self.assertEqual(0, len(loop._sleeping), "timeout sleeper was removed")
+        finally:
+            use_real_clock()
+
+    def test_poll_error(self):
+        clock = use_simulated_clock()
+        try:
+            loop = Loop()
+            event = Event(loop=loop)
+            results = []
+
+            def read_flag():
+                raise OSError("SPI read failed")
+
+            async def waiter():
+                event.poll(read_flag)
+                try:
+                    await event.wait(timeout=10)
+                except OSError as e:
+                    results.append(str(e))
+                results.append(event.is_set())
+
+            async def other():
+                await loop.sleep(1)
+                results.append("other ran")
+
+            loop.add_task(waiter(), 1)
+            loop.add_task(other(), 1)
+            loop.run()
+            self.assertEqual(["SPI read failed", True, "other ran"], results)
+            self.assertEqual([], loop._pollers, "the failing poller was disarmed")
+            self.assertEqual(0, len(loop._sleeping), "timeout sleeper was removed")
+        finally:
+            use_real_clock()
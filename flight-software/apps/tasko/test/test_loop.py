@@ -1,25 +1,48 @@
-from tasko.loop import _yield_once, set_time_provider
+from tasko.loop import (
+    BUDGET_CANCEL,
+    BUDGET_DEMOTE,
+    BUDGET_REPORT,
+    OVERRUN_CATCH_UP,
+    OVERRUN_COALESCE,
+    OVERRUN_SKIP,
+    _yield_once,
+    set_time_provider,
+    ReadyQueue,
+    Sleeper,
+    SleeperHeap,
+    Task,
+    use_real_clock,
+    use_simulated_clock,
+)
+import gc
+import os
 import time
+import tracemalloc
 from unittest import TestCase
 
 from tasko import Loop
+from tasko.stats import TimingStats
+import tasko.loop as loop_module
 
 
 class TestLoop(TestCase):
+    def new_loop(self, debug=False):
+        return Loop(debug=debug)
+
     def test_add_task(self):
-        loop = Loop()
+        loop = self.new_loop()
         ran = False
 
         async def foo():
             nonlocal ran
             ran = True
 
-        loop.add_task(foo())
+        loop.add_task(foo(), 1)
         loop._step()
         self.assertTrue(ran)
 
     def test_sleep(self):
-        loop = Loop()
+        loop = self.new_loop()
         complete = False
 
         async def foo():
@@ -27,7 +50,7 @@ class TestLoop(TestCase):
             await loop.sleep(0.1)
             complete = True
 
-        loop.add_task(foo())
+        loop.add_task(foo(), 1)
         start = time.monotonic()
         while not complete and time.monotonic() - start < 1:
             loop._step()
@@ -42,14 +65,14 @@ class TestLoop(TestCase):
 
         set_time_provider(nanos)
         try:
-            loop = Loop()
+            loop = self.new_loop()
             run_count = 0
 
             async def foo():
                 nonlocal run_count
                 run_count += 1
 
-            scheduled_task = loop.schedule(1000000000, foo)
+            scheduled_task = loop.schedule(1000000000, foo, 1)
 
             now = 2
             self.assertEqual(0, run_count, "did not run before step")
@@ -93,7 +116,7 @@ class TestLoop(TestCase):
         # 98 tasks => 15khz throughput tested.
         #   Works reliably on macbook pro; microcontroller throughput will be.. somewhat less.
 
-        loop = Loop(debug=False)
+        loop = self.new_loop(debug=False)
         duration = 1  # Seconds to run the scheduler. (try with 10s if you suspect scheduler drift)
         tasks = 96  # How many tasks (higher indexes count faster. 96th task => 293hz)
 
@@ -105,8 +128,10 @@ class TestLoop(TestCase):
 
             counters.append(0)
 
-            loop.schedule(3 * (i + 1) + 5, f, i)
+            loop.schedule(3 * (i + 1) + 5, f, 1, i)
 
+        # Don't let garbage left over by earlier tests pause the loop for whole periods
+        gc.collect()
         start = time.monotonic()
         while time.monotonic() - start < duration:
             loop._step()
@@ -125,7 +150,7 @@ class TestLoop(TestCase):
         control_ticks = 0
         deferred_ticks = 0
         deferred_ticked = False
-        loop = Loop(debug=False)
+        loop = self.new_loop(debug=False)
 
         async def deferred_task():
             nonlocal deferred_ticked, deferred_ticks
@@ -136,8 +161,8 @@ class TestLoop(TestCase):
             nonlocal control_ticks
             control_ticks = control_ticks + 1
 
-        loop.schedule(100, control_ticker)
-        loop.schedule_later(10, deferred_task)
+        loop.schedule(100, control_ticker, 1)
+        loop.schedule_later(10, deferred_task, 1)
 
         while True:
             loop._step()
@@ -147,8 +172,150 @@ class TestLoop(TestCase):
         self.assertEqual(deferred_ticks, 1)
         self.assertAlmostEqual(control_ticks, 10, delta=2)
 
+    def test_phase(self):
+        clock = use_simulated_clock()
+        try:
+            loop = self.new_loop()
+            runs = []
+
+            def record(name):
+                async def run():
+                    runs.append((clock.now_nanos, name))
+
+                return run
+
+            loop.schedule(1, record("a"), 1)
+            loop.schedule(1, record("b"), 1).set_phase(0.25)
+            loop.schedule(2, record("c"), 1).set_phase(0.5)
+            while clock.now_nanos <= 1500000000:
+                loop._step()
+
+            self.assertEqual(
+                [
+                    (0, "a"),
+                    (250000000, "b"),
+                    (500000000, "c"),
+                    (1000000000, "a"),
+                    (1000000000, "c"),
+                    (1250000000, "b"),
+                    (1500000000, "c"),
+                ],
+                runs,
+            )
+        finally:
+            use_real_clock()
+
+    def test_rephase(self):
+        clock = use_simulated_clock()
+        try:
+            loop = self.new_loop()
+            runs = []
+
+            async def a():
+                runs.append((clock.now_nanos, "a"))
+                if clock.now_nanos == 1000000000:
+                    # Rephased while running, and b while due in the same step, from the same origin
+                    a_task.set_phase(0.5, clock.now_nanos)
+                    b_task.set_phase(0.25, clock.now_nanos)
+
+            async def b():
+                runs.append((clock.now_nanos, "b"))
+
+            a_task = loop.schedule(1, a, 1)
+            b_task = loop.schedule(1, b, 2)
+            while clock.now_nanos <= 2500000000:
+                loop._step()
+
+            self.assertEqual(
+                [
+                    (0, "a"),
+                    (0, "b"),
+                    (1000000000, "a"),
+                    (1000000000, "b"),
+                    (1250000000, "b"),
+                    (1500000000, "a"),
+                    (2250000000, "b"),
+                    (2500000000, "a"),
+                ],
+                runs,
+            )
+        finally:
+            use_real_clock()
+
+    def test_integer_targets(self):
+        clock = use_simulated_clock()
+        try:
+            loop = self.new_loop()
+
+            async def noop():
+                pass
+
+            scheduled_task = loop.schedule(3, noop, 1)
+            scheduled_task.set_phase(0.1)
+            for _ in range(10):
+                loop._step()
+
+            # Whole nanoseconds, so the targets don't turn into floats on every period
+            self.assertEqual(333333333, scheduled_task._nanoseconds_per_invocation)
+            self.assertIsInstance(scheduled_task._target_nanos, int)
+            self.assertIsInstance(scheduled_task._task.deadline_nanos, int)
+            self.assertEqual(100000000 + 9 * 333333333, clock.now_nanos)
+        finally:
+            use_real_clock()
+
+    def test_steady_state_allocations(self):
+        clock = use_simulated_clock()
+        try:
+            loop = self.new_loop()
+
+            async def sleeper(seconds):
+                while True:
+                    await loop.sleep(seconds)
+
+            async def yielder():
+                while True:
+                    await _yield_once()
+
+            tasks = [loop.add_task(sleeper(0.001 * i), i) for i in range(1, 4)]
+            loop.add_task(yielder(), 5)
+            loop._step()
+            sleepers = [task._sleeper for task in tasks]
+
+            # Sleeping reuses each task's records, and once settled the loop keeps nothing new
+            tasko_dir = os.path.dirname(loop_module.__file__)
+            filters = [
+                tracemalloc.Filter(True, tasko_dir + "*"),
+                tracemalloc.Filter(False, os.path.join(tasko_dir, "test", "*")),
+            ]
+            step_peaks = []
+            tracemalloc.start()
+            try:
+                for _ in range(1000):
+                    loop._step()
+                    clock.advance(0.001)
+                before = tracemalloc.take_snapshot().filter_traces(filters)
+                for _ in range(1000):
+                    start_bytes = tracemalloc.get_traced_memory()[0]
+                    tracemalloc.reset_peak()
+                    loop._step()
+                    step_peaks.append(tracemalloc.get_traced_memory()[1] - start_bytes)
+                    clock.advance(0.001)
+                after = tracemalloc.take_snapshot().filter_traces(filters)
+            finally:
+                tracemalloc.stop()
+
+            self.assertEqual(sleepers, [task._sleeper_record for task in tasks])
+            # Integers the loop replaces can move between lines and change size by a digit, but nothing accumulates
+            growth = after.compare_to(before, "lineno")
+            self.assertLess(sum(stat.size_diff for stat in growth), 100, growth)
+            # What a step allocates at all is transient and bounded: on CPython every integer above 256,
+            # and the StopIteration ending each resumed await
+            self.assertLess(max(step_peaks), 400, step_peaks)
+        finally:
+            use_real_clock()
+
     def test_run_later(self):
-        loop = Loop()
+        loop = self.new_loop()
         count = 0
 
         async def run_later():
@@ -157,7 +324,7 @@ class TestLoop(TestCase):
                 count = count + 1
                 await _yield_once()  # For testing
 
-        loop.run_later(seconds_to_delay=0.1, awaitable_task=run_later())
+        loop.run_later(seconds_to_delay=0.1, awaitable_task=run_later(), priority=1)
 
         self.assertEqual(
             0, count, "count should not increment upon coroutine instantiation"
@@ -170,3 +337,339 @@ class TestLoop(TestCase):
         time.sleep(0.1)  # Make sure enough time has passed for step to pick up the task
         loop._step()
         self.assertEqual(1, count, "count should increment once per step")
+
+    def test_sleeper_heap_order(self):
+        heap = SleeperHeap()
+        for resume_nanos, priority in [(5, 1), (3, 2), (3, 1), (9, 0), (1, 4)]:
+            heap.push(Sleeper(resume_nanos, Task(None, priority)))
+
+        self.assertEqual(1, heap.peek().resume_nanos())
+
+        ready = heap.pop_ready(4, ReadyQueue())
+        self.assertEqual(
+            [1, 2, 4],
+            [x.priority for x in ready],
+            "due sleepers are queued by priority",
+        )
+        self.assertEqual(2, len(heap))
+        self.assertEqual(5, heap.peek().resume_nanos())
+
+    def test_ready_queue(self):
+        queue = ReadyQueue()
+        tasks = [
+            Task(name, priority)
+            for name, priority in [("a", 3), ("b", 1), ("c", 3), ("d", 40), ("e", 1)]
+        ]
+        for task in tasks:
+            queue.push(task)
+        self.assertEqual(5, len(queue))
+
+        queue.remove(tasks[2])
+        self.assertEqual(
+            ["b", "e", "a", "d"], [queue.pop().coroutine for _ in range(4)]
+        )
+        self.assertEqual(0, len(queue))
+
+    def test_stats(self):
+        now = 0
+
+        def nanos():
+            nonlocal now
+            return now
+
+        set_time_provider(nanos)
+        try:
+            loop = self.new_loop()
+
+            async def slow():
+                nonlocal now
+                now += 25  # Takes 2.5 periods to run
+
+            scheduled_task = loop.schedule(100000000, slow, 1)  # 10ns period
+            loop._step()
+            loop._step()
+
+            state = loop.stats()[scheduled_task]
+            self.assertEqual(2, state["invocations"])
+            self.assertEqual(25, state["runtime"]["max"])
+            self.assertEqual(2, state["runtime"]["histogram"][0])
+            self.assertEqual(0, state["lateness"]["min"])
+            self.assertEqual(2 * 2, state["missed_periods"])
+
+            scheduled_task.stop()
+            loop._step()
+            self.assertEqual({}, loop.stats(), "stopped tasks are dropped")
+        finally:
+            set_time_provider(time.monotonic_ns)
+
+    def test_histogram(self):
+        stats = TimingStats()
+        for nanos in (15999, 16000, 64000, 1024000000, 4096000000, 10**12):
+            stats.record(nanos)
+        self.assertEqual([1, 1, 1, 0, 0, 0, 0, 0, 1, 2], stats.histogram)
+
+    def test_simulated_clock(self):
+        clock = use_simulated_clock()
+        try:
+            loop = self.new_loop()
+            wakeups = []
+
+            async def foo():
+                for _ in range(3):
+                    await loop.sleep(3600)
+                    wakeups.append(clock.monotonic_ns())
+
+            loop.add_task(foo(), 1)
+            start = time.monotonic()
+            loop.run()
+            self.assertLess(time.monotonic() - start, 1, "slept in virtual time")
+            self.assertEqual([3600000000000 * i for i in range(1, 4)], wakeups)
+        finally:
+            use_real_clock()
+
+    def test_bounded_runs(self):
+        clock = use_simulated_clock()
+        try:
+            loop = self.new_loop()
+            runs = []
+
+            async def record():
+                runs.append(clock.now_nanos)
+
+            loop.schedule(10, record, 1)
+
+            # Doesn't sleep past the deadline, though the next activation is later
+            self.assertTrue(loop.run_for(0.25))
+            self.assertEqual(250000000, clock.now_nanos)
+            self.assertEqual([0, 100000000, 200000000], runs)
+
+            self.assertTrue(loop.run_until(lambda: len(runs) == 5))
+            self.assertEqual(400000000, runs[-1])
+
+            # Each step runs the task, then sleeps until its next activation
+            self.assertEqual(2, loop.step(2))
+            self.assertEqual(600000000, runs[-1])
+
+            # Nothing left to run
+            scheduled = list(loop.stats())[0]
+            scheduled.cancel()
+            self.assertEqual(0, loop.step(3))
+            self.assertFalse(loop.run_for(1))
+            self.assertFalse(loop.run_until(lambda: False))
+        finally:
+            use_real_clock()
+
+    def test_overrun_policy(self):
+        now = 0
+
+        def nanos():
+            nonlocal now
+            return now
+
+        set_time_provider(nanos)
+        try:
+            # policy: (start times, late activations, skipped activations)
+            expected = {
+                OVERRUN_COALESCE: ([0, 40, 45], 1, 2),
+                OVERRUN_SKIP: ([0, 40, 50], 0, 3),
+                OVERRUN_CATCH_UP: ([0, 40, 45, 50], 3, 1),
+            }
+            for policy, (starts, late, skipped) in expected.items():
+                now = 0
+                loop = self.new_loop()
+                runs = []
+
+                async def foo():
+                    nonlocal now
+                    runs.append(now)
+                    if len(runs) == 1:
+                        now += 35  # Overrun the 10ns period by 3.5 periods
+
+                scheduled_task = loop.schedule(100000000, foo, 1)
+                scheduled_task.set_overrun_policy(policy, max_burst=2)
+                while now <= 50:
+                    loop._step()
+                    now += 5
+
+                self.assertEqual(starts, runs[: len(starts)], policy)
+                self.assertEqual(late, scheduled_task.late_activations, policy)
+                self.assertEqual(skipped, scheduled_task.skipped_activations, policy)
+        finally:
+            set_time_provider(time.monotonic_ns)
+
+    def test_budget(self):
+        now = 0
+
+        def nanos():
+            nonlocal now
+            return now
+
+        set_time_provider(nanos)
+        try:
+            for action in [BUDGET_REPORT, BUDGET_DEMOTE, BUDGET_CANCEL]:
+                now = 0
+                loop = self.new_loop()
+                reported = []
+                finished = False
+                runs = 0
+
+                async def slow():
+                    nonlocal now, runs, finished
+                    runs += 1
+                    try:
+                        now += 20  # 2x the budget
+                    finally:
+                        finished = True
+
+                loop.set_budget_handler(reported.append)
+                scheduled_task = loop.schedule(10000000, slow, 3)  # 100ns period
+                scheduled_task.set_budget(10e-9, action, strikes=2)
+                while now < 500:
+                    loop._step()
+                    now += 10
+
+                task = scheduled_task._task
+                if action == BUDGET_CANCEL:
+                    self.assertEqual(2, runs, action)
+                    self.assertTrue(task.done and task.cancelled, action)
+                    self.assertTrue(finished, action)
+                    self.assertEqual({}, loop.stats(), action)
+                else:
+                    self.assertEqual(5, runs, action)
+                    self.assertEqual(5, task.budget_overruns, action)
+                    demotions = 2 if action == BUDGET_DEMOTE else 0
+                    self.assertEqual(3 + demotions, task.priority, action)
+                self.assertEqual(len(reported), runs // 2, action)
+                self.assertIs(reported[0], task, action)
+        finally:
+            set_time_provider(time.monotonic_ns)
+
+    def test_cancel(self):
+        loop = self.new_loop()
+        cleaned_up = []
+
+        async def sleeper(name):
+            try:
+                await loop.sleep(3600)
+            finally:
+                cleaned_up.append(name)
+
+        async def yielder(name):
+            try:
+                while True:
+                    await _yield_once()
+            finally:
+                cleaned_up.append(name)
+
+        sleeping = loop.add_task(sleeper("sleeping"), 1)
+        ready = loop.add_task(yielder("ready"), 1)
+        scheduled = loop.schedule(0.001, sleeper, 1, "scheduled")
+        loop._step()
+        self.assertEqual(2, len(loop._sleeping))
+        self.assertEqual(1, len(loop._tasks))
+
+        loop.cancel(sleeping)
+        loop.cancel(ready)
+        self.assertEqual(["sleeping", "ready"], cleaned_up, "finally blocks ran")
+        self.assertEqual(1, len(loop._sleeping), "sleeper removed right away")
+        self.assertEqual(0, len(loop._tasks), "ready entry removed right away")
+
+        scheduled.cancel()
+        self.assertEqual(["sleeping", "ready", "scheduled"], cleaned_up)
+        self.assertEqual(0, len(loop._sleeping))
+        self.assertEqual({}, loop.stats())
+
+    def test_cancel_self(self):
+        loop = self.new_loop()
+        runs = 0
+
+        async def foo():
+            nonlocal runs
+            runs += 1
+            scheduled_task.cancel()
+
+        scheduled_task = loop.schedule(1000, foo, 1)
+        loop._step()
+        self.assertEqual(1, runs)
+        self.assertEqual(0, len(loop._sleeping), "cancelled as soon as it suspended")
+        self.assertEqual(0, len(loop._tasks))
+
+    def test_cancel_from_task(self):
+        use_simulated_clock()
+        try:
+            loop = self.new_loop()
+            cleaned_up = []
+            woke = False
+
+            async def victim(name):
+                try:
+                    await loop.sleep(3600)
+                finally:
+                    cleaned_up.append(name)
+
+            async def canceller():
+                nonlocal woke
+                loop.cancel(victim_task)
+                await loop.sleep(0)
+                woke = True
+
+            victim_task = loop.add_task(victim("victim"), 1)
+            loop._step()
+            loop.add_task(canceller(), 1)
+            loop._step()
+            self.assertEqual(["victim"], cleaned_up)
+            self.assertTrue(victim_task.done)
+            loop._step()
+            self.assertTrue(woke, "the cancelling task could still sleep")
+        finally:
+            use_real_clock()
+
+    def test_cancel_others_then_self(self):
+        loop = self.new_loop()
+        cleaned_up = []
+        runs = 0
+
+        async def other():
+            try:
+                await loop.sleep(3600)
+            finally:
+                cleaned_up.append("other")
+
+        async def switcher():
+            nonlocal runs
+            runs += 1
+            try:
+                # Like a state switch dropping its own task along with others
+                others.cancel()
+                switching.cancel()
+                await loop.sleep(0)
+            finally:
+                cleaned_up.append("switcher")
+
+        others = loop.schedule(0.001, other, 1)
+        switching = loop.schedule(1000, switcher, 1)
+        loop._step()
+        self.assertEqual(1, runs)
+        self.assertEqual(["other", "switcher"], cleaned_up)
+        self.assertEqual(0, len(loop._sleeping))
+        self.assertEqual(0, len(loop._tasks))
+        self.assertEqual({}, loop.stats())
+
+    def test_global_loop(self):
+        import tasko
+        from tasko.timing_wheel import TimingWheel
+
+        try:
+            with self.assertRaises(ValueError):
+                tasko.get_loop(policy=tasko.SCHEDULE_EDF)
+            with self.assertRaises(ValueError):
+                tasko.get_loop(timing_wheel=True)
+
+            loop = tasko.new_loop(timing_wheel=True, policy=tasko.SCHEDULE_EDF)
+            self.assertIs(loop, tasko.get_loop(timing_wheel=True))
+            self.assertIs(loop, tasko.get_loop(policy=tasko.SCHEDULE_EDF))
+            self.assertIsInstance(loop._sleeping, TimingWheel)
+            self.assertEqual(loop.schedule, tasko.schedule)
+            self.assertEqual(loop.sleep, tasko.sleep)
+        finally:
+            tasko.new_loop()
@@ -49,8 +49,8 @@ class TestManagedResource(TestCase):
                 self.assertTrue(spi.active_cs is not None)
             await YieldOne()  # after context
 
-        loop.add_task(test_fn(handle_cs1))
-        loop.add_task(test_fn(handle_cs2))
+        loop.add_task(test_fn(handle_cs1), 1)
+        loop.add_task(test_fn(handle_cs2), 1)
 
         loop._step()  # 1 Enter fn      2 Enter fn
         loop._step()  # 1 acquire-work  2 suspend
@@ -77,4 +77,124 @@ class TestManagedResource(TestCase):
         self.assertEqual(len(loop._tasks), 1)  # 2 is unfinished
 
         loop._step()  # 2 end
-        self.assertEqual(loop._tasks, [])  # 2 is finished
+        self.assertEqual(len(loop._tasks), 0)  # 2 is finished
+
+    def test_cancelled_waiter(self):
+        loop = Loop()
+        spi = Resource()
+        managed_spi = ManagedResource(spi, spi.acquire, spi.release, loop=loop)
+        acquired = []
+
+        async def test_fn(cs):
+            async with managed_spi.handle(chip_select=cs):
+                acquired.append(cs)
+                await YieldOne()
+
+        loop.add_task(test_fn(1), 1)
+        waiter = loop.add_task(test_fn(2), 1)
+        loop.add_task(test_fn(3), 1)
+        loop._step()  # 1 acquires, 2 and 3 wait
+        loop.cancel(waiter)
+
+        loop._step()  # 1 releases to 3, skipping the cancelled 2
+        loop._step()  # 3 works
+        self.assertEqual([1, 3], acquired)
+        self.assertIs(spi.active_cs, 3)
+
+    def test_priority_inheritance(self):
+        loop = Loop()
+        spi = Resource()
+        managed_spi = ManagedResource(spi, spi.acquire, spi.release, loop=loop)
+        acquired = []
+        order = []
+
+        async def user(cs, hold_steps):
+            async with managed_spi.handle(chip_select=cs):
+                acquired.append(cs)
+                for _ in range(hold_steps):
+                    order.append(cs)
+                    await YieldOne()
+
+        async def busy():
+            while True:
+                order.append("busy")
+                await YieldOne()
+
+        low = loop.add_task(user("low", 3), 5)
+        loop._step()  # low acquires
+        loop.add_task(busy(), 3)
+        loop.add_task(user("mid", 1), 4)
+        high = loop.add_task(user("high", 1), 1)
+        loop._step()  # high and mid queue up behind low, high first
+
+        # low holds the bus for high, so it runs ahead of the busy task
+        self.assertEqual(1, low.priority)
+        del order[:]
+        loop._step()
+        self.assertEqual(["low", "busy"], order)
+
+        loop._step()  # low releases to high, ahead of mid
+        self.assertEqual(5, low.priority)
+        loop._step()  # high works
+        loop._step()  # high releases to mid
+        loop._step()  # mid works
+        self.assertEqual(["low", "high", "mid"], acquired)
+        self.assertEqual(1, high.priority)
+
+    def test_priority_change_while_holding(self):
+        loop = Loop()
+        spi = Resource()
+        managed_spi = ManagedResource(spi, spi.acquire, spi.release, loop=loop)
+
+        async def user():
+            async with managed_spi.handle(chip_select="user"):
+                await YieldOne()
+
+        task = loop.add_task(user(), 5)
+        loop._step()  # acquires
+        # Like a state switch or a budget demotion while the resource is held
+        loop.set_priority(task, 3)
+        loop._step()  # releases
+        self.assertTrue(task.done)
+        self.assertEqual(3, task.priority)
+        self.assertEqual(3, task.base_priority)
+
+    def test_nested_inheritance(self):
+        loop = Loop()
+        outer_spi = Resource()
+        inner_spi = Resource()
+        outer = ManagedResource(
+            outer_spi, outer_spi.acquire, outer_spi.release, loop=loop
+        )
+        inner = ManagedResource(
+            inner_spi, inner_spi.acquire, inner_spi.release, loop=loop
+        )
+
+        async def holder():
+            async with outer.handle(chip_select="holder"):
+                async with inner.handle(chip_select="holder"):
+                    await YieldOne()
+                    await YieldOne()
+                await YieldOne()
+                await YieldOne()
+
+        async def user(resource, name):
+            async with resource.handle(chip_select=name):
+                pass
+
+        low = loop.add_task(holder(), 5)
+        loop._step()  # low holds both
+        loop.add_task(user(outer, "high"), 1)
+        loop.add_task(user(inner, "mid"), 3)
+        loop._step()  # high waits for outer, mid for inner
+        self.assertEqual(1, low.priority)
+
+        loop._step()  # low releases inner to mid, still holding outer for high
+        self.assertIs(inner_spi.active_cs, None)
+        self.assertEqual(1, low.priority)
+        self.assertEqual([outer], low.held_resources)
+
+        loop._step()
+        loop._step()  # low releases outer
+        self.assertEqual(5, low.priority)
+        self.assertEqual([], low.held_resources)
@@ -0,0 +1,51 @@
+from unittest import TestCase
+
+from tasko.schedulability import analyze_state, unschedulable, utilization
+
+
+def task(hz, priority):
+    return {"Frequency": hz, "Priority": priority, "ScheduleLater": False}
+
+
+class TestSchedulability(TestCase):
+    def test_response_times(self):
+        tasks = {"fast": task(4, 1), "mid": task(2, 2), "slow": task(1, 3)}
+        wcets = {"fast": 0.01, "mid": 0.05, "slow": 0.2}
+        results = analyze_state(tasks, wcets)
+
+        # fast: blocked by slow, then runs
+        self.assertAlmostEqual(0.2, results["fast"]["blocking"])
+        self.assertAlmostEqual(0.21, results["fast"]["response"])
+        # mid: blocked by slow and one fast activation
+        self.assertAlmostEqual(0.26, results["mid"]["response"])
+        # slow: its own previous activation, fast released twice and mid once before it starts
+        self.assertAlmostEqual(0.47, results["slow"]["response"])
+        self.assertTrue(all(r["schedulable"] for r in results.values()))
+        self.assertAlmostEqual(0.34, utilization(tasks, wcets))
+
+    def test_overload(self):
+        tasks = {"fast": task(10, 1), "slow": task(1, 2)}
+        wcets = {"fast": 0.05, "slow": 0.2}
+        results = analyze_state(tasks, wcets)
+
+        # The slow task blocks the fast one for more than its period
+        self.assertFalse(results["fast"]["schedulable"])
+        self.assertIsNone(results["fast"]["response"])
+        self.assertEqual(
+            [("OVERLOADED", "fast"), ("OVERLOADED", "slow")],
+            unschedulable(
+                {"OVERLOADED": {"Tasks": tasks}, "IDLE": {"Tasks": {}}},
+                {"fast": 0.05, "slow": 0.6},
+            ),
+        )
+
+    def test_missing_wcet(self):
+        tasks = {"fast": task(10, 1), "unknown": task(5, 1)}
+        with self.assertRaises(ValueError):
+            analyze_state(tasks, {"fast": 0.01})
+        with self.assertRaises(ValueError):
+            utilization(tasks, {"fast": 0.01})
+
+        # A per-state "WCET" stands in for the missing entry
+        tasks["unknown"]["WCET"] = 0.01
+        self.assertTrue(analyze_state(tasks, {"fast": 0.01})["unknown"]["schedulable"])
@@ -0,0 +1,54 @@
+import random
+from unittest import TestCase
+
+import test_loop
+from tasko.loop import ReadyQueue, Sleeper, SleeperHeap, Task
+from tasko.timing_wheel import TimingWheel
+from tasko import Loop, use_real_clock, use_simulated_clock
+
+
+class TestTimingWheelLoop(test_loop.TestLoop):
+    """Runs the whole loop suite with sleepers kept in a TimingWheel"""
+
+    def new_loop(self, debug=False):
+        return Loop(debug=debug, sleepers=TimingWheel())
+
+
+class TestTimingWheel(TestCase):
+    def test_matches_heap(self):
+        # Sleepers spread from sub-tick to overflow distances wake up in the same steps as with the heap.
+        clock = use_simulated_clock()
+        try:
+            rng = random.Random(7)
+            wheel = TimingWheel()
+            heap = SleeperHeap()
+            pending = {}
+            for i in range(300):
+                resume_nanos = rng.choice([10, 10**6, 10**9, 10**12, 10**14])
+                resume_nanos = rng.randrange(resume_nanos)
+                for sleepers in (wheel, heap):
+                    sleeper = Sleeper(resume_nanos, Task(i, 1))
+                    sleepers.push(sleeper)
+                    pending[(id(sleepers), i)] = sleeper
+
+            # Remove some sleepers from the middle of both structures
+            for i in range(0, 300, 7):
+                for sleepers in (wheel, heap):
+                    sleepers.remove(pending[(id(sleepers), i)])
+            self.assertEqual(len(heap), len(wheel))
+
+            while len(heap):
+                now = heap.next_resume_nanos()
+                self.assertEqual(now, wheel.next_resume_nanos())
+                from_heap = sorted(
+                    t.coroutine for t in heap.pop_ready(now, ReadyQueue())
+                )
+                from_wheel = sorted(
+                    t.coroutine for t in wheel.pop_ready(now, ReadyQueue())
+                )
+                self.assertEqual(from_heap, from_wheel)
+                clock.now_nanos = now
+            self.assertEqual(0, len(wheel))
+            self.assertIsNone(wheel.next_resume_nanos())
+        finally:
+            use_real_clock()
@@ -0,0 +1,80 @@
+import io
+from unittest import TestCase
+
+from tasko.managed_resource import ManagedResource
+from tasko.trace import (
+    TRACE_ACQUIRE,
+    TRACE_DONE,
+    TRACE_RELEASE,
+    TRACE_RUN,
+    TRACE_SLEEP,
+    TRACE_WAKE,
+    TRACE_YIELD,
+    TraceBuffer,
+    decode,
+)
+from tasko import Loop, use_real_clock, use_simulated_clock
+
+
+class TestTrace(TestCase):
+    def test_ring_buffer(self):
+        trace = TraceBuffer(3)
+        self.assertEqual([], trace.records())
+        for i in range(5):
+            trace.record(TRACE_RUN, i, 0, 1000000 + i * 2500)
+        self.assertEqual(5, trace.count)
+        self.assertEqual(3, len(trace))
+
+        # The oldest records were overwritten, times are rounded to the microsecond
+        self.assertEqual(
+            [
+                (1005000, TRACE_RUN, 2, 0),
+                (1007000, TRACE_RUN, 3, 0),
+                (1010000, TRACE_RUN, 4, 0),
+            ],
+            trace.records(),
+        )
+
+        stream = io.BytesIO()
+        self.assertEqual(3, trace.dump(stream))
+        self.assertEqual(trace.records(), decode(stream.getvalue()))
+        self.assertRaises(ValueError, decode, stream.getvalue()[:-1])
+        self.assertRaises(ValueError, decode, b"JUNK" + stream.getvalue()[4:])
+
+        trace.clear()
+        self.assertEqual(0, len(trace))
+
+    def test_loop_events(self):
+        clock = use_simulated_clock()
+        try:
+            trace = TraceBuffer()
+            loop = Loop(trace=trace)
+            resource = ManagedResource(None, loop=loop)
+            handle = resource.handle()
+
+            async def work():
+                async with handle:
+                    clock.advance(0.002)
+
+            scheduled = loop.schedule(10, work, 1)
+            scheduled.set_trace_id(3)
+            loop._step()
+            loop._step()
+
+            self.assertEqual(
+                [
+                    (0, TRACE_RUN, 3, 0),
+                    (0, TRACE_ACQUIRE, 3, resource.trace_id),
+                    (2000000, TRACE_RELEASE, 3, resource.trace_id),
+                    (2000000, TRACE_SLEEP, 3, 0),
+                    (2000000, TRACE_YIELD, 3, 0),
+                    (100000000, TRACE_WAKE, 3, 0),
+                    (100000000, TRACE_RUN, 3, 0),
+                ],
+                trace.records()[:7],
+            )
+
+            scheduled.cancel()
+            self.assertEqual(TRACE_DONE, trace.records()[-1][1])
+        finally:
+            use_real_clock()
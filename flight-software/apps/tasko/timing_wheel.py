@@ -0,0 +1,180 @@
+from . import loop as _loop
+
+# Each level of the wheel has 2**_SLOT_BITS slots. Level n slots span 64**n ticks.
+_SLOT_BITS = 6
+_SLOTS = 1 << _SLOT_BITS
+_SLOT_MASK = _SLOTS - 1
+_LEVELS = (
+    4  # 64**4 ticks, ~4.6 hours at 1ms ticks, before sleepers go to the overflow list
+)
+
+# Sleeper._index values outside of the wheel slots
+_DUE = -2
+_OVERFLOW = -3
+
+
+class TimingWheel:
+    """
+    Hierarchical timing wheel of Sleepers, a drop-in replacement for SleeperHeap.
+
+    Time is cut in ticks of tick_nanos. A sleeper goes into the slot of its resume tick on the lowest level
+    whose span still covers it, so inserting is O(1). When the wheel turns past the start of a higher level
+    slot, that slot cascades its sleepers down one level. Expiring a slot moves its sleepers to a short due
+    list that is checked against the exact resume time, so sleepers wake up in the same step as with the heap.
+
+    Turning the wheel jumps straight to the next occupied slot using one occupancy bitmap per level, so long
+    idle sleeps do not walk every tick.
+
+    Select it with tasko.new_loop(timing_wheel=True), or builtins.tasko_timing_wheel = True before importing tasko.
+    """
+
+    def __init__(self, tick_nanos=1000000):
+        self._tick_nanos = tick_nanos
+        self._slots = [[] for _ in range(_LEVELS * _SLOTS)]
+        self._bitmaps = [0] * _LEVELS
+        self._overflow = []
+        # Sleepers of ticks that have passed, waiting for their exact resume time
+        self._due = []
+        self._now_tick = 0
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for sleeper in self._due:
+            yield sleeper
+        for slot in self._slots:
+            for sleeper in slot:
+                yield sleeper
+        for sleeper in self._overflow:
+            yield sleeper
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def push(self, sleeper):
+        if self._len == 0:
+            # Nothing is pending, so nothing depends on the old position of the wheel
+            self._now_tick = _loop._monotonic_ns() // self._tick_nanos
+        self._place(sleeper)
+        self._len += 1
+
+    def remove(self, sleeper):
+        index = sleeper._index
+        sleeper._slot.remove(sleeper)
+        if index >= 0 and not sleeper._slot:
+            self._bitmaps[index >> _SLOT_BITS] &= ~(1 << (index & _SLOT_MASK))
+        sleeper._slot = None
+        sleeper._index = -1
+        self._len -= 1
+
+    def pop_ready(self, now_nanos, ready):
+        """Moves the task of every sleeper due at or before now_nanos into the ready queue"""
+        target = now_nanos // self._tick_nanos
+        while self._now_tick < target:
+            tick, _ = self._next_event()
+            if tick is None or tick > target:
+                self._now_tick = target
+                break
+            self._now_tick = tick
+            self._cascade(tick)
+            self._expire(tick & _SLOT_MASK)
+
+        due = self._due
+        i = 0
+        while i < len(due):
+            sleeper = due[i]
+            if sleeper._resume_nanos <= now_nanos:
+                due[i] = due[-1]
+                due.pop()
+                sleeper._slot = None
+                sleeper._index = -1
+                sleeper.task._sleeper = None
+                self._len -= 1
+                ready.push(sleeper.task)
+            else:
+                i += 1
+        return ready
+
+    def next_resume_nanos(self):
+        """Returns when the next sleeper wakes up, or None if there are no sleepers"""
+        if self._due:
+            candidates = self._due
+        else:
+            _, candidates = self._next_event()
+            if candidates is None:
+                return None
+        earliest = None
+        for sleeper in candidates:
+            if earliest is None or sleeper._resume_nanos < earliest:
+                earliest = sleeper._resume_nanos
+        return earliest
+
+    def _place(self, sleeper):
+        tick = sleeper._resume_nanos // self._tick_nanos
+        now_tick = self._now_tick
+        if tick <= now_tick:
+            sleeper._index = _DUE
+            sleeper._slot = self._due
+            self._due.append(sleeper)
+            return
+        for level in range(_LEVELS):
+            shift = _SLOT_BITS * (level + 1)
+            if tick >> shift == now_tick >> shift:
+                slot = (tick >> (shift - _SLOT_BITS)) & _SLOT_MASK
+                index = (level << _SLOT_BITS) | slot
+                sleeper._index = index
+                sleeper._slot = self._slots[index]
+                sleeper._slot.append(sleeper)
+                self._bitmaps[level] |= 1 << slot
+                return
+        sleeper._index = _OVERFLOW
+        sleeper._slot = self._overflow
+        self._overflow.append(sleeper)
+
+    def _next_event(self):
+        """
+        Finds the next tick after now where a slot expires (level 0) or cascades (higher levels).
+        :returns (tick, sleepers of that slot) or (None, None) if the wheel is empty
+        """
+        now_tick = self._now_tick
+        for level in range(_LEVELS):
+            shift = _SLOT_BITS * level
+            position = (now_tick >> shift) & _SLOT_MASK
+            bits = self._bitmaps[level] >> (position + 1)
+            if bits:
+                offset = 1
+                while not bits & 1:
+                    bits >>= 1
+                    offset += 1
+                tick = ((now_tick >> shift) + offset) << shift
+                return tick, self._slots[(level << _SLOT_BITS) | (position + offset)]
+        if self._overflow:
+            shift = _SLOT_BITS * _LEVELS
+            return ((now_tick >> shift) + 1) << shift, self._overflow
+        return None, None
+
+    def _cascade(self, tick):
+        """Moves the sleepers of every higher level slot starting at tick one level down"""
+        if tick & ((1 << (_SLOT_BITS * _LEVELS)) - 1) == 0:
+            overflow = self._overflow
+            self._overflow = []
+            for sleeper in overflow:
+                self._place(sleeper)
+        for level in range(_LEVELS - 1, 0, -1):
+            shift = _SLOT_BITS * level
+            if tick & ((1 << shift) - 1) == 0:
+                slot = (tick >> shift) & _SLOT_MASK
+                self._take_slot(level, slot)
+
+    def _expire(self, slot):
+        self._take_slot(0, slot)
+
+    def _take_slot(self, level, slot):
+        index = (level << _SLOT_BITS) | slot
+        sleepers = self._slots[index]
+        self._bitmaps[level] &= ~(1 << slot)
+        # Sleepers always land on a lower level or the due list, never back in this slot
+        while sleepers:
+            self._place(sleepers.pop())
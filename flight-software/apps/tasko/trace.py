@@ -0,0 +1,162 @@
+"""
+Binary trace of the scheduler events, to look at the timing on the board without disturbing it.
+
+Printing from the loop (tasko_logging) costs milliseconds per line on the console, which changes the very
+timing it is meant to show. A TraceBuffer instead packs every event into a fixed-size record of a
+preallocated ring buffer, keeping the most recent `capacity` ones:
+
+    uint32  microseconds since the previous record, saturating after 71 minutes
+    uint8   event code, one of the TRACE_* constants
+    uint8   task id, the TASK_MAPPING_ID of sm_configuration.py for the state machine tasks
+    uint16  argument, the resource id of TRACE_ACQUIRE and TRACE_RELEASE
+
+dump() writes the records oldest first behind a header, for instance to the SD card. On a host,
+trace_to_perfetto.py converts a dump to the Chrome trace JSON that ui.perfetto.dev opens.
+"""
+
+import struct
+
+# The loop resumes the task
+TRACE_RUN = 1
+# The task gave control back and is still alive
+TRACE_YIELD = 2
+# The task completed or was cancelled
+TRACE_DONE = 3
+# The task went to sleep
+TRACE_SLEEP = 4
+# A sleeping or suspended task became ready
+TRACE_WAKE = 5
+# The task acquired or released the ManagedResource of id `argument`
+TRACE_ACQUIRE = 6
+TRACE_RELEASE = 7
+
+TRACE_EVENTS = {
+    TRACE_RUN: "run",
+    TRACE_YIELD: "yield",
+    TRACE_DONE: "done",
+    TRACE_SLEEP: "sleep",
+    TRACE_WAKE: "wake",
+    TRACE_ACQUIRE: "acquire",
+    TRACE_RELEASE: "release",
+}
+
+# Task id of the tasks that were not given one, see ScheduledTask.set_trace_id
+UNKNOWN_TASK = 0xFF
+
+RECORD_FORMAT = "<IBBH"
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+_MAX_DELTA = 0xFFFFFFFF
+
+# magic, version, record size, number of records, time of the newest record in nanoseconds
+HEADER_FORMAT = "<4sBBIQ"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+_MAGIC = b"TKTR"
+_VERSION = 1
+
+
+class TraceBuffer:
+    def __init__(self, capacity=1024):
+        """
+        :param capacity: Number of records kept, each takes RECORD_SIZE bytes allocated up front.
+        """
+        self.capacity = capacity
+        self._buffer = bytearray(capacity * RECORD_SIZE)
+        # Byte offset of the next record
+        self._head = 0
+        # Records written since the last clear(), including the overwritten ones
+        self.count = 0
+        self._last_nanos = None
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def clear(self):
+        self._head = 0
+        self.count = 0
+        self._last_nanos = None
+
+    def record(self, event, task_id, argument, now_nanos):
+        """Appends an event, overwriting the oldest record once the buffer is full"""
+        last_nanos = self._last_nanos
+        if last_nanos is None:
+            delta = 0
+            self._last_nanos = now_nanos
+        else:
+            delta = (now_nanos - last_nanos) // 1000
+            if delta < 0:
+                delta = 0
+            elif delta > _MAX_DELTA:
+                delta = _MAX_DELTA
+            # Keep the remainder, so the rounding doesn't add up over many records
+            self._last_nanos = last_nanos + delta * 1000
+        struct.pack_into(
+            RECORD_FORMAT, self._buffer, self._head, delta, event, task_id, argument
+        )
+        self._head += RECORD_SIZE
+        if self._head == len(self._buffer):
+            self._head = 0
+        self.count += 1
+
+    def dump(self, stream):
+        """
+        Writes the header and the records, oldest first, to a binary stream.
+
+        :returns the number of records written
+        """
+        records = len(self)
+        last_nanos = 0 if self._last_nanos is None else self._last_nanos
+        stream.write(
+            struct.pack(
+                HEADER_FORMAT, _MAGIC, _VERSION, RECORD_SIZE, records, last_nanos
+            )
+        )
+        view = memoryview(self._buffer)
+        if self.count > self.capacity:
+            stream.write(view[self._head :])
+        stream.write(view[: self._head])
+        return records
+
+    def save(self, path):
+        """Dumps the records to a file, for instance save("/sd/tasko_trace.bin")"""
+        with open(path, "wb") as f:
+            return self.dump(f)
+
+    def records(self):
+        """Returns the records as decode() does"""
+        import io
+
+        stream = io.BytesIO()
+        self.dump(stream)
+        return decode(stream.getvalue())
+
+
+def decode(data):
+    """
+    Decodes a dump.
+
+    :returns [(nanos, event, task id, argument)] oldest first. The times are those of the clock the loop ran
+             on, rounded to the microsecond.
+    """
+    magic, version, record_size, records, last_nanos = struct.unpack_from(
+        HEADER_FORMAT, data, 0
+    )
+    if magic != _MAGIC or version != _VERSION or record_size != RECORD_SIZE:
+        raise ValueError("Not a tasko trace")
+    if len(data) < HEADER_SIZE + records * RECORD_SIZE:
+        raise ValueError("Truncated tasko trace")
+
+    decoded = []
+    # The delta of the oldest record refers to one that was overwritten, leave it out
+    offset = 0
+    for i in range(records):
+        delta, event, task_id, argument = struct.unpack_from(
+            RECORD_FORMAT, data, HEADER_SIZE + i * RECORD_SIZE
+        )
+        if i:
+            offset += delta * 1000
+        decoded.append((offset, event, task_id, argument))
+    first_nanos = last_nanos - offset
+    return [
+        (first_nanos + nanos, event, task_id, argument)
+        for nanos, event, task_id, argument in decoded
+    ]
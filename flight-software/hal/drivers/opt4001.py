@@ -46,6 +46,7 @@ import time
 from adafruit_bus_device.i2c_device import I2CDevice
 from adafruit_register.i2c_bits import RWBits
 from adafruit_register.i2c_bit import ROBit, RWBit
+from apps.tasko.event import Event
 
 try:
     import typing
@@ -350,6 +351,19 @@ class OPT4001:
 
         return lux
 
+    async def await_conversion(self, timeout=1.1) -> bool:
+        """
+        Waits for the conversion ready flag without blocking other tasks, so that reading
+        lux or result afterwards does not have to poll. Returns False if no conversion
+        completed within timeout seconds.
+        """
+        ready = Event()
+        ready.poll(lambda: self.conversion_ready_flag)
+        try:
+            return await ready.wait(timeout)
+        finally:
+            ready.stop_polling()
+
     def result_of_addr(self, just_lux) -> list:
         """
         Gets Lux value from the result register. returns lux value as a float.
@@ -15,6 +15,7 @@ from random import random
 import digitalio
 from micropython import const
 import adafruit_bus_device.spi_device as spidev
+from apps.tasko.event import Event
 
 # pylint: disable=bad-whitespace
 # Internal constants:
@@ -722,15 +723,15 @@ class RFM9x:
             return (self._read_u8(_RH_RF95_REG_12_IRQ_FLAGS) & 0x40) >> 6
 
     async def await_rx(self, timeout=60):
-        _t = time.monotonic() + timeout
-        while not self.rx_done():
-            if time.monotonic() < _t:
-                yield
-            else:
-                # Timed out
-                return False
-        # Received something
-        return True
+        """Wait for a packet without blocking other tasks.
+        Returns: True if something was received or False after timeout seconds.
+        """
+        rx = Event()
+        rx.poll(self.rx_done)
+        try:
+            return await rx.wait(timeout)
+        finally:
+            rx.stop_polling()
 
     def crc_error(self):
         """crc status"""
@@ -34,6 +34,13 @@ _FLAG = const(16)
 
 SEND_BUFF = bytearray(252)
 
+# SPI clock of each device on the shared bus, also for their tasko.managed_spi handles
+SD_BAUDRATE = 4000000
+RADIO_BAUDRATE = 1320000
+
+# Level of EN_RF that powers the radios: high with the U7 load switch, low with U21
+EN_RF_ACTIVE = True
+
 
 class device:
     """
@@ -137,8 +144,7 @@ class PyCubed:
         _rf_rst1 = digitalio.DigitalInOut(board.RF1_RST)
         self.enable_rf = digitalio.DigitalInOut(board.EN_RF)
         self.radio1_DIO0 = digitalio.DigitalInOut(board.RF1_IO0)
-        # self.enable_rf.switch_to_output(value=False) # if U21
-        self.enable_rf.switch_to_output(value=True)  # if U7
+        self.enable_rf.switch_to_output(value=EN_RF_ACTIVE)
         _rf_cs1.switch_to_output(value=True)
         _rf_rst1.switch_to_output(value=True)
         self.radio1_DIO0.switch_to_input()
@@ -147,7 +153,7 @@ class PyCubed:
         # Failure to do so can prevent the SD card from being recognized until it is powered off or re-inserted.
         try:
             # Baud rate depends on the card, 4MHz should be safe
-            _sd = sdcardio.SDCard(self.spi, board.SD_CS, baudrate=4000000)
+            _sd = sdcardio.SDCard(self.spi, board.SD_CS, baudrate=SD_BAUDRATE)
             _vfs = VfsFat(_sd)
             mount(_vfs, "/sd")
             sys.path.append("/sd")
@@ -209,7 +215,7 @@ class PyCubed:
         # Initialize radio #1 - UHF
         try:
             self.radio1 = rfm9x.RFM9x(
-                self.spi, _rf_cs1, _rf_rst1, 433.0, code_rate=8, baudrate=1320000
+                self.spi, _rf_cs1, _rf_rst1, 433.0, code_rate=8, baudrate=RADIO_BAUDRATE
             )
             # Default LoRa Modulation Settings
             # Frequency: 433 MHz, SF7, BW125kHz, CR4/8, Preamble=8, CRC=True
@@ -369,7 +375,7 @@ class PyCubed:
                 self.radio1.sleep()
             if self.hardware["Radio2"]:
                 self.radio2.sleep()
-            self.enable_rf.value = False
+            self.enable_rf.value = not EN_RF_ACTIVE
             if self.hardware["IMU"]:
                 self.IMU.gyro_powermode = 0x14  # suspend mode
                 self.IMU.accel_powermode = 0x10  # suspend mode
@@ -381,7 +387,7 @@ class PyCubed:
             self.power_mode = "minimum"
 
         elif "norm" in mode:
-            self.enable_rf.value = True
+            self.enable_rf.value = EN_RF_ACTIVE
             if self.hardware["IMU"]:
                 self.reinit("IMU")
             if self.hardware["PWR"]:
@@ -0,0 +1,46 @@
+"""
+Imports modules while recording what the first import of each one cost, to keep boot time and heap in check.
+
+The time is measured with time.monotonic_ns and the heap with gc.mem_free, which only CircuitPython and
+MicroPython have. A module imported by an earlier one is already loaded and costs nothing of its own:
+import the shared modules (hal.pycubed, apps.data_handler) first to see them apart.
+"""
+
+import gc
+import time
+
+# {module name: (nanoseconds, bytes or None)} in import order
+import_costs = {}
+
+_mem_free = getattr(gc, "mem_free", None)
+
+
+def timed_import(name):
+    """Imports a module by its dotted name, like `import name`, and returns it"""
+    if name in import_costs:
+        return __import__(name, None, None, ("*",))
+
+    gc.collect()
+    free_before = _mem_free() if _mem_free else None
+    start_nanos = time.monotonic_ns()
+    # A non-empty fromlist returns the module itself rather than its top-level package
+    module = __import__(name, None, None, ("*",))
+    elapsed_nanos = time.monotonic_ns() - start_nanos
+    used = None
+    if _mem_free:
+        gc.collect()
+        used = free_before - _mem_free()
+    import_costs[name] = (elapsed_nanos, used)
+    return module
+
+
+def print_import_costs():
+    total_nanos = 0
+    total_bytes = 0
+    for name, (nanos, used) in import_costs.items():
+        total_nanos += nanos
+        total_bytes += used or 0
+        heap = "" if used is None else f", {used} bytes"
+        print(f"[IMPORT] {name}: {nanos / 1e6:.1f}ms{heap}")
+    heap = "" if _mem_free is None else f", {total_bytes} bytes"
+    print(f"[IMPORT] {len(import_costs)} modules: {total_nanos / 1e6:.1f}ms{heap}")
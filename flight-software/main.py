@@ -6,7 +6,11 @@ for path in ["/hal", "/apps"]:
 
 
 print("initializing the board...")
-from hal.pycubed import hardware
+from import_cost import timed_import
+
+# The boot report of StateManager.start lists what these and the task modules cost
+timed_import("hal.pycubed")
+timed_import("apps.data_handler")
 from state_manager import state_manager
 
 
@@ -24,3 +28,8 @@ try:
 except Exception as e:
     print(e)
     # TODO Log the error
+    # Keep what the scheduler did last, when tracing with builtins.tasko_trace
+    import apps.tasko as tasko
+
+    if tasko.get_loop().trace is not None:
+        tasko.get_loop().trace.save("/sd/tasko_trace.bin")
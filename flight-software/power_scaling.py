@@ -0,0 +1,118 @@
+"""
+Power-aware scaling of the task rates, see POWER_SCALING in sm_configuration.py.
+
+A RateGovernor turns the battery voltage, the current draw and the solar charging status into a power level,
+from 0 (battery empty) to "Levels" (battery full). The level only moves up once the battery is "Hysteresis"
+volts past the threshold, and down once it is that far below, so a voltage hovering around a threshold doesn't
+flip the rates at every sample. Drawing more than "MaxCurrent" lowers the level by one until the draw falls
+"CurrentHysteresis" mA below it again, and charging from the solar panels raises it by one once the panels
+have charged for "ChargingSamples" samples in a row, and until they haven't for as many.
+
+The tasks with a "MinFrequency" then run between it and their "Frequency", lowest priority first: as the level
+drops, the lowest priority task slows down all the way before the next one starts slowing down.
+"""
+
+
+class RateGovernor:
+    def __init__(self, config):
+        """
+        :param config: POWER_SCALING
+        """
+        self.interval = config["Interval"]
+        self.full_voltage = config["FullVoltage"]
+        self.empty_voltage = config["EmptyVoltage"]
+        self.levels = config["Levels"]
+        self.hysteresis = config.get("Hysteresis", 0)
+        self.max_current = config.get("MaxCurrent")
+        self.current_hysteresis = config.get("CurrentHysteresis", 0)
+        self.charging_samples = config.get("ChargingSamples", 1)
+        if self.full_voltage <= self.empty_voltage:
+            raise ValueError("FullVoltage must be above EmptyVoltage")
+        if self.levels < 1:
+            raise ValueError("Levels must be at least 1")
+        if self.current_hysteresis < 0:
+            raise ValueError("CurrentHysteresis must not be negative")
+        if self.charging_samples < 1:
+            raise ValueError("ChargingSamples must be at least 1")
+        # Start at full rate until the first sample
+        self.level = self.levels
+        self._voltage_level = self.levels
+        self._over_current = False
+        self._charging = False
+        # Samples in a row that disagree with _charging
+        self._charging_streak = 0
+
+    def fraction(self):
+        """Returns how much of the range between "MinFrequency" and "Frequency" the tasks may use, from 0 to 1"""
+        return self.level / self.levels
+
+    def update(self, voltage, current_ma, charging):
+        """
+        Moves the power level after a new sample.
+
+        :param voltage: Battery voltage in volts.
+        :param current_ma: Current drawn from the battery in mA, None if unknown, which keeps the last verdict.
+        :param charging: Whether the solar panels charge the battery.
+        :returns True if the level changed
+        """
+        level = self._level_at(voltage)
+        if level > self._voltage_level:
+            level = max(self._voltage_level, self._level_at(voltage - self.hysteresis))
+        elif level < self._voltage_level:
+            level = min(self._voltage_level, self._level_at(voltage + self.hysteresis))
+        self._voltage_level = level
+
+        if current_ma is not None and self.max_current is not None:
+            if current_ma > self.max_current:
+                self._over_current = True
+            elif current_ma < self.max_current - self.current_hysteresis:
+                self._over_current = False
+
+        if charging == self._charging:
+            self._charging_streak = 0
+        else:
+            self._charging_streak += 1
+            if self._charging_streak >= self.charging_samples:
+                self._charging = charging
+                self._charging_streak = 0
+
+        if self._over_current:
+            level -= 1
+        if self._charging:
+            level += 1
+        level = max(0, min(self.levels, level))
+        changed = level != self.level
+        self.level = level
+        return changed
+
+    def _level_at(self, voltage):
+        fraction = (voltage - self.empty_voltage) / (
+            self.full_voltage - self.empty_voltage
+        )
+        return int(max(0, min(1, fraction)) * self.levels)
+
+
+def scaled_frequencies(tasks, fraction):
+    """
+    Returns the frequency every task with a "MinFrequency" should run at.
+
+    :param tasks: The TaskEntry of a state, see sm_tables.py.
+    :param fraction: RateGovernor.fraction()
+    :returns [(TaskEntry, frequency)]
+    """
+    scaled = sorted(
+        (entry for entry in tasks if entry.min_frequency < entry.frequency),
+        key=lambda entry: -entry.priority,
+    )
+    # Spread the missing power over the tasks, a whole task at a time, lowest priority first
+    deficit = (1 - fraction) * len(scaled)
+    frequencies = []
+    for rank, entry in enumerate(scaled):
+        slowdown = max(0, min(1, deficit - rank))
+        frequencies.append(
+            (
+                entry,
+                entry.frequency - (entry.frequency - entry.min_frequency) * slowdown,
+            )
+        )
+    return frequencies
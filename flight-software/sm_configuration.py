@@ -1,12 +1,70 @@
-from tasks.imu import Task as imu
-from tasks.monitor import Task as monitor
-from tasks.timing import Task as timing
-from tasks.obdh import Task as obdh
+# Module defining the Task class of each task. The StateManager imports a module the first time a state runs
+# its task, so the tasks of states the satellite never reaches take no heap.
+TASK_REGISTRY = {
+    "MONITOR": "tasks.monitor",
+    "TIMING": "tasks.timing",
+    "OBDH": "tasks.obdh",
+    "IMU": "tasks.imu",
+}
 
+TASK_MAPPING_ID = {"MONITOR": 0x00, "TIMING": 0x01, "OBDH": 0x02, "IMU": 0x03}
 
-TASK_REGISTRY = {"MONITOR": monitor, "TIMING": timing, "OBDH": obdh, "IMU": imu}
+# Worst-case execution time of one invocation of each task, in seconds. StateManager.start checks every
+# state can meet its rates with these, see apps/tasko/schedulability.py. Keep them above the "cpu" maximums
+# StateManager.query_state() reports on the flight board; analyze_schedule.py checks other values on a host.
+TASK_WCET = {"MONITOR": 0.01, "TIMING": 0.01, "OBDH": 0.2, "IMU": 0.05}
 
-TASK_MAPPING_ID = {"MONITOR": 0x00, "TIMING": 0x01, "OBDH": 0x02, "IMU": 0x03}
+# Hooks a state can list under "Enters" and "Exit", run when the state machine enters or leaves the state.
+# "Function" is the async function of transition_hooks.py to run. It runs as a tasko task at "Priority" once
+# switch_to has returned, exit hooks first, and is cancelled once it used more than "Budget" seconds of CPU.
+# StateManager.hook_reports keeps how long after the switch each hook completed, until MONITOR prints it.
+TRANSITION_HOOKS = {
+    "print": {"Function": "log_transition", "Priority": 1, "Budget": 0.01},
+    "radio_sleep": {"Function": "radio_sleep", "Priority": 1, "Budget": 0.05},
+    "flush_data": {"Function": "flush_data", "Priority": 2, "Budget": 0.1},
+}
+
+# Scales the rate of the tasks with a "MinFrequency" down as the battery runs low, instead of running them at full
+# rate until the switch to SAFE. MONITOR samples the power, see power_scaling.py.
+#   "Interval": seconds between two power samples
+#   "FullVoltage": battery volts at and above which the tasks run at their "Frequency"
+#   "EmptyVoltage": battery volts at and below which they run at their "MinFrequency"
+#   "Levels": rate steps between the two
+#   "Hysteresis": volts the battery must move past a step before the rates change
+#   "MaxCurrent": mA drawn above which the rates drop one more step
+#   "CurrentHysteresis": mA the draw must fall below "MaxCurrent" before that step comes back
+#   "ChargingSamples": samples in a row the solar charging must start or stop for before it raises the rates one
+#                      step, or stops raising them
+POWER_SCALING = {
+    "Interval": 10,
+    "FullVoltage": 7.6,
+    "EmptyVoltage": 6.8,
+    "Levels": 4,
+    "Hysteresis": 0.05,
+    "MaxCurrent": 500,
+    "CurrentHysteresis": 50,
+    "ChargingSamples": 3,
+}
+
+# StateManager.start compiles SM_CONFIGURATION into integer-indexed tables and refuses unknown task, state or
+# hook names, see sm_tables.py. Task names are those of TASK_MAPPING_ID.
+#
+# Optional per-task keys:
+#   "Overrun": what to do when the task runs past its next period, "COALESCE" (default), "SKIP" or "CATCH_UP"
+#   "MaxBurst": most activations a "CATCH_UP" task keeps pending (default 3)
+#   "MinFrequency": lowest rate the power scaling may slow the task down to, see POWER_SCALING (default "Frequency")
+#   "Budget": CPU time in seconds one invocation may use
+#   "OnOverBudget": "REPORT" (default), "DEMOTE" or "CANCEL" once the budget is exceeded "BudgetStrikes" times in a row
+#   "BudgetStrikes": consecutive over-budget invocations before acting (default 3)
+#   "Phase": seconds to delay every activation by, so tasks of the same rate don't start in the same step
+#   "WCET": worst-case execution time in this state, for a task doing less in it than its TASK_WCET covers
+#
+# Optional per-state keys:
+#   "Scheduler": "DYNAMIC" (default) schedules every task on its own in the tasko loop. "CYCLIC" compiles the
+#                task frequencies into a fixed table of minor frames run by a tasko.CyclicExecutive, the
+#                per-task "Overrun", "Budget" and "Phase" keys do not apply then.
+#   "Phasing": "AUTO" spreads the first activations of the tasks without a "Phase" evenly over the shortest
+#              period of the state, highest priority first.
 
 
 SM_CONFIGURATION = {
@@ -23,18 +81,45 @@ SM_CONFIGURATION = {
     "NOMINAL": {
         "Tasks": {
             "MONITOR": {"Frequency": 2, "Priority": 2, "ScheduleLater": False},
-            "TIMING": {"Frequency": 1.5, "Priority": 2, "ScheduleLater": False},
-            "OBDH": {"Frequency": 1, "Priority": 3, "ScheduleLater": False},
-            "IMU": {"Frequency": 1, "Priority": 5, "ScheduleLater": True},
+            "TIMING": {
+                "Frequency": 1.5,
+                "Priority": 2,
+                "ScheduleLater": False,
+                "Overrun": "SKIP",
+            },
+            "OBDH": {
+                "Frequency": 1,
+                "MinFrequency": 0.5,
+                "Priority": 3,
+                "ScheduleLater": False,
+                "Budget": 0.2,
+                "OnOverBudget": "DEMOTE",
+            },
+            "IMU": {
+                "Frequency": 1,
+                "MinFrequency": 0.2,
+                "Priority": 5,
+                "ScheduleLater": True,
+                "Overrun": "SKIP",
+            },
         },
         "MovesTo": [
             "SAFE",
         ],
+        "Phasing": "AUTO",
     },
     "SAFE": {
         "Tasks": {
-            "Monitor": {"Frequency": 20, "Priority": 1, "ScheduleLater": False},
-            "IMU": {"Frequency": 2, "Priority": 3, "ScheduleLater": False},
+            "MONITOR": {"Frequency": 20, "Priority": 1, "ScheduleLater": False},
+            "IMU": {
+                "Frequency": 2,
+                "MinFrequency": 0.5,
+                "Priority": 3,
+                "ScheduleLater": False,
+                "Overrun": "SKIP",
+                # Only reads the BMX160 in NOMINAL
+                "WCET": 0.005,
+            },
         },
         "MovesTo": ["NOMINAL"],
         "Enters": ["print"],
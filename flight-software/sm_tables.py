@@ -0,0 +1,184 @@
+"""
+Compiles SM_CONFIGURATION into the integer-indexed tables the StateManager runs from.
+
+The configuration is a nested dict keyed by names: easy to edit, but a misspelt task or state name only shows
+once the state machine gets there. compile_configuration checks every name and value once at boot, raising
+ValueError on the first problem, and lays the states out as:
+
+    state ids    the index of each state in the compiled list, in SM_CONFIGURATION order
+    transitions  a bitmask per state, bit j set when the state moves to the state of id j
+    task arrays  the TaskEntry of every task of a state, and the same entries indexed by TASK_MAPPING_ID
+    hooks        the HookEntry of every TRANSITION_HOOKS the state runs when entered and left
+"""
+
+from apps.tasko.loop import (
+    BUDGET_CANCEL,
+    BUDGET_DEMOTE,
+    BUDGET_REPORT,
+    OVERRUN_CATCH_UP,
+    OVERRUN_COALESCE,
+    OVERRUN_SKIP,
+)
+
+SCHEDULER_DYNAMIC = "DYNAMIC"
+SCHEDULER_CYCLIC = "CYCLIC"
+PHASING_AUTO = "AUTO"
+
+
+class TaskEntry:
+    """The settings of one task in one state, with the defaults of the optional keys filled in"""
+
+    def __init__(self, name, task_id, props):
+        self.name = name
+        self.id = task_id
+        self.frequency = props["Frequency"]
+        # Lowest rate the power scaling may slow the task down to, see power_scaling.py
+        self.min_frequency = props.get("MinFrequency", self.frequency)
+        self.priority = props["Priority"]
+        self.schedule_later = props["ScheduleLater"]
+        self.overrun = props.get("Overrun", OVERRUN_COALESCE)
+        self.max_burst = props.get("MaxBurst", 3)
+        # None when the task has no CPU budget
+        self.budget = props.get("Budget")
+        self.on_over_budget = props.get("OnOverBudget", BUDGET_REPORT)
+        self.budget_strikes = props.get("BudgetStrikes", 3)
+        # None when the state picks the phase, see "Phasing"
+        self.phase = props.get("Phase")
+        # None when TASK_WCET gives the worst-case execution time
+        self.wcet = props.get("WCET")
+
+
+class HookEntry:
+    """A transition hook of TRANSITION_HOOKS"""
+
+    def __init__(self, name, props):
+        self.name = name
+        # Name of the async function in transition_hooks.py
+        self.function = props["Function"]
+        self.priority = props["Priority"]
+        # CPU time in seconds the hook may use before it is cancelled
+        self.budget = props["Budget"]
+
+
+class StateEntry:
+    def __init__(
+        self, name, state_id, tasks, task_slots, transitions, enters, exits, props
+    ):
+        self.name = name
+        self.id = state_id
+        # TaskEntry of every task, in configuration order
+        self.tasks = tasks
+        # TaskEntry of every task id, None for the tasks the state doesn't run
+        self.task_slots = task_slots
+        # Bit j is set when the state may move to the state of id j
+        self.transitions = transitions
+        # HookEntry of the hooks run when the state machine enters and leaves the state
+        self.enters = enters
+        self.exits = exits
+        self.cyclic = props.get("Scheduler", SCHEDULER_DYNAMIC) == SCHEDULER_CYCLIC
+        self.auto_phasing = props.get("Phasing") == PHASING_AUTO
+
+    def moves_to(self, state_id):
+        return bool(self.transitions & (1 << state_id))
+
+    def __repr__(self):
+        return "{{State {} {}, {} tasks}}".format(self.id, self.name, len(self.tasks))
+
+
+def compile_configuration(config, task_ids, hooks=None):
+    """
+    :param config: SM_CONFIGURATION
+    :param task_ids: TASK_MAPPING_ID, {task name: small integer id}
+    :param hooks: TRANSITION_HOOKS, None if no state has any
+    :returns (list of StateEntry indexed by state id, {state name: state id})
+    """
+    hook_entries = {}
+    for name, props in (hooks or {}).items():
+        for key in ("Function", "Priority", "Budget"):
+            if key not in props:
+                raise ValueError(f"Hook {name} has no {key}")
+        hook_entries[name] = HookEntry(name, props)
+
+    slots = 0
+    seen = {}
+    for name, task_id in task_ids.items():
+        if task_id in seen:
+            raise ValueError(f"Tasks {seen[task_id]} and {name} have the same id")
+        seen[task_id] = name
+        slots = max(slots, task_id + 1)
+
+    state_ids = {}
+    for state_id, name in enumerate(config.keys()):
+        state_ids[name] = state_id
+
+    states = []
+    for name, props in config.items():
+        for key in ("Tasks", "MovesTo"):
+            if key not in props:
+                raise ValueError(f"State {name} has no {key}")
+        if props.get("Scheduler", SCHEDULER_DYNAMIC) not in (
+            SCHEDULER_DYNAMIC,
+            SCHEDULER_CYCLIC,
+        ):
+            raise ValueError(f"Unknown scheduler {props['Scheduler']} in state {name}")
+        if props.get("Phasing", PHASING_AUTO) != PHASING_AUTO:
+            raise ValueError(f"Unknown phasing {props['Phasing']} in state {name}")
+
+        transitions = 0
+        for target in props["MovesTo"]:
+            if target not in state_ids:
+                raise ValueError(f"State {name} moves to unknown state {target}")
+            transitions |= 1 << state_ids[target]
+
+        tasks = []
+        task_slots = [None] * slots
+        for task_name, task_props in props["Tasks"].items():
+            if task_name not in task_ids:
+                raise ValueError(f"Unknown task {task_name} in state {name}")
+            entry = _compile_task(name, task_name, task_ids[task_name], task_props)
+            tasks.append(entry)
+            task_slots[entry.id] = entry
+
+        enters = _compile_hooks(name, props.get("Enters", ()), hook_entries)
+        exits = _compile_hooks(name, props.get("Exit", ()), hook_entries)
+
+        states.append(
+            StateEntry(
+                name,
+                state_ids[name],
+                tuple(tasks),
+                task_slots,
+                transitions,
+                enters,
+                exits,
+                props,
+            )
+        )
+    return states, state_ids
+
+
+def _compile_hooks(state, names, hook_entries):
+    for name in names:
+        if name not in hook_entries:
+            raise ValueError(f"Unknown transition hook {name} in state {state}")
+    return tuple(hook_entries[name] for name in names)
+
+
+def _compile_task(state, name, task_id, props):
+    for key in ("Frequency", "Priority", "ScheduleLater"):
+        if key not in props:
+            raise ValueError(f"Task {name} of state {state} has no {key}")
+    entry = TaskEntry(name, task_id, props)
+    if entry.frequency <= 0:
+        raise ValueError(f"Task {name} of state {state} has no positive Frequency")
+    if not 0 < entry.min_frequency <= entry.frequency:
+        raise ValueError(
+            f"MinFrequency of task {name} in {state} is not between 0 and its Frequency"
+        )
+    if entry.overrun not in (OVERRUN_COALESCE, OVERRUN_SKIP, OVERRUN_CATCH_UP):
+        raise ValueError(f"Unknown Overrun {entry.overrun} of task {name} in {state}")
+    if entry.on_over_budget not in (BUDGET_REPORT, BUDGET_DEMOTE, BUDGET_CANCEL):
+        raise ValueError(
+            f"Unknown OnOverBudget {entry.on_over_budget} of task {name} in {state}"
+        )
+    return entry
@@ -1,4 +1,6 @@
 import apps.tasko as tasko
+from import_cost import print_import_costs, timed_import
+from power_scaling import RateGovernor, scaled_frequencies
 
 
 class StateManager:
@@ -8,8 +10,31 @@ class StateManager:
 
         self.current_state = None
         self.previous_state = None
+        # Index of the current state in self.states
+        self.current_id = None
+        # Compiled SM_CONFIGURATION, see load()
+        self.states = []
+        self.state_ids = {}
         self.scheduled_tasks = {}
+        # Task objects by name, created by _task() the first time a state runs them
+        self.tasks = {}
+        # Runs the tasks of states using the "CYCLIC" scheduler
+        self.executive = None
         self.initialized = False
+        # Tasks that repeatedly exceeded their CPU budget, until MONITOR reports them
+        self.budget_reports = {}
+        # Worst CPU time per invocation measured for each task, in nanoseconds
+        self.task_cpu = {}
+        # Worst-case execution time of each task in seconds, from TASK_WCET
+        self.wcets = {}
+        # Id of each task in the loop's trace, from TASK_MAPPING_ID
+        self.task_ids = {}
+        # Outcome of the last run of each transition hook, until MONITOR reports it
+        self.hook_reports = {}
+        # Scales the task rates to the power available, None without POWER_SCALING
+        self.governor = None
+        self._power_sample_nanos = None
+        tasko.set_budget_handler(self._budget_exceeded)
 
     def start(self, start_state: str):
         """Starts the state machine
@@ -18,23 +43,85 @@ class StateManager:
         :param start_state: The state to start the state machine in
         :type start_state: str
         """
-        from sm_configuration import TASK_REGISTRY, SM_CONFIGURATION
+        from sm_configuration import (
+            TASK_REGISTRY,
+            TASK_MAPPING_ID,
+            SM_CONFIGURATION,
+            TASK_WCET,
+            TRANSITION_HOOKS,
+            POWER_SCALING,
+        )
 
-        self.config = SM_CONFIGURATION
         self.task_registry = TASK_REGISTRY
+        self.wcets = TASK_WCET
+        for name in TASK_MAPPING_ID:
+            if name not in TASK_REGISTRY:
+                raise ValueError(f"Task {name} is not in the registry")
+        self.load(SM_CONFIGURATION, TASK_MAPPING_ID, TRANSITION_HOOKS, POWER_SCALING)
 
-        # TODO Validate the configuration and registry
-        self.states = list(self.config.keys())
+        # Refuse a configuration that can overload the CPU
+        self.check_schedulability(TASK_WCET)
 
-        # init task objects
-        self.tasks = {key: task() for key, task in TASK_REGISTRY.items()}
-
-        self.current_state = start_state
-
-        # Will load all the tasks through the state switch
+        # Will load the tasks of the start state through the state switch, the others when a state needs them
         self.switch_to(start_state)
+        print_import_costs()
         tasko.run()
 
+    def _task(self, name):
+        """Returns the task object of a task name, importing its module from TASK_REGISTRY the first time"""
+        task = self.tasks.get(name)
+        if task is None:
+            task = timed_import(self.task_registry[name]).Task()
+            self.tasks[name] = task
+        return task
+
+    def load(self, config, task_ids, hooks=None, power=None):
+        """
+        Compiles the state machine tables, raising ValueError on unknown names, see sm_tables.py
+
+        Args:
+        :param config: SM_CONFIGURATION
+        :param task_ids: TASK_MAPPING_ID
+        :param hooks: TRANSITION_HOOKS
+        :param power: POWER_SCALING, None to always run the tasks at their "Frequency"
+        """
+        from sm_tables import compile_configuration
+
+        self.task_ids = task_ids
+        self.states, self.state_ids = compile_configuration(config, task_ids, hooks)
+        if power is not None:
+            self.governor = RateGovernor(power)
+
+    def check_schedulability(self, wcets):
+        """
+        Raises ValueError if a task of any state could miss its rate with the given worst-case execution times,
+        or has no worst-case execution time
+
+        Args:
+        :param wcets: Worst-case execution time of each task name, in seconds, unless the state gives a "WCET"
+        :type wcets: dict
+        """
+        from apps.tasko.schedulability import analyze_tasks
+
+        failures = []
+        for state in self.states:
+            tasks = []
+            for entry in state.tasks:
+                wcet = entry.wcet if entry.wcet is not None else wcets.get(entry.name)
+                if wcet is None:
+                    raise ValueError(
+                        f"Task {entry.name} of state {state.name} has no worst-case execution time"
+                    )
+                tasks.append((entry.name, entry.frequency, entry.priority, wcet))
+            for name, result in analyze_tasks(tasks).items():
+                if not result["schedulable"]:
+                    failures.append((state.name, name))
+        if failures:
+            raise ValueError(
+                "Tasks can miss their rate: "
+                + ", ".join(f"{task} in {state}" for state, task in failures)
+            )
+
     def switch_to(self, new_state):
         """Switches to a new state and actiavte all corresponding tasks as defined in the SM_CONFIGURATION
 
@@ -43,54 +130,268 @@ class StateManager:
         :type new_state: str
         """
 
-        if new_state not in self.states:
+        new_id = self.state_ids.get(new_state)
+        if new_id is None:
             raise ValueError(f"State {new_state} is not in the list of states")
+        state = self.states[new_id]
 
+        previous = None
         if self.initialized:
+            previous = self.states[self.current_id]
             # prevent illegal transitions
-            if not (new_state in self.config[self.current_state]["MovesTo"]):
+            if not previous.moves_to(new_id):
                 raise ValueError(
                     f"No transition from {self.current_state} to {new_state}"
                 )
         else:
             self.initialized = True
 
+        if tasko.get_loop().policy == tasko.SCHEDULE_EDF:
+            self._admit(state)
+
         self.previous_state = self.current_state
 
-        # TODO transition functions
+        # The hooks only run once this switch has returned, exit hooks first at equal priority
+        if previous is not None:
+            self._start_hooks(previous.exits, previous.name, new_state)
+        self._start_hooks(state.enters, self.previous_state, new_state)
 
         ## Scheduling
 
-        self.stop_all_tasks()
-        self.scheduled_tasks = {}  # Reset
+        if state.cyclic or self.executive is not None:
+            # The frame table of a cyclic state covers all of its tasks, start over
+            self.stop_all_tasks()
+            self.scheduled_tasks = {}
+        self.current_id = new_id
         self.current_state = new_state
-        state_config = self.config[new_state]
 
-        for task_name, props in state_config["Tasks"].items():
-            if props["ScheduleLater"]:
-                schedule = tasko.schedule_later
-            else:
-                schedule = tasko.schedule
+        if state.cyclic:
+            self._schedule_cyclic(state)
+            print(f"Switched to state {new_state}")
+            return
 
-            frequency = props["Frequency"]
-            priority = props["Priority"]
-            task_fn = self.tasks[task_name]._run
+        if previous is not None:
+            # Only the tasks the new state drops are stopped, the others keep their coroutine
+            for entry in previous.tasks:
+                if state.task_slots[entry.id] is None:
+                    scheduled_task = self.scheduled_tasks.pop(entry.name, None)
+                    if scheduled_task is not None:
+                        scheduled_task.cancel()
 
-            self.scheduled_tasks[task_name] = schedule(frequency, task_fn, priority)
+        phases = {}
+        if state.auto_phasing:
+            phases = self._auto_phases(state.tasks)
+        # The kept tasks are rephased from the switch, like the ones starting now
+        origin_nanos = tasko.monotonic_ns()
 
+        for entry in state.tasks:
+            phase = entry.phase
+            if phase is None:
+                phase = phases.get(entry.name, 0)
+            scheduled_task = self.scheduled_tasks.get(entry.name)
+            if scheduled_task is None:
+                scheduled_task = self._start_task(entry, phase)
+                self.scheduled_tasks[entry.name] = scheduled_task
+            else:
+                previous_entry = previous.task_slots[entry.id]
+                self._update_task(scheduled_task, previous_entry, entry)
+                # Without phasing in the new state, a kept task keeps its phase
+                if state.auto_phasing or entry.phase != previous_entry.phase:
+                    scheduled_task.set_phase(phase, origin_nanos)
+
+            scheduled_task.set_overrun_policy(entry.overrun, entry.max_burst)
+            if entry.budget is not None:
+                scheduled_task.set_budget(
+                    entry.budget, entry.on_over_budget, entry.budget_strikes
+                )
+
+        self._scale_rates()
         print(f"Switched to state {new_state}")
 
+    def power_sample_due(self):
+        """Whether update_power wants a new sample, at most one every "Interval" seconds of POWER_SCALING"""
+        if self.governor is None:
+            return False
+        return (
+            self._power_sample_nanos is None
+            or tasko.monotonic_ns() - self._power_sample_nanos
+            >= self.governor.interval * 1000000000
+        )
+
+    def update_power(self, voltage, current_ma, charging):
+        """
+        Scales the rates of the tasks with a "MinFrequency" to the power available, see power_scaling.py
+
+        Args:
+        :param voltage: Battery voltage in volts, PyCubed.battery_voltage
+        :param current_ma: Current drawn in mA, PyCubed.current_draw, None if unknown
+        :param charging: PyCubed.solar_charging
+        """
+        if self.governor is None:
+            return
+        self._power_sample_nanos = tasko.monotonic_ns()
+        if self.governor.update(voltage, current_ma, charging):
+            print(
+                f"Power level {self.governor.level}/{self.governor.levels} at {voltage:.2f}V"
+            )
+            self._scale_rates()
+
+    def _scale_rates(self):
+        if self.governor is None or self.current_id is None:
+            return
+        state = self.states[self.current_id]
+        if state.cyclic:
+            # The frame table of a cyclic state is fixed
+            return
+        for entry, frequency in scaled_frequencies(
+            state.tasks, self.governor.fraction()
+        ):
+            self.scheduled_tasks[entry.name].change_rate(frequency)
+
+    def _start_hooks(self, hooks, previous_state, new_state):
+        """Adds a tasko task running each transition hook, cancelled once it exceeds its CPU budget"""
+        if not hooks:
+            return
+        functions = timed_import("transition_hooks")
+        start_nanos = tasko.monotonic_ns()
+        for hook in hooks:
+            task = tasko.add_task(
+                self._run_hook(
+                    hook.name,
+                    getattr(functions, hook.function),
+                    previous_state,
+                    new_state,
+                    start_nanos,
+                ),
+                hook.priority,
+            )
+            task.set_budget(hook.budget, tasko.BUDGET_CANCEL, 1)
+
+    async def _run_hook(self, name, function, previous_state, new_state, start_nanos):
+        outcome = "failed"
+        try:
+            await function(previous_state, new_state)
+            outcome = "completed"
+        except tasko.TaskCanceledException:
+            outcome = "over budget"
+        except Exception as e:
+            print(f"[HOOK] {name} failed: {e}")
+        self.hook_reports[name] = {
+            "state": new_state,
+            "outcome": outcome,
+            "latency": tasko.monotonic_ns() - start_nanos,
+        }
+
+    def _start_task(self, entry, phase):
+        """Schedules a task the previous state didn't run"""
+        if entry.schedule_later:
+            schedule = tasko.schedule_later
+        else:
+            schedule = tasko.schedule
+
+        scheduled_task = schedule(
+            entry.frequency, self._task(entry.name)._run, entry.priority
+        )
+        scheduled_task.set_trace_id(entry.id)
+        if phase:
+            scheduled_task.set_phase(phase)
+        return scheduled_task
+
+    def _update_task(self, scheduled_task, previous, entry):
+        """Applies the rate and priority of the new state to a task that keeps running"""
+        # The power scaling may have slowed the task down, _scale_rates scales it again after the switch
+        if (
+            entry.frequency != previous.frequency
+            or previous.min_frequency < previous.frequency
+        ):
+            scheduled_task.change_rate(entry.frequency)
+        if entry.priority != previous.priority:
+            scheduled_task.set_priority(entry.priority)
+        if previous.budget is not None and entry.budget is None:
+            scheduled_task.set_budget(0)
+        # Restarts the task if its budget action cancelled it, otherwise it keeps its schedule
+        scheduled_task.start()
+
+    def _auto_phases(self, tasks):
+        """
+        Spreads the first activations of the tasks without a "Phase" over the shortest period, highest priority
+        first. Each task starts once the previous one is done going by its worst-case execution time, and the
+        rest of the period is shared evenly between the gaps.
+        """
+        entries = sorted(
+            (entry for entry in tasks if entry.phase is None),
+            key=lambda entry: entry.priority,
+        )
+        if not entries:
+            return {}
+        shortest = min(1 / entry.frequency for entry in entries)
+        busy = sum(self._wcet(entry) for entry in entries)
+        gap = max(0, shortest - busy) / len(entries)
+        phases = {}
+        phase = 0
+        for entry in entries:
+            phases[entry.name] = phase
+            phase += self._wcet(entry) + gap
+        return phases
+
+    def _wcet(self, entry):
+        if entry.wcet is not None:
+            return entry.wcet
+        return self.wcets.get(entry.name, 0)
+
+    def _admit(self, state):
+        """Refuses a state whose tasks would need more than the whole CPU under EDF, going by measured CPU times"""
+        self._record_cpu()
+        load = tasko.utilization(
+            (entry.frequency, self.task_cpu.get(entry.name, 0)) for entry in state.tasks
+        )
+        if load > 1:
+            raise ValueError(f"State {state.name} needs {load * 100:.0f}% of the CPU")
+
+    def _record_cpu(self):
+        for name, task in self.scheduled_tasks.items():
+            stats = task.cpu if hasattr(task, "cpu") else task.runtime
+            if stats.max > self.task_cpu.get(name, 0):
+                self.task_cpu[name] = stats.max
+
+    def _schedule_cyclic(self, state):
+        """Compiles the tasks of a state into the frame table of a CyclicExecutive and starts it"""
+        self.executive = tasko.CyclicExecutive(tasko.get_loop())
+        for entry in state.tasks:
+            self.scheduled_tasks[entry.name] = self.executive.add(
+                entry.frequency,
+                self._task(entry.name)._run,
+                entry.priority,
+                later=entry.schedule_later,
+            )
+        self.executive.start()
+
     def stop_all_tasks(self):
+        """Cancels every scheduled task, removing them from the loop right away"""
         for name, task in self.scheduled_tasks.items():
-            task.stop()
+            task.cancel()
+        if self.executive is not None:
+            self.executive.cancel()
+            self.executive = None
+
+    def _budget_exceeded(self, task):
+        for name, scheduled_task in self.scheduled_tasks.items():
+            if scheduled_task is task.owner:
+                self.budget_reports[name] = {
+                    "overruns": task.budget_overruns,
+                    "cpu": task.cpu_nanos,
+                    "budget": task.budget_nanos,
+                    "action": task.budget_action,
+                }
 
     def query_global_state(self):
         return self.current_state
 
     def query_state(self):
+        """Returns the timing statistics of every scheduled task in the current state, keyed by task name"""
         state = {}
-        for task in self.scheduled_tasks:
-            state[task] = task.query_state()
+        for name, task in self.scheduled_tasks.items():
+            state[name] = task.query_state()
         return state
 
 
@@ -1,5 +1,8 @@
+from hal.pycubed import hardware
 from tasks.template_task import DebugTask
 
+from state_manager import state_manager as SM
+
 
 class Task(DebugTask):
 
@@ -8,3 +11,24 @@ class Task(DebugTask):
 
     async def main_task(self):
         print(f"[{self.ID}][{self.name}] I am supposed to monitor the system.")
+
+        if SM.power_sample_due():
+            # Slows the low priority tasks down as the battery runs low
+            SM.update_power(
+                hardware.battery_voltage,
+                hardware.current_draw,
+                hardware.solar_charging,
+            )
+
+        # Each report is printed once, the state manager adds a new one when it happens again
+        while SM.budget_reports:
+            task_name, report = SM.budget_reports.popitem()
+            print(
+                f"[{self.ID}][{self.name}] {task_name} over CPU budget {report['overruns']} times, last {report['cpu']}ns > {report['budget']}ns, {report['action']}."
+            )
+
+        while SM.hook_reports:
+            hook_name, report = SM.hook_reports.popitem()
+            print(
+                f"[{self.ID}][{self.name}] {hook_name} hook {report['outcome']} {report['latency']}ns after entering {report['state']}."
+            )
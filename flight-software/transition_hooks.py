@@ -0,0 +1,34 @@
+"""
+Functions the state machine runs when it enters or leaves a state, see TRANSITION_HOOKS in sm_configuration.py.
+
+Each hook is an async function(previous_state, new_state). The StateManager runs it as a tasko task at the
+priority of its TRANSITION_HOOKS entry once switch_to has returned, so slow hardware doesn't hold up the
+switch. The loop can only enforce the CPU budget of a hook when it awaits: hooks should await
+tasko.sleep(0) between slow steps, which also lets more urgent tasks run in between.
+"""
+
+import apps.tasko as tasko
+
+
+async def log_transition(previous_state, new_state):
+    print(f"[HOOK] Moving from {previous_state} to {new_state}.")
+
+
+async def radio_sleep(previous_state, new_state):
+    """Puts the radios to sleep and cuts their power"""
+    from hal.pycubed import EN_RF_ACTIVE, hardware
+
+    if hardware.hardware["Radio1"]:
+        hardware.radio1.sleep()
+        await tasko.sleep(0)
+    if hardware.hardware["Radio2"]:
+        hardware.radio2.sleep()
+        await tasko.sleep(0)
+    hardware.enable_rf.value = not EN_RF_ACTIVE
+
+
+async def flush_data(previous_state, new_state):
+    """Closes the open data files, so everything logged so far is complete on the SD card"""
+    from apps.data_handler import DataHandler as DH
+
+    DH.close_files()
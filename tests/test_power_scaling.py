@@ -0,0 +1,119 @@
+import os
+import sys
+from unittest import TestCase
+
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "flight-software"),
+)
+
+from power_scaling import RateGovernor, scaled_frequencies
+from sm_tables import TaskEntry
+
+# One level every 0.2V: 7.0V, 7.2V, 7.4V and 7.6V
+POWER = {
+    "Interval": 10,
+    "FullVoltage": 7.6,
+    "EmptyVoltage": 6.8,
+    "Levels": 4,
+    "Hysteresis": 0.05,
+    "MaxCurrent": 500,
+    "CurrentHysteresis": 50,
+    "ChargingSamples": 3,
+}
+
+
+def entry(name, priority, frequency, min_frequency):
+    props = {
+        "Frequency": frequency,
+        "MinFrequency": min_frequency,
+        "Priority": priority,
+        "ScheduleLater": False,
+    }
+    return TaskEntry(name, 0, props)
+
+
+class TestRateGovernor(TestCase):
+    def test_levels(self):
+        governor = RateGovernor(POWER)
+        self.assertEqual(4, governor.level, "full rate until the first sample")
+        self.assertFalse(governor.update(7.7, None, False))
+        self.assertTrue(governor.update(7.1, None, False))
+        self.assertEqual(1, governor.level)
+        self.assertEqual(0.25, governor.fraction())
+        governor.update(6.5, None, False)
+        self.assertEqual(0, governor.level)
+
+    def test_voltage_hysteresis(self):
+        governor = RateGovernor(POWER)
+        governor.update(7.5, None, False)
+        self.assertEqual(3, governor.level)
+
+        # Down only once the battery is 0.05V below the 7.4V threshold
+        self.assertFalse(governor.update(7.38, None, False))
+        self.assertEqual(3, governor.level)
+        self.assertTrue(governor.update(7.34, None, False))
+        self.assertEqual(2, governor.level)
+
+        # And back up only once it is 0.05V above
+        self.assertFalse(governor.update(7.42, None, False))
+        self.assertEqual(2, governor.level)
+        self.assertTrue(governor.update(7.46, None, False))
+        self.assertEqual(3, governor.level)
+
+    def test_current_hysteresis(self):
+        governor = RateGovernor(POWER)
+        self.assertTrue(governor.update(7.7, 600, False))
+        self.assertEqual(3, governor.level)
+
+        # Still over until the draw falls 50mA below MaxCurrent
+        self.assertFalse(governor.update(7.7, 480, False))
+        self.assertFalse(governor.update(7.7, None, False), "unknown keeps the verdict")
+        self.assertTrue(governor.update(7.7, 440, False))
+        self.assertEqual(4, governor.level)
+
+        self.assertFalse(governor.update(7.7, 480, False))
+        self.assertTrue(governor.update(7.7, 510, False))
+        self.assertEqual(3, governor.level)
+
+    def test_charging_samples(self):
+        governor = RateGovernor(POWER)
+        governor.update(7.5, None, False)
+
+        # Charging raises the level once it held for 3 samples in a row
+        self.assertFalse(governor.update(7.5, None, True))
+        self.assertFalse(governor.update(7.5, None, True))
+        self.assertTrue(governor.update(7.5, None, True))
+        self.assertEqual(4, governor.level)
+
+        # A single sample in shade doesn't count, nor does an interrupted streak
+        self.assertFalse(governor.update(7.5, None, False))
+        self.assertFalse(governor.update(7.5, None, True))
+        self.assertFalse(governor.update(7.5, None, False))
+        self.assertFalse(governor.update(7.5, None, False))
+        self.assertTrue(governor.update(7.5, None, False))
+        self.assertEqual(3, governor.level)
+
+    def test_invalid(self):
+        for key, value in (
+            ("EmptyVoltage", 7.6),
+            ("Levels", 0),
+            ("CurrentHysteresis", -1),
+            ("ChargingSamples", 0),
+        ):
+            with self.assertRaises(ValueError, msg=key):
+                RateGovernor(dict(POWER, **{key: value}))
+
+
+class TestScaledFrequencies(TestCase):
+    def test_lowest_priority_first(self):
+        high = entry("HIGH", 1, 10, 2)
+        low = entry("LOW", 3, 10, 2)
+        fixed = entry("FIXED", 2, 10, 10)
+        tasks = [high, fixed, low]
+
+        self.assertEqual([(low, 10), (high, 10)], scaled_frequencies(tasks, 1))
+        # Half the power missing from two tasks: the low priority one slows down all the way first
+        self.assertEqual([(low, 2), (high, 10)], scaled_frequencies(tasks, 0.5))
+        self.assertEqual([(low, 2), (high, 6)], scaled_frequencies(tasks, 0.25))
+        self.assertEqual([(low, 2), (high, 2)], scaled_frequencies(tasks, 0))
@@ -0,0 +1,100 @@
+import copy
+import os
+import sys
+from unittest import TestCase
+
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "flight-software"),
+)
+
+from sm_configuration import SM_CONFIGURATION, TASK_MAPPING_ID, TRANSITION_HOOKS
+from sm_tables import compile_configuration
+
+
+class TestCompileConfiguration(TestCase):
+    def setUp(self):
+        # Every test breaks its own copy
+        self.config = copy.deepcopy(SM_CONFIGURATION)
+        self.task_ids = dict(TASK_MAPPING_ID)
+        self.hooks = copy.deepcopy(TRANSITION_HOOKS)
+
+    def compile(self):
+        return compile_configuration(self.config, self.task_ids, self.hooks)
+
+    def assertRejected(self, message):
+        with self.assertRaisesRegex(ValueError, message):
+            self.compile()
+
+    def test_flight_configuration(self):
+        states, state_ids = self.compile()
+        self.assertEqual({"STARTUP": 0, "NOMINAL": 1, "SAFE": 2}, state_ids)
+        self.assertEqual(0b010, states[0].transitions)
+        self.assertTrue(states[2].moves_to(1))
+        self.assertFalse(states[2].moves_to(0))
+
+        nominal = states[1]
+        self.assertEqual(
+            ["MONITOR", "TIMING", "OBDH", "IMU"], [e.name for e in nominal.tasks]
+        )
+        self.assertEqual("IMU", nominal.task_slots[TASK_MAPPING_ID["IMU"]].name)
+        self.assertIsNone(states[2].task_slots[TASK_MAPPING_ID["OBDH"]])
+        self.assertEqual(("print",), tuple(hook.name for hook in states[2].enters))
+
+    def test_unknown_task(self):
+        tasks = self.config["NOMINAL"]["Tasks"]
+        tasks["Monitor"] = tasks.pop("MONITOR")
+        self.assertRejected("Unknown task Monitor in state NOMINAL")
+
+    def test_unknown_target(self):
+        self.config["SAFE"]["MovesTo"].append("SAFE_MODE")
+        self.assertRejected("State SAFE moves to unknown state SAFE_MODE")
+
+    def test_unknown_hook(self):
+        self.config["SAFE"]["Exit"] = ["log"]
+        self.assertRejected("Unknown transition hook log in state SAFE")
+
+        self.setUp()
+        del self.hooks["print"]
+        self.assertRejected("Unknown transition hook print in state SAFE")
+
+    def test_duplicate_task_id(self):
+        self.task_ids["IMU"] = TASK_MAPPING_ID["OBDH"]
+        self.assertRejected("Tasks OBDH and IMU have the same id")
+
+    def test_missing_keys(self):
+        for key in ("Tasks", "MovesTo"):
+            self.setUp()
+            del self.config["STARTUP"][key]
+            self.assertRejected(f"State STARTUP has no {key}")
+
+        for key in ("Frequency", "Priority", "ScheduleLater"):
+            self.setUp()
+            del self.config["NOMINAL"]["Tasks"]["OBDH"][key]
+            self.assertRejected(f"Task OBDH of state NOMINAL has no {key}")
+
+        for key in ("Function", "Priority", "Budget"):
+            self.setUp()
+            del self.hooks["print"][key]
+            self.assertRejected(f"Hook print has no {key}")
+
+    def test_invalid_values(self):
+        obdh = ("NOMINAL", "OBDH")
+        cases = (
+            (obdh, "Frequency", 0, "has no positive Frequency"),
+            (obdh, "MinFrequency", 0, "MinFrequency of task OBDH"),
+            (obdh, "MinFrequency", 2, "MinFrequency of task OBDH"),
+            (obdh, "Overrun", "DROP", "Unknown Overrun DROP of task OBDH"),
+            (obdh, "OnOverBudget", "KILL", "Unknown OnOverBudget KILL of task OBDH"),
+        )
+        for (state, task), key, value, message in cases:
+            self.setUp()
+            self.config[state]["Tasks"][task][key] = value
+            self.assertRejected(message)
+
+        self.setUp()
+        self.config["SAFE"]["Scheduler"] = "STATIC"
+        self.assertRejected("Unknown scheduler STATIC in state SAFE")
+        self.setUp()
+        self.config["SAFE"]["Phasing"] = "RANDOM"
+        self.assertRejected("Unknown phasing RANDOM in state SAFE")
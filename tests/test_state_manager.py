@@ -0,0 +1,297 @@
+import os
+import sys
+from unittest import TestCase, mock
+
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "flight-software"),
+)
+
+import apps.tasko as tasko
+import transition_hooks
+from state_manager import StateManager
+
+CONFIG = {
+    "BOTH": {
+        "Tasks": {
+            "KEPT": {"Frequency": 10, "Priority": 1, "ScheduleLater": False},
+            "IDLE": {"Frequency": 10, "Priority": 3, "ScheduleLater": True},
+            "DROPPED": {"Frequency": 10, "Priority": 2, "ScheduleLater": False},
+        },
+        "MovesTo": ["KEPT_ONLY"],
+    },
+    "KEPT_ONLY": {
+        "Tasks": {
+            "KEPT": {"Frequency": 10, "Priority": 1, "ScheduleLater": False},
+        },
+        "MovesTo": ["BOTH"],
+    },
+}
+
+TASK_IDS = {"KEPT": 0, "IDLE": 1, "DROPPED": 2}
+
+SCALED = {
+    "LOW": {
+        "Tasks": {
+            "KEPT": {
+                "Frequency": 10,
+                "MinFrequency": 2,
+                "Priority": 1,
+                "ScheduleLater": False,
+            },
+            "IDLE": {
+                "Frequency": 10,
+                "MinFrequency": 2,
+                "Priority": 3,
+                "ScheduleLater": False,
+            },
+            "DROPPED": {"Frequency": 10, "Priority": 2, "ScheduleLater": False},
+        },
+        "MovesTo": ["FIXED"],
+    },
+    "FIXED": {
+        "Tasks": {
+            "KEPT": {
+                "Frequency": 10,
+                "MinFrequency": 2,
+                "Priority": 1,
+                "ScheduleLater": False,
+            },
+        },
+        "MovesTo": ["LOW"],
+    },
+}
+
+HOOKED = {
+    "FIRST": {
+        "Tasks": {"KEPT": {"Frequency": 10, "Priority": 3, "ScheduleLater": False}},
+        "MovesTo": ["SECOND"],
+        "Exit": ["leave"],
+    },
+    "SECOND": {
+        "Tasks": {"KEPT": {"Frequency": 10, "Priority": 3, "ScheduleLater": False}},
+        "MovesTo": ["FIRST"],
+        "Enters": ["enter", "slow", "broken"],
+    },
+}
+
+HOOKS = {
+    "leave": {"Function": "test_leave", "Priority": 1, "Budget": 0.01},
+    "enter": {"Function": "test_enter", "Priority": 1, "Budget": 0.01},
+    "slow": {"Function": "test_slow", "Priority": 2, "Budget": 0.05},
+    "broken": {"Function": "test_broken", "Priority": 2, "Budget": 0.01},
+}
+
+# One level every 0.2V from 6.8V to 7.6V
+POWER = {
+    "Interval": 10,
+    "FullVoltage": 7.6,
+    "EmptyVoltage": 6.8,
+    "Levels": 4,
+    "Hysteresis": 0.05,
+}
+
+
+class SwitchingTask:
+    """Stands in for a flight task, switching the state machine to `target` on its first run"""
+
+    def __init__(self, sm, target=None):
+        self.sm = sm
+        self.target = target
+        self.runs = 0
+
+    async def _run(self):
+        self.runs += 1
+        if self.runs == 1 and self.target is not None:
+            self.sm.switch_to(self.target)
+        await tasko.sleep(0)
+
+
+class RecordingTask:
+    """Stands in for a flight task, recording the time of each activation"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.activations = []
+
+    async def _run(self):
+        self.activations.append(self.clock.now_nanos)
+
+
+class TestStateManager(TestCase):
+    def setUp(self):
+        self.clock = tasko.use_simulated_clock()
+        tasko.new_loop()
+        self.sm = StateManager()
+        self.sm.load(CONFIG, TASK_IDS)
+
+    def tearDown(self):
+        tasko.use_real_clock()
+        tasko.new_loop()
+
+    def switch_from(self, caller):
+        kept = SwitchingTask(self.sm, "KEPT_ONLY" if caller == "KEPT" else None)
+        dropped = SwitchingTask(self.sm, "KEPT_ONLY" if caller == "DROPPED" else None)
+        # Sleeping when the switch drops it, right before the caller in DROPPED's case
+        idle = SwitchingTask(self.sm)
+        self.sm.tasks = {"KEPT": kept, "IDLE": idle, "DROPPED": dropped}
+        self.sm.switch_to("BOTH")
+        tasko.run_for(1)
+        return kept, dropped
+
+    def test_switch_from_kept_task(self):
+        kept, dropped = self.switch_from("KEPT")
+        self.assertEqual("KEPT_ONLY", self.sm.current_state)
+        self.assertEqual(0, dropped.runs, "dropped before it ran")
+        self.assertEqual(10, kept.runs, "kept its schedule across the switch")
+        self.assertEqual(["KEPT"], list(self.sm.scheduled_tasks))
+        self.assertEqual(1, len(tasko.stats()))
+
+    def test_switch_from_dropped_task(self):
+        kept, dropped = self.switch_from("DROPPED")
+        self.assertEqual("KEPT_ONLY", self.sm.current_state)
+        self.assertEqual(1, dropped.runs, "cancelled once the switch returned")
+        self.assertEqual(10, kept.runs)
+        self.assertEqual(["KEPT"], list(self.sm.scheduled_tasks))
+        self.assertEqual(1, len(tasko.stats()))
+
+    def test_illegal_transition(self):
+        self.sm.tasks = {name: RecordingTask(self.clock) for name in TASK_IDS}
+        self.sm.switch_to("KEPT_ONLY")
+        tasko.run_for(1)
+        with self.assertRaisesRegex(
+            ValueError, "No transition from KEPT_ONLY to KEPT_ONLY"
+        ):
+            self.sm.switch_to("KEPT_ONLY")
+        with self.assertRaisesRegex(
+            ValueError, "State SAFE is not in the list of states"
+        ):
+            self.sm.switch_to("SAFE")
+        self.assertEqual("KEPT_ONLY", self.sm.current_state)
+        self.assertEqual(["KEPT"], list(self.sm.scheduled_tasks))
+
+    def test_check_schedulability(self):
+        self.sm.check_schedulability({"KEPT": 0.01, "IDLE": 0.01, "DROPPED": 0.01})
+        with self.assertRaises(ValueError):
+            self.sm.check_schedulability({"KEPT": 0.01, "DROPPED": 0.01})
+        with self.assertRaises(ValueError):
+            self.sm.check_schedulability({"KEPT": 0.01, "IDLE": 0.2, "DROPPED": 0.01})
+
+    def test_phases_after_switch(self):
+        from sm_configuration import (
+            SM_CONFIGURATION,
+            TASK_MAPPING_ID,
+            TASK_WCET,
+            TRANSITION_HOOKS,
+        )
+
+        self.sm.load(SM_CONFIGURATION, TASK_MAPPING_ID, TRANSITION_HOOKS)
+        self.sm.wcets = TASK_WCET
+        self.sm.tasks = {name: RecordingTask(self.clock) for name in TASK_MAPPING_ID}
+        self.sm.switch_to("STARTUP")
+        tasko.run_for(10)
+        switch_nanos = self.clock.now_nanos
+        self.sm.switch_to("NOMINAL")
+        tasko.run_for(2)
+
+        # The tasks STARTUP also ran start at their NOMINAL phase too, not all in the same step
+        nominal = self.sm.states[self.sm.state_ids["NOMINAL"]]
+        phases = self.sm._auto_phases(nominal.tasks)
+        self.assertEqual(4, len(set(phases.values())))
+        for entry in nominal.tasks:
+            activations = self.sm.tasks[entry.name].activations
+            first = min(nanos for nanos in activations if nanos >= switch_nanos)
+            expected = phases[entry.name]
+            if entry.schedule_later:
+                expected += 1 / entry.frequency
+            self.assertAlmostEqual(
+                expected, (first - switch_nanos) / 1e9, places=6, msg=entry.name
+            )
+
+    def rates(self):
+        return {
+            # Periods are whole nanoseconds
+            name: round(task.query_state()["rate"], 6)
+            for name, task in self.sm.scheduled_tasks.items()
+        }
+
+    def test_update_power(self):
+        self.sm.load(SCALED, TASK_IDS, power=POWER)
+        self.sm.tasks = {name: RecordingTask(self.clock) for name in TASK_IDS}
+        self.sm.switch_to("LOW")
+        self.assertEqual({"KEPT": 10, "IDLE": 10, "DROPPED": 10}, self.rates())
+
+        self.assertTrue(self.sm.power_sample_due())
+        # A quarter of the power: the lowest priority task slows down all the way first
+        self.sm.update_power(7.1, None, False)
+        self.assertEqual({"KEPT": 6, "IDLE": 2, "DROPPED": 10}, self.rates())
+        self.assertFalse(self.sm.power_sample_due())
+        tasko.run_for(10)
+        self.assertTrue(self.sm.power_sample_due())
+
+        # Scaled again after a switch, alone KEPT takes all the missing power
+        self.sm.switch_to("FIXED")
+        self.assertEqual({"KEPT": 4}, self.rates())
+        self.sm.update_power(7.7, None, False)
+        self.assertEqual({"KEPT": 10}, self.rates())
+
+    def test_transition_hooks(self):
+        runs = []
+
+        async def leave(previous_state, new_state):
+            runs.append(("leave", previous_state, new_state, self.clock.now_nanos))
+            self.clock.advance(0.001)
+
+        async def enter(previous_state, new_state):
+            runs.append(("enter", previous_state, new_state, self.clock.now_nanos))
+            self.clock.advance(0.002)
+
+        async def slow(previous_state, new_state):
+            while True:
+                self.clock.advance(0.02)
+                await tasko.sleep(0)
+
+        async def broken(previous_state, new_state):
+            raise RuntimeError("no radio")
+
+        functions = {
+            "test_leave": leave,
+            "test_enter": enter,
+            "test_slow": slow,
+            "test_broken": broken,
+        }
+        with mock.patch.multiple(transition_hooks, create=True, **functions):
+            self.sm.load(HOOKED, TASK_IDS, HOOKS)
+            self.sm.tasks = {"KEPT": RecordingTask(self.clock)}
+            self.sm.switch_to("FIRST")
+            tasko.run_for(1)
+            self.assertEqual({}, self.sm.hook_reports)
+            self.assertEqual([], runs, "FIRST has no enter hooks")
+
+            switch_nanos = self.clock.now_nanos
+            self.sm.switch_to("SECOND")
+            self.assertEqual([], runs, "hooks run once switch_to returned")
+            tasko.run_for(1)
+
+        # The exit hooks of the previous state first, each with the names of both states
+        self.assertEqual(
+            [
+                ("leave", "FIRST", "SECOND", switch_nanos),
+                ("enter", "FIRST", "SECOND", switch_nanos + 1000000),
+            ],
+            runs,
+        )
+        reports = self.sm.hook_reports
+        self.assertEqual(
+            {"state": "SECOND", "outcome": "completed", "latency": 1000000},
+            reports["leave"],
+        )
+        # Latency from the switch, including the hooks that ran before
+        self.assertEqual(
+            {"state": "SECOND", "outcome": "completed", "latency": 3000000},
+            reports["enter"],
+        )
+        self.assertEqual("failed", reports["broken"]["outcome"])
+        # Cancelled after 60ms of CPU, over its 50ms budget
+        self.assertEqual("over budget", reports["slow"]["outcome"])
+        self.assertEqual(3000000 + 3 * 20000000, reports["slow"]["latency"], reports)
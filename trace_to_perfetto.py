@@ -0,0 +1,169 @@
+"""
+Host-side converter of tasko trace dumps.
+
+Reads a dump written by TraceBuffer.save on the board, for instance /sd/tasko_trace.bin, and writes it as
+Chrome trace JSON, which ui.perfetto.dev and chrome://tracing open. Every task gets its own track, named
+after TASK_MAPPING_ID in sm_configuration.py, with a slice each time the loop ran it and markers where it
+went to sleep and woke up. Every ManagedResource gets a track of its own, with a slice for each task holding
+it. Resources are numbered in the order the flight software created them.
+
+python trace_to_perfetto.py tasko_trace.bin -o tasko_trace.json
+"""
+
+import argparse
+import json
+import sys
+
+from benchmark_scheduler import FLIGHT_SOFTWARE, load_configuration
+
+# Process ids of the tracks
+TASKS_PID = 0
+RESOURCES_PID = 1
+
+
+def to_chrome_trace(records, task_names):
+    """
+    :param records: Decoded records, see tasko.trace.decode.
+    :param task_names: {task id: name}
+    :returns the Chrome trace JSON object
+    """
+    from apps.tasko.trace import (
+        TRACE_ACQUIRE,
+        TRACE_DONE,
+        TRACE_RELEASE,
+        TRACE_RUN,
+        TRACE_SLEEP,
+        TRACE_WAKE,
+        TRACE_YIELD,
+    )
+
+    def task_name(task_id):
+        return task_names.get(task_id, f"task {task_id}")
+
+    events = [
+        {
+            "name": "process_name",
+            "ph": "M",
+            "pid": TASKS_PID,
+            "args": {"name": "tasks"},
+        },
+        {
+            "name": "process_name",
+            "ph": "M",
+            "pid": RESOURCES_PID,
+            "args": {"name": "resources"},
+        },
+    ]
+    tasks = set()
+    resources = set()
+    # Slices begun in the trace, the ring buffer may have dropped the begin of the first ones
+    running = set()
+    holding = set()
+    start_nanos = records[0][0] if records else 0
+    for nanos, event, task_id, argument in records:
+        timestamp = (nanos - start_nanos) / 1000
+        tasks.add(task_id)
+        if event == TRACE_RUN:
+            running.add(task_id)
+            events.append(
+                {
+                    "name": task_name(task_id),
+                    "ph": "B",
+                    "ts": timestamp,
+                    "pid": TASKS_PID,
+                    "tid": task_id,
+                }
+            )
+        elif event in (TRACE_YIELD, TRACE_DONE) and task_id in running:
+            running.discard(task_id)
+            events.append(
+                {"ph": "E", "ts": timestamp, "pid": TASKS_PID, "tid": task_id}
+            )
+        elif event in (TRACE_SLEEP, TRACE_WAKE, TRACE_DONE):
+            name = {TRACE_SLEEP: "sleep", TRACE_WAKE: "wake", TRACE_DONE: "done"}
+            events.append(
+                {
+                    "name": name[event],
+                    "ph": "i",
+                    "s": "t",
+                    "ts": timestamp,
+                    "pid": TASKS_PID,
+                    "tid": task_id,
+                }
+            )
+        elif event == TRACE_ACQUIRE:
+            resources.add(argument)
+            holding.add(argument)
+            events.append(
+                {
+                    "name": task_name(task_id),
+                    "ph": "B",
+                    "ts": timestamp,
+                    "pid": RESOURCES_PID,
+                    "tid": argument,
+                }
+            )
+        elif event == TRACE_RELEASE and argument in holding:
+            holding.discard(argument)
+            events.append(
+                {"ph": "E", "ts": timestamp, "pid": RESOURCES_PID, "tid": argument}
+            )
+
+    for task_id in sorted(tasks):
+        events.append(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": TASKS_PID,
+                "tid": task_id,
+                "args": {"name": task_name(task_id)},
+            }
+        )
+    for resource in sorted(resources):
+        events.append(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": RESOURCES_PID,
+                "tid": resource,
+                "args": {"name": f"resource {resource}"},
+            }
+        )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+if __name__ == "__main__":
+
+    # Parses command line arguments.
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dump", help="Trace dump copied from the board")
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help="JSON file to write, the dump's name with a .json extension by default",
+    )
+    args = parser.parse_args()
+
+    sys.path.insert(0, FLIGHT_SOFTWARE)
+    from apps.tasko.trace import UNKNOWN_TASK, decode
+
+    with open(args.dump, "rb") as f:
+        records = decode(f.read())
+
+    task_names = {
+        task_id: name
+        for name, task_id in load_configuration(name="TASK_MAPPING_ID").items()
+    }
+    task_names.setdefault(UNKNOWN_TASK, "other")
+
+    output = args.output
+    if output is None:
+        output = args.dump.rsplit(".", 1)[0] + ".json"
+    with open(output, "w") as f:
+        json.dump(to_chrome_trace(records, task_names), f)
+    if records:
+        span = (records[-1][0] - records[0][0]) / 1e9
+    else:
+        span = 0
+    print(f"{len(records)} events over {span:.3f}s written to {output}")